@@ -2,7 +2,7 @@
 # (V1 - The Graceful Error Handler)
 
 from typing import Dict, Any
-from groq import Groq
+from core.retry_policy import call_llm
 
 class ApologyAgent:
     """
@@ -43,23 +43,12 @@ class ApologyAgent:
         เมธอดหลักที่ Dispatcher จะเรียกใช้เมื่อเกิด Error
         """
         print(f"🛡️ [Apology Agent] Handling error for query: '{original_query}'")
-        api_key = self.key_manager.get_key()
-        if not api_key:
-            return "ผมต้องขออภัยอย่างสูงครับ เกิดข้อผิดพลาดซ้ำซ้อนในระบบ"
-
         try:
-            client = Groq(api_key=api_key)
-            
             prompt = self.apology_prompt_template.format(
                 original_query=original_query,
                 error_context=error_context
             )
-            
-            chat_completion = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
-            )
-            return chat_completion.choices[0].message.content.strip()
+            return call_llm(self.key_manager, self.model_name, prompt=prompt).strip()
         except Exception as e:
             print(f"❌ ApologyAgent's own LLM Error: {e}")
             return "ผมต้องขออภัยอย่างสูงครับ ดูเหมือนว่าระบบจะขัดข้องชั่วคราว โปรดลองใหม่อีกครั้งในภายหลัง"
\ No newline at end of file
@@ -1,8 +1,9 @@
 # agents/coder_mode/code_interpreter_agent.py
-# (V2 - Upgraded for Centralized Config & Persona)
+# (V2.1 - Streamed Sandbox Output & Artifacts)
 
-from groq import Groq
+from core.retry_policy import call_llm
 from core.code_executor import CodeExecutor
+from core.request_context import report_progress
 import re
 import traceback
 from typing import List, Dict, Any, Optional
@@ -33,6 +34,7 @@ class CodeInterpreterAgent:
 - คุณมีโอกาสรันโค้ดแค่ครั้งเดียว สคริปต์ของคุณต้องสมบูรณ์และถูกต้อง
 - ผลลัพธ์ทั้งหมดต้องถูกพิมพ์ออกมาทาง stdout
 - มีไลบรารี `pandas` ให้ใช้งาน
+- ถ้าสร้างกราฟหรือไฟล์ผลลัพธ์ (เช่น .png, .csv) ให้บันทึกลงโฟลเดอร์ปัจจุบัน ระบบจะส่งไฟล์ให้ผู้ใช้เอง
 """
 
     def _extract_python_code(self, text: str) -> Optional[str]:
@@ -43,6 +45,25 @@ class CodeInterpreterAgent:
         if "```" not in text and any(kw in text for kw in ["import", "def", "print"]): return text.strip()
         return None
 
+    @staticmethod
+    def _escape_markdown(text: str) -> str:
+        # ชื่อไฟล์มาจากโค้ดที่ LLM สร้าง: Escape อักขระที่เปลี่ยนโครงสร้างลิงก์หรือกลายเป็น HTML ใน marked
+        return re.sub(r"([\\`*_\[\]()<>!&#])", r"\\\1", text)
+
+    @staticmethod
+    def _format_artifacts(artifacts: List[Dict[str, Any]]) -> str:
+        """แนบไฟล์ผลลัพธ์ท้ายคำตอบเป็น Markdown: รูปภาพแสดงในแชท ไฟล์อื่นเป็นลิงก์ดาวน์โหลด"""
+        if not artifacts:
+            return ""
+        lines = ["", "", "**ไฟล์จากการรันโค้ด:**"]
+        for artifact in artifacts:
+            name = CodeInterpreterAgent._escape_markdown(artifact["name"])
+            if artifact["name"].lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".webp")):
+                lines.append(f"![{name}]({artifact['url']})")
+            else:
+                lines.append(f"- [{name}]({artifact['url']})")
+        return "\n".join(lines)
+
     def handle(self, query: str, short_term_memory: List[Dict[str, Any]]) -> str:
         print(f"🤖 [Code Interpreter] Received query: '{query}'")
         memory_context = "\n".join([f"- {mem.get('role')}: {mem.get('content')}" for mem in short_term_memory])
@@ -59,15 +80,7 @@ class CodeInterpreterAgent:
 โปรดสร้างสคริปต์ Python ที่สมบูรณ์เพื่อจัดการกับคำขอนี้ คำตอบของคุณต้องมีเพียงโค้ดในบล็อก Markdown เท่านั้น
 """
             print("  - Step 1/3: Generating code...")
-            api_key = self.key_manager.get_key()
-            client = Groq(api_key=api_key)
-            
-            code_response = client.chat.completions.create(
-                messages=[{"role": "user", "content": code_generation_prompt}],
-                model=self.model_name,
-                temperature=0.1
-            )
-            raw_code_response = code_response.choices.message.content
+            raw_code_response = call_llm(self.key_manager, self.model_name, prompt=code_generation_prompt, temperature=0.1)
             code_to_run = self._extract_python_code(raw_code_response)
 
             if not code_to_run:
@@ -75,17 +88,23 @@ class CodeInterpreterAgent:
                 return "ขออภัยครับ ผมไม่สามารถสร้างโค้ดสำหรับคำขอนี้ได้"
 
             print(f"  - Step 2/3: Executing code...\n---\n{code_to_run}\n---")
-            output, has_error = self.code_executor.run_code_in_sandbox(code_to_run)
-            print(f"  - Execution output (Error: {has_error}):\n---\n{output}\n---")
+            execution = self.code_executor.run(code_to_run)
+            output, has_error, artifacts = execution["output"], execution["has_error"], execution["artifacts"]
+            print(f"  - Execution output (Error: {has_error}, {execution['duration']:.2f}s, truncated: {execution['truncated']}):\n---\n{output}\n---")
+            report_progress("PROCESSING", "CODER", f"รันโค้ดเสร็จใน {execution['duration']:.1f} วินาที"
+                            + (f" ได้ไฟล์ {len(artifacts)} ไฟล์" if artifacts else "") + " กำลังสรุปผล...")
+            artifact_list = "\n".join(f"- {a['name']} ({a['size']:,} bytes)" for a in artifacts) or "(ไม่มี)"
 
             summarization_prompt = f"""
 **คำขอดั้งเดิม:** "{query}"
 **โค้ดที่ถูกรัน:**
 ```python
 {code_to_run}
-ผลลัพธ์จากการรัน ({'เกิดข้อผิดพลาด' if has_error else 'สำเร็จ'}):
+ผลลัพธ์จากการรัน ({'เกิดข้อผิดพลาด' if has_error else 'สำเร็จ'}{', Output ยาวจึงถูกตัดส่วนกลางออก' if execution['truncated'] else ''}):
 {output}
 ```
+ไฟล์ที่โค้ดสร้าง (ผู้ใช้จะได้รับไฟล์เหล่านี้แนบท้ายคำตอบ):
+{artifact_list}
 ภารกิจสุดท้ายของคุณ:
 จากผลลัพธ์ข้างต้น จงให้คำตอบสุดท้ายที่เป็นมิตรและเข้าใจง่ายในภาษาไทย
 ถ้าสำเร็จ: อธิบายว่าโค้ดทำอะไรและผลลัพธ์หมายความว่าอย่างไร
@@ -93,12 +112,8 @@ class CodeInterpreterAgent:
 """
             
             print("  - Step 3/3: Summarizing result...")
-            final_response = client.chat.completions.create(
-                messages=[{"role": "user", "content": summarization_prompt}],
-                model=self.model_name,
-                temperature=0.5
-            )
-            return final_response.choices[0].message.content
+            answer = call_llm(self.key_manager, self.model_name, prompt=summarization_prompt, temperature=0.5)
+            return answer + self._format_artifacts(artifacts)
 
         except Exception as e:
             print(f"❌ An unhandled error occurred in CodeInterpreterAgent: {e}")
@@ -1,7 +1,7 @@
 # agents/coder_mode/code_agent.py
 # (V2 - Upgraded for Centralized Config & Persona)
 
-from groq import Groq
+from core.retry_policy import call_llm
 from typing import Dict, Any, List
 
 class CoderAgent:
@@ -33,18 +33,10 @@ class CoderAgent:
         memory_context = "\n".join([f"- {mem.get('role')}: {mem.get('content')}" for mem in short_term_memory])
 
         try:
-            api_key = self.key_manager.get_key()
-            client = Groq(api_key=api_key)
-            
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": f"ประวัติการสนทนาล่าสุด:\n{memory_context}\n\nคำถามของฉันคือ: {query}"}
-                ],
-                model=self.model_name,
-            )
-            
-            response_content = chat_completion.choices[0].message.content
+            response_content = call_llm(self.key_manager, self.model_name, messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": f"ประวัติการสนทนาล่าสุด:\n{memory_context}\n\nคำถามของฉันคือ: {query}"}
+            ])
             print("✅ Coder Agent completed successfully!")
             return response_content
 
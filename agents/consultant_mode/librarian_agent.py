@@ -2,7 +2,7 @@
 # (V3 - The Recommender Engine)
 
 from typing import Optional
-from groq import Groq 
+from core.retry_policy import call_llm
 
 class LibrarianAgent:
     """
@@ -73,22 +73,12 @@ class LibrarianAgent:
             if not all_titles:
                 return "ขออภัยครับ ตอนนี้ยังไม่มีข้อมูลหนังสือในระบบให้แนะนำครับ"
 
-            api_key = self.key_manager.get_key()
-            if not api_key:
-                return "ขออภัยครับ ระบบแนะนำหนังสือไม่พร้อมใช้งานชั่วคราว"
-
             try:
-                client = Groq(api_key=api_key)
                 prompt = self.recommendation_prompt_template.format(
                     query=query,
                     book_titles="\n- ".join(all_titles)
                 )
-                
-                chat_completion = client.chat.completions.create(
-                    messages=[{"role": "user", "content": prompt}],
-                    model=self.model_name,
-                )
-                return chat_completion.choices[0].message.content.strip()
+                return call_llm(self.key_manager, self.model_name, prompt=prompt).strip()
 
             except Exception as e:
                 print(f"❌ LibrarianAgent LLM Error: {e}")
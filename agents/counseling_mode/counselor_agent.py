@@ -2,7 +2,7 @@
 # (V1 - Empathic Listening First)
 
 from typing import Dict, List, Any
-import google.generativeai as genai 
+from core.retry_policy import call_llm
 
 class CounselorAgent:
     """
@@ -46,21 +46,12 @@ class CounselorAgent:
         if not history_context:
             history_context = "(ยังไม่มีประวัติการสนทนา)"
 
-        api_key = self.key_manager.get_key()
-        if not api_key:
-            return "ขออภัยครับ ตอนนี้ผมอาจจะยังไม่พร้อมที่จะรับฟังเรื่องราวที่ละเอียดอ่อนเช่นนี้"
-
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.model_name)
-            
             prompt = self.counseling_prompt_template.format(
                 history_context=history_context,
                 query=query
             )
-            
-            response = model.generate_content(prompt)
-            return response.text.strip()
+            return call_llm(self.key_manager, self.model_name, prompt=prompt).strip()
             
         except Exception as e:
             print(f"❌ CounselorAgent LLM Error: {e}")
@@ -6,7 +6,7 @@ import json
 import re
 from rapidfuzz import process, fuzz
 from typing import Optional, Dict, List, Any
-import google.generativeai as genai
+from core.retry_policy import call_llm
 from core.api_key_manager import ApiKeyManager
 
 class FengAgent:
@@ -150,14 +150,10 @@ class FengAgent:
 
     def _classify_intent_and_extract_keywords(self, query: str) -> Dict[str, Any]:
         print(f"🤔 [Feng Triage] Analyzing and extracting from query with '{self.model_name}'...")
-        api_key = self.key_manager.get_key()
         fallback_response = {"corrected_query": query, "intent": "DEEP_ANALYSIS_REQUEST", "keywords": query.split()}
-        if not api_key: return fallback_response
 
         raw_response = ""
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.model_name)
             prompt = self.intent_analysis_prompt.format(query=query)
             
             safety_settings = [
@@ -167,8 +163,7 @@ class FengAgent:
                 {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
             ]
             
-            response = model.generate_content(prompt, safety_settings=safety_settings)
-            raw_response = response.text
+            raw_response = call_llm(self.key_manager, self.model_name, prompt=prompt, safety_settings=safety_settings)
             json_response = self._extract_json(raw_response)
             
             if json_response and "corrected_query" in json_response and "intent" in json_response and "keywords" in json_response:
@@ -180,7 +175,6 @@ class FengAgent:
         except Exception as e:
             print(f"  -> Triage failed: {e}")
             print(f"  -> RAW FAILED RESPONSE FROM GEMINI: '{raw_response}'")
-            if api_key: self.key_manager.report_failure(api_key)
             return fallback_response
 
     def handle(self, query: str, short_term_memory: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -3,7 +3,7 @@
 
 import json
 from typing import Dict, List, Any
-from groq import Groq
+from core.retry_policy import call_llm
 
 class GeneralConversationAgent:
     
@@ -61,13 +61,7 @@ class GeneralConversationAgent:
                     for mem in relevant_memories
                 ])
         
-        api_key = self.key_manager.get_key()
-        if not api_key:
-            return "ขออภัยครับ ตอนนี้ผมไม่สามารถสนทนาต่อได้ในขณะนี้"
-
         try:
-            client = Groq(api_key=api_key)
-            
             intuitive_context = self._get_intuitive_context(query)
             history_context = "\n".join([f"- {mem.get('role')}: {mem.get('content')}" for mem in short_term_memory])
             
@@ -78,12 +72,7 @@ class GeneralConversationAgent:
                 query=query
             )
             
-            chat_completion = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
-            )
-            return chat_completion.choices[0].message.content.strip()
+            return call_llm(self.key_manager, self.model_name, prompt=prompt).strip()
         except Exception as e:
             print(f"❌ GeneralConversationAgent LLM Error: {e}")
-            if api_key: self.key_manager.report_failure(api_key)
             return "ขออภัยครับ เกิดข้อผิดพลาดในการสนทนา"
\ No newline at end of file
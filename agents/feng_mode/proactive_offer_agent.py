@@ -3,7 +3,7 @@
 
 import json
 from typing import Dict, Any, List
-from groq import Groq
+from core.retry_policy import call_llm
 
 class ProactiveOfferAgent:
     
@@ -61,12 +61,6 @@ class ProactiveOfferAgent:
     def handle(self, query: str) -> Dict[str, Any]:
         print(f"🤔 [Proactive Offer Agent] Handling: '{query[:40]}...'")
         try:
-            api_key = self.key_manager.get_key()
-            if not api_key:
-                raise ValueError("No available API keys for ProactiveOfferAgent.")
-
-            client = Groq(api_key=api_key)
-            
             intuitive_context = self._get_intuitive_context(query)
             
             prompt = self.proactive_offer_prompt.format(
@@ -74,10 +68,7 @@ class ProactiveOfferAgent:
                 query=query
             )
             
-            chat_completion = client.chat.com.pletions.create(
-                messages=[{"role": "user", "content": prompt}], model=self.model_name
-            )
-            proactive_answer = chat_completion.choices[0].message.content.strip()
+            proactive_answer = call_llm(self.key_manager, self.model_name, prompt=prompt).strip()
             
             return {"type": "proactive_offer", "content": proactive_answer, "original_query": query}
         except Exception as e:
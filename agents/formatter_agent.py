@@ -1,9 +1,10 @@
 # agents/formatter_agent.py
 # (V2.1 - Upgraded based on original logic)
 
-import google.generativeai as genai
 from typing import Dict, Any
 
+from core.retry_policy import call_llm
+
 class FormatterAgent:
     """
     Agent ที่ทำหน้าที่เป็น "บรรณาธิการ" และ "นักจัดรูปแบบ" (Typesetter)
@@ -52,30 +53,15 @@ class FormatterAgent:
 
         original_query = synthesis_order.get("original_query", "(ไม่ระบุ)")
 
-        print("✍️ [Formatter Agent] Requesting a key for final typesetting...")
-        api_key = self.key_manager.get_key()
-        if not api_key:
-            print("⚠️ FormatterAgent: No API keys available. Returning raw draft.")
-            return raw_draft
-
+        print("✍️ [Formatter Agent] Requesting final typesetting...")
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.model_name)
-            
             prompt = self.formatting_prompt_template.format(
                 original_query=original_query,
                 draft_to_review=raw_draft
             )
-            response = model.generate_content(prompt)
-            return response.text.strip()
+            return call_llm(self.key_manager, self.model_name, prompt=prompt).strip()
             
         except Exception as e:
-            error_str = str(e).lower()
-            if "429" in error_str:
-                print(f"🟡 Formatter Agent: Key '...{api_key[-4:]}' hit rate limit.")
-                self.key_manager.report_failure(api_key)
-                print("   -> Retrying with the next available key...")
-                return self.handle(synthesis_order)
-            else:
-                print(f"❌ An unexpected error occurred in Formatter Agent: {e}")
-                return raw_draft
\ No newline at end of file
+            # ลองซ้ำ/เปลี่ยนคีย์ภายใน call_llm แล้ว ถ้ายังไม่สำเร็จให้ส่งฉบับร่างไปแทน
+            print(f"❌ Formatter Agent could not typeset the draft, returning it as-is: {e}")
+            return raw_draft
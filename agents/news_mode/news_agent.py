@@ -1,8 +1,8 @@
 # agents/news_mode/news_agent.py
 # (V5.1 - Corrected Prompt) - (ใช้ Gemini API เท่านั้น)
 
-# ลบ import ของ Groq ออก และใช้ import ของ Gemini แทน
-import google.generativeai as genai
+from core.key_scheduler import AllKeysUnavailableError
+from core.retry_policy import LLMCallError, call_llm
 import traceback
 from typing import Dict, Any
 
@@ -77,19 +77,12 @@ class NewsAgent:
 
             thought_process["steps"].append(f"Found news context. Summarizing with Gemini model: {self.model_name}...")
             
-            api_key = self.key_manager.get_key()
-            if not api_key:
-                raise Exception("No available API keys for NewsAgent.")
-
             query_topic = query if query else "ไม่มีหัวข้อเฉพาะ"
             prompt = self.summary_prompt_template.format(
                 context_from_rag=context_from_rag,
                 query_topic=query_topic
             )
             
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.model_name)
-            
             safety_settings = [
                 {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
                 {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
@@ -97,8 +90,7 @@ class NewsAgent:
                 {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
             ]
 
-            response = model.generate_content(prompt, safety_settings=safety_settings)
-            final_answer = response.text.strip()
+            final_answer = call_llm(self.key_manager, self.model_name, prompt=prompt, safety_settings=safety_settings).strip()
 
             thought_process["steps"].append("Successfully generated news briefing from RAG context using Gemini.")
             return { "answer": final_answer, "thought_process": thought_process }
@@ -111,7 +103,7 @@ class NewsAgent:
             thought_process["error"] = error_message
             answer = "ขออภัยครับ เกิดข้อผิดพลาดระหว่างการสรุปข่าว"
 
-            if "AllKeysOnCooldownError" in e.__class__.__name__:
+            if isinstance(e, LLMCallError) and isinstance(e.last_error, AllKeysUnavailableError):
                  answer = "ขออภัยครับ โควต้า API สำหรับสรุปข่าวเต็มชั่วคราว กรุณาลองใหม่อีกครั้งในภายหลัง"
             
             return {"answer": answer, "thought_process": thought_process}
\ No newline at end of file
@@ -1,12 +1,13 @@
 # agents/planning_mode/planner_agent.py
 # (V3.1 - Centralized Config & Cleaned Prompts)
 
-import google.generativeai as genai
 import json
 import re
 import traceback
 from typing import List, Dict, Any
 
+from core.retry_policy import call_llm
+
 class PlannerAgent:
     def __init__(self, key_manager, model_name: str, rag_engine, persona_prompt: str):
         self.key_manager = key_manager
@@ -82,18 +83,8 @@ class PlannerAgent:
         raise json.JSONDecodeError("Could not find JSON object in the response.", text, 0)
 
     def _call_llm(self, prompt: str) -> str:
-        api_key = self.key_manager.get_key()
-        if not api_key: raise Exception("No available API keys.")
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            if "429" in str(e):
-                self.key_manager.report_failure(api_key)
-                return self._call_llm(prompt)
-            raise e
+        # จำนวนครั้ง, Backoff, Deadline และโมเดลสำรองจัดการโดย RetryPolicy (เดิมเรียกตัวเองซ้ำไม่จำกัดเมื่อเจอ 429)
+        return call_llm(self.key_manager, self.model_name, prompt=prompt)
 
     def handle(self, query: str, short_term_memory: List[Dict], available_categories: List[str]) -> Dict[str, Any]:
         search_logs = []
@@ -1,7 +1,7 @@
 # agents/presenter_mode/presenter_agent.py
 
 from typing import Dict, List, Any
-from groq import Groq
+from core.retry_policy import call_llm
 
 class PresenterAgent:
     """
@@ -46,24 +46,12 @@ class PresenterAgent:
         """
         print("🎬 [Presenter Agent] Generating introduction script using LLM...")
         
-        api_key = self.key_manager.get_key()
-        if not api_key:
-            return "ขออภัยค่ะ ตอนนี้ฟางซินยังไม่พร้อมจะพูดคุยในตอนนี้"
-
         try:
-            client = Groq(api_key=api_key)
-            
-            chat_completion = client.chat.completions.create(
-                messages=[{"role": "user", "content": self.presentation_prompt}],
-                model=self.model_name,
-                temperature=0.7 # เพิ่มความสร้างสรรค์เล็กน้อย
-            )
-            
-            response = chat_completion.choices[0].message.content.strip()
+            response = call_llm(self.key_manager, self.model_name, prompt=self.presentation_prompt,
+                                temperature=0.7).strip() # เพิ่มความสร้างสรรค์เล็กน้อย
             print("✅ [Presenter Agent] Introduction script generated successfully.")
             return response
             
         except Exception as e:
             print(f"❌ PresenterAgent LLM Error: {e}")
-            if api_key: self.key_manager.report_failure(api_key)
             return "ขออภัยค่ะ เกิดข้อผิดพลาดบางอย่าง ทำให้ฟางซินยังแนะนำตัวไม่ได้ในตอนนี้"
\ No newline at end of file
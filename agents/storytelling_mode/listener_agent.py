@@ -2,7 +2,7 @@
 # (V1 - The Active Listener)
 
 from typing import Dict, List, Any
-from groq import Groq
+from core.retry_policy import call_llm
 import random
 
 class ListenerAgent:
@@ -52,24 +52,12 @@ class ListenerAgent:
         if not history_context:
             history_context = "(ยังไม่มีประวัติการสนทนา)"
 
-        api_key = self.key_manager.get_key()
-        if not api_key:
-            return random.choice(["ครับ", "อืม...", "ครับผม"])
-
         try:
-            client = Groq(api_key=api_key)
-            
             prompt = self.listening_prompt_template.format(
                 history_context=history_context,
                 query=query
             )
-            
-            chat_completion = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
-                temperature=0.5
-            )
-            return chat_completion.choices[0].message.content.strip()
+            return call_llm(self.key_manager, self.model_name, prompt=prompt, temperature=0.5).strip()
             
         except Exception as e:
             print(f"❌ ListenerAgent LLM Error: {e}")
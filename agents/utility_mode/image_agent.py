@@ -5,7 +5,7 @@ import requests
 import re
 import json
 from typing import Optional, Dict
-from groq import Groq
+from core.retry_policy import call_llm
 
 class ImageAgent:
     """
@@ -47,17 +47,7 @@ class ImageAgent:
 **ผลลัพธ์:**
 """
         try:
-            api_key = self.groq_key_manager.get_key()
-            if not api_key:
-                raise Exception("No available Groq API keys.")
-
-            client = Groq(api_key=api_key)
-            chat_completion = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
-                temperature=0.1
-            )
-            search_term = chat_completion.choices[0].message.content.strip().replace('"', '')
+            search_term = call_llm(self.groq_key_manager, self.model_name, prompt=prompt, temperature=0.1).strip().replace('"', '')
             
             if not search_term:
                 print("  - ⚠️ LLM returned an empty search term.")
@@ -0,0 +1,2 @@
+# conftest.py
+# ให้ pytest เพิ่มโฟลเดอร์โปรเจกต์เข้า sys.path (import core.* ได้จาก tests/ โดยไม่ต้องติดตั้งแพ็กเกจ)
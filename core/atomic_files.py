@@ -0,0 +1,50 @@
+# core/atomic_files.py
+# (V1.0 - Journaled Multi-File Commit)
+# สลับชุดไฟล์ของ Index (FAISS + Mapping + ...) แบบ All-or-nothing ด้วย Journal และ Roll-forward หลัง Crash
+# ใช้ร่วมกันระหว่าง Book Index (manage_data.py) และ News Shards (core/news_store.py)
+
+import json
+import os
+from typing import Dict, Optional
+
+COMMIT_JOURNAL_FILENAME = "_commit.json"
+TMP_SUFFIX = ".tmp"
+
+
+def apply_commit_journal(folder: str) -> bool:
+    """
+    ทำ Commit ที่ค้างอยู่ให้เสร็จ (Roll-forward) ถ้ามี Journal เหลืออยู่จากการ Crash
+    คืนค่า True ถ้ามีการกู้คืน
+    """
+    journal_path = os.path.join(folder, COMMIT_JOURNAL_FILENAME)
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path, "r", encoding="utf-8") as f:
+        replacements = json.load(f)
+    for final_name, tmp_name in replacements.items():
+        final_path = os.path.join(folder, final_name)
+        if tmp_name is None:
+            # None = ไฟล์นี้ล้าสมัยแล้ว ให้ลบทิ้งพร้อมกับ Commit นี้
+            if os.path.exists(final_path):
+                os.remove(final_path)
+            continue
+        tmp_path = os.path.join(folder, tmp_name)
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, final_path)
+    os.remove(journal_path)
+    return True
+
+
+def commit_files_atomically(folder: str, replacements: Dict[str, Optional[str]]):
+    """
+    สลับไฟล์ชั่วคราวหลายไฟล์เข้าแทนที่ไฟล์จริงแบบ All-or-nothing (tmp เป็น None = ลบไฟล์จริงทิ้ง)
+    จุด Commit คือการเขียน Journal (os.replace เป็น Atomic) หลังจากนั้นถ้า Crash
+    ครั้งถัดไปที่เรียก apply_commit_journal (ตอนเปิด Store) จะทำต่อจนครบทุกไฟล์
+    """
+    journal_path = os.path.join(folder, COMMIT_JOURNAL_FILENAME)
+    with open(journal_path + TMP_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(replacements, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(journal_path + TMP_SUFFIX, journal_path)
+    apply_commit_journal(folder)
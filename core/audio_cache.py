@@ -0,0 +1,145 @@
+# core/audio_cache.py
+# (V1.0 - Content-Addressed TTS Audio Cache with LRU Eviction)
+# ไฟล์เสียงตั้งชื่อด้วย Hash ของ (เสียงพูด/Backend + ข้อความที่ทำความสะอาดแล้ว): ข้อความเดิม = ไฟล์เดิม
+# - คำตอบสำเร็จรูป (QUICK_RESPONSES), คำทักทาย และวลีที่ซ้ำกันไม่ต้องสังเคราะห์ใหม่
+# - เนื้อหาของไฟล์ไม่เปลี่ยนตามชื่อ จึงให้ Browser Cache ได้ตลอด (Cache-Control: immutable)
+# - จำกัดขนาดรวมของโฟลเดอร์ (TTS_CACHE_MAX_MB): เกินแล้วลบไฟล์ที่ไม่ได้ใช้นานที่สุดก่อน (LRU)
+#   ทำตอนเขียนไฟล์ใหม่เท่านั้น ไม่มี Service วนสแกนโฟลเดอร์
+# ลำดับ LRU ถูกเก็บใน mtime ของไฟล์ (แตะไฟล์ทุกครั้งที่ใช้) จึงคงอยู่ข้ามการรีสตาร์ท
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from core.config import settings
+
+# <hash 32 ตัว>.<นามสกุล>: ใช้ตรวจชื่อไฟล์ที่ Client ขอ (กัน Path traversal) และแยกไฟล์ของ Cache ออกจากไฟล์อื่น
+CACHE_FILENAME = re.compile(r'^[0-9a-f]{32}\.[a-z0-9]{2,5}$')
+
+
+def cache_filename(voice: str, text: str, audio_format: str) -> str:
+    digest = hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()[:32]
+    return f"{digest}.{audio_format}"
+
+
+class AudioCache:
+    """
+    Cache ไฟล์เสียงในโฟลเดอร์เดียว ใช้ได้จากหลาย Thread พร้อมกัน (Thread ของ TTS เขียน, Event loop อ่าน)
+    """
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes if max_bytes is not None else settings.TTS_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict() # ชื่อไฟล์ -> ขนาด (เก่า -> ใหม่)
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """อ่านไฟล์ที่มีอยู่แล้วเรียงตามเวลาใช้งานล่าสุด และลบไฟล์ที่ไม่ใช่ของ Cache (ไฟล์ชั่วคราว/ชื่อแบบเดิม)"""
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if CACHE_FILENAME.match(entry.name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+            elif entry.name.endswith((".mp3", ".wav", ".tmp")):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+        print(f"🗄️  [AudioCache] {len(self._entries)} file(s), {self._total_bytes / 1024 / 1024:.1f} MB in {self.directory}")
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _touch(self, name: str):
+        self._entries.move_to_end(name)
+        try:
+            os.utime(self.path(name))
+        except OSError:
+            pass
+
+    def lookup(self, name: str) -> Optional[str]:
+        """คืน Path ถ้ามีไฟล์ใน Cache (และนับเป็นการใช้งานล่าสุด) ไม่มีคืน None"""
+        with self._lock:
+            if name in self._entries and os.path.exists(self.path(name)):
+                self._touch(name)
+                self.hits += 1
+                return self.path(name)
+            self._forget(name)
+            self.misses += 1
+            return None
+
+    def read(self, name: str) -> Optional[bytes]:
+        """อ่านเนื้อหาไฟล์ใน Cache (ภายใต้ Lock จึงไม่ถูกลบระหว่างอ่าน)"""
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self.path(name), "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._forget(name)
+                self.misses += 1
+                return None
+            self._touch(name)
+            self.hits += 1
+            return data
+
+    def put(self, name: str, data: bytes) -> str:
+        """เขียนไฟล์แบบ Atomic (เขียนไฟล์ชั่วคราวแล้ว rename) แล้วลบไฟล์เก่าจนขนาดรวมไม่เกินกำหนด"""
+        path = self.path(name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._forget(name)
+            self._entries[name] = len(data)
+            self._total_bytes += len(data)
+            self._evict(keep=name)
+        return path
+
+    def _forget(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self, keep: Optional[str] = None):
+        while self._total_bytes > self.max_bytes and self._entries:
+            name = next(iter(self._entries))
+            if name == keep:
+                break
+            self._forget(name)
+            self.evictions += 1
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._entries),
+                "size_mb": round(self._total_bytes / 1024 / 1024, 2),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
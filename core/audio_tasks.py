@@ -0,0 +1,162 @@
+# core/audio_tasks.py
+# (V1.0 - Push-based Audio Task Registry with TTL)
+# งานสร้างเสียงของแต่ละคำตอบ: Client ไม่ต้อง Poll อีกต่อไป เซิร์ฟเวอร์ส่ง Event ให้เองเมื่อเสียงพร้อม
+# - audio_segment: ท่อนเสียงพร้อมเล่น (ตามลำดับ), audio_ready: สังเคราะห์ครบแล้ว, audio_failed: ล้มเหลว
+# - ผู้รับ (Listener) คือ Coroutine ที่รับ Event หนึ่งตัว เช่น send_json ของ WebSocket หรือ Queue ของ SSE
+#   สมัครเมื่อไหร่ก็ได้: ได้ Event ที่เกิดไปแล้วย้อนหลังก่อน (ไม่พลาด Event ของเสียงที่มาจาก Cache ทันที)
+#   และ Event ของผู้รับแต่ละรายถูกส่งตามลำดับเสมอ
+# - รองรับ Long-poll: wait() รอจนมีท่อนใหม่/งานจบหรือหมดเวลา
+# - งานถูกลบเมื่ออายุเกิน AUDIO_TASK_TTL_SECONDS (ตรวจตอนสร้างงานใหม่) งานที่ไม่มีใครมารับจึงไม่ค้างในหน่วยความจำ
+# ใช้จาก Event loop เท่านั้น: Thread ของ TTS ส่งผลเข้ามาด้วย loop.call_soon_threadsafe
+
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from core.config import settings
+
+Listener = Callable[[dict], Awaitable[None]]
+
+
+class AudioTask:
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.status = "processing"
+        self.segments: List[str] = []
+        self.total_segments: Optional[int] = None
+        self.url: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.changed = asyncio.Event()
+        # ผู้รับ -> Future ของการส่ง Event ล่าสุด (Event ถัดไปรอตัวก่อนหน้าเสร็จ เพื่อรักษาลำดับ)
+        self.listeners: Dict[Listener, Optional[asyncio.Future]] = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        data = {"task_id": self.task_id, "status": self.status, "segments": list(self.segments),
+                "total_segments": self.total_segments}
+        if self.url:
+            data["url"] = self.url
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class AudioTaskRegistry:
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = settings.AUDIO_TASK_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._tasks: Dict[str, AudioTask] = {}
+        self.expired_count = 0
+        self.pushed_events = 0
+
+    def create(self, user_id: str) -> str:
+        self._purge()
+        task_id = f"response_{user_id}_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
+        self._tasks[task_id] = AudioTask(task_id)
+        return task_id
+
+    def get(self, task_id: str) -> Optional[AudioTask]:
+        return self._tasks.get(task_id)
+
+    def _purge(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [task_id for task_id, task in self._tasks.items() if task.created_at < cutoff]
+        for task_id in expired:
+            del self._tasks[task_id]
+        self.expired_count += len(expired)
+
+    # --- ผลจากการสังเคราะห์ ---
+    def add_segment(self, task_id: str, url: str, total: int):
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return
+        task.segments.append(url)
+        task.total_segments = total
+        self._publish(task, self._segment_event(task, len(task.segments) - 1))
+
+    def finish(self, task_id: str, url: str):
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return
+        task.status, task.url, task.total_segments = "done", url, len(task.segments)
+        self._publish(task, {"type": "audio_ready", "payload": task.to_dict()})
+
+    def fail(self, task_id: str, error: str):
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return
+        task.status, task.error = "failed", error
+        self._publish(task, {"type": "audio_failed", "payload": task.to_dict()})
+
+    @staticmethod
+    def _segment_event(task: AudioTask, index: int) -> dict:
+        return {"type": "audio_segment", "payload": {"task_id": task.task_id, "index": index,
+                                                     "url": task.segments[index], "total_segments": task.total_segments}}
+
+    def _publish(self, task: AudioTask, event: dict):
+        # ปลุกผู้รอแบบ Long-poll แล้วเปลี่ยน Event ใหม่สำหรับรอบถัดไป
+        task.changed.set()
+        task.changed = asyncio.Event()
+        for listener in list(task.listeners):
+            self._deliver(task, listener, event)
+
+    def _deliver(self, task: AudioTask, listener: Listener, event: dict):
+        previous = task.listeners.get(listener)
+
+        async def send():
+            if previous is not None:
+                await previous
+            try:
+                await listener(event)
+                self.pushed_events += 1
+            except Exception:
+                # ผู้รับปิดไปแล้ว (เช่น WebSocket หลุด): เลิกส่งให้รายนี้
+                task.listeners.pop(listener, None)
+
+        task.listeners[listener] = asyncio.ensure_future(send())
+
+    # --- ผู้รับ ---
+    def subscribe(self, task_id: str, listener: Listener) -> bool:
+        """สมัครรับ Event ของงาน (ส่ง Event ที่เกิดไปแล้วให้ก่อน) คืน False ถ้าไม่มีงานนี้"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return False
+        task.listeners.setdefault(listener, None)
+        for index in range(len(task.segments)):
+            self._deliver(task, listener, self._segment_event(task, index))
+        if task.status == "done":
+            self._deliver(task, listener, {"type": "audio_ready", "payload": task.to_dict()})
+        elif task.status == "failed":
+            self._deliver(task, listener, {"type": "audio_failed", "payload": task.to_dict()})
+        return True
+
+    def unsubscribe(self, task_id: str, listener: Listener):
+        task = self._tasks.get(task_id)
+        if task is not None:
+            task.listeners.pop(listener, None)
+
+    async def wait(self, task_id: str, since: int, timeout: float) -> Optional[AudioTask]:
+        """Long-poll: รอจนมีท่อนมากกว่า since ท่อน, งานจบ หรือครบ timeout วินาที"""
+        task = self._tasks.get(task_id)
+        if task is not None and not task.finished and len(task.segments) <= since and timeout > 0:
+            try:
+                await asyncio.wait_for(task.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._tasks.get(task_id)
+
+    def metrics(self) -> dict:
+        statuses = [task.status for task in self._tasks.values()]
+        return {
+            "tasks": len(statuses),
+            "processing": statuses.count("processing"),
+            "done": statuses.count("done"),
+            "failed": statuses.count("failed"),
+            "listeners": sum(len(task.listeners) for task in self._tasks.values()),
+            "expired_tasks": self.expired_count,
+            "pushed_events": self.pushed_events,
+        }
@@ -0,0 +1,89 @@
+# core/batching.py
+# (V1.0 - Length-Bucketed, Token-Budgeted Batching)
+# จัด Batch ให้ข้อความที่ยาวใกล้กันอยู่ด้วยกัน และจำกัด "จำนวน Token หลัง Padding" ต่อ Batch
+# ใช้กับทั้ง Embedder (SentenceTransformer) และ Reranker (CrossEncoder) ทั้งตอน Query และตอน Build
+
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import settings
+
+CHARS_PER_TOKEN_ESTIMATE = 3
+
+
+def model_max_length(model, default: int = 512) -> int:
+    return int(getattr(model, "max_seq_length", None) or getattr(model, "max_length", None) or default)
+
+
+def token_lengths(tokenizer, texts: Sequence[str], text_pairs: Optional[Sequence[str]] = None,
+                  max_length: int = 512) -> List[int]:
+    """
+    นับจำนวน Token (รวม Special Tokens, ตัดที่ max_length) ของแต่ละข้อความหรือแต่ละคู่
+    ถ้าไม่มี Tokenizer จะประมาณจากจำนวนตัวอักษรแทน
+    """
+    if tokenizer is None:
+        pairs = text_pairs or [""] * len(texts)
+        return [min(max_length, (len(a) + len(b)) // CHARS_PER_TOKEN_ESTIMATE + 2) for a, b in zip(texts, pairs)]
+    encoded = tokenizer(list(texts), list(text_pairs) if text_pairs is not None else None,
+                        add_special_tokens=True, truncation=True, max_length=max_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def plan_batches(lengths: Sequence[int], max_tokens: Optional[int] = None,
+                 max_batch_size: Optional[int] = None) -> List[List[int]]:
+    """
+    เรียง index ตามความยาว แล้วรวมเป็น Batch ที่ (จำนวนข้อความ x ความยาวที่ยาวที่สุดใน Batch) <= max_tokens
+    คืนค่า list ของ index เดิม เพื่อใช้ประกอบผลลัพธ์กลับตามลำดับเดิม
+    """
+    max_tokens = max_tokens or settings.INFERENCE_BATCH_TOKEN_BUDGET
+    max_batch_size = max_batch_size or settings.INFERENCE_MAX_BATCH_SIZE
+    batches, current = [], []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # เรียงจากสั้นไปยาว: ตัวที่กำลังเพิ่มคือตัวที่ยาวที่สุดใน Batch เสมอ
+        if current and (len(current) >= max_batch_size or (len(current) + 1) * lengths[i] > max_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def run_batched(fn: Callable[[List], np.ndarray], items: Sequence, lengths: Sequence[int],
+                max_tokens: Optional[int] = None, max_batch_size: Optional[int] = None) -> np.ndarray:
+    """เรียก fn ทีละ Batch ตามแผนของ plan_batches แล้วคืนผลลัพธ์ตามลำดับของ items เดิม"""
+    output = None
+    for idx in plan_batches(lengths, max_tokens, max_batch_size):
+        result = np.asarray(fn([items[i] for i in idx]))
+        if output is None:
+            output = np.empty((len(items),) + result.shape[1:], dtype=result.dtype)
+        output[idx] = result
+    return output if output is not None else np.zeros((0,), dtype="float32")
+
+
+def encode_texts(model, texts: Sequence[str], max_tokens: Optional[int] = None,
+                 max_batch_size: Optional[int] = None, **encode_kwargs) -> np.ndarray:
+    """แทน model.encode(texts) ด้วยการจัด Batch ตาม Token Budget (SentenceTransformer)"""
+    if getattr(model, "schedules_batches", False):
+        return model.encode(texts, **encode_kwargs)
+    lengths = token_lengths(getattr(model, "tokenizer", None), texts, max_length=model_max_length(model))
+    encode_kwargs.setdefault("show_progress_bar", False)
+    return run_batched(
+        lambda batch: model.encode(batch, batch_size=len(batch), convert_to_numpy=True, **encode_kwargs),
+        texts, lengths, max_tokens, max_batch_size
+    )
+
+
+def predict_pairs(cross_encoder, pairs: Sequence[Tuple[str, str]], max_tokens: Optional[int] = None,
+                  max_batch_size: Optional[int] = None, **predict_kwargs) -> np.ndarray:
+    """แทน cross_encoder.predict(pairs) ด้วยการจัด Batch ตาม Token Budget (CrossEncoder)"""
+    if getattr(cross_encoder, "schedules_batches", False):
+        return cross_encoder.predict(pairs, **predict_kwargs)
+    lengths = token_lengths(getattr(cross_encoder, "tokenizer", None), [p[0] for p in pairs],
+                            [p[1] for p in pairs], max_length=model_max_length(cross_encoder))
+    predict_kwargs.setdefault("show_progress_bar", False)
+    return run_batched(
+        lambda batch: cross_encoder.predict(batch, batch_size=len(batch), convert_to_numpy=True, **predict_kwargs),
+        pairs, lengths, max_tokens, max_batch_size
+    )
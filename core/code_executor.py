@@ -1,53 +1,428 @@
-# core/code_executor.py (เวอร์ชันไม่ใช้ Docker)
+# core/code_executor.py
+# (V2.1 - Warm Sandbox Pool with Streamed Output & Artifacts)
+# รันโค้ดของ CodeInterpreterAgent ในโปรเซสแยก (ไม่ใช้ Docker)
+# - POSIX: SandboxPool ถือ Worker ที่ Import ไลบรารีไว้แล้ว (core/sandbox_worker.py) แต่ละงาน fork จาก Worker
+#   จึงไม่ต้องเสียเวลาเปิด Interpreter + import pandas ใหม่ทุกครั้ง (เดิมมากกว่า 1 วินาทีต่อคำขอ)
+# - ทุกงานมีโฟลเดอร์ของตัวเองใน sandbox_workspace/ (เดิมใช้ temp_script.py ไฟล์เดียว งานที่รันพร้อมกันจึงเขียนทับกัน)
+# - จำกัด CPU time, หน่วยความจำ และขนาดไฟล์ด้วย rlimit, Worker ถูกสร้างใหม่หลังรันครบ SANDBOX_MAX_JOBS_PER_WORKER งานหรือเมื่อ Crash
+# - Output ถูกอ่านแบบ Streaming ระหว่างรัน (ส่งเป็น Progress ให้ Client) และเก็บไว้แค่ส่วนต้น+ส่วนท้าย (SANDBOX_OUTPUT_MAX_BYTES)
+#   สคริปต์ที่ print หลายเมกะไบต์จึงไม่กิน RAM และไม่ทำให้ Prompt สรุปผลใหญ่เกิน
+# - ไฟล์ที่โค้ดสร้าง (กราฟ, CSV, ...) ถูกคัดลอกไปที่ web/static/artifacts/ และคืนเป็น URL
+# - Windows (ไม่มี fork/rlimit): ใช้ Subprocess ใหม่ต่องานแบบเดิม แต่แยกโฟลเดอร์ต่องานแล้ว
 
-import subprocess
+import json
 import os
+import queue
+import select
+import shutil
+import signal
+import subprocess
 import sys
-from typing import Tuple
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from core.config import settings
+from core.request_context import check_cancelled, current_context, report_progress
+from core.sandbox_worker import SCRIPT_FILENAME
 
 # กำหนด Path ไปยังห้องทดลองของเรา
 SANDBOX_DIR = os.path.join(os.getcwd(), "sandbox_workspace")
 os.makedirs(SANDBOX_DIR, exist_ok=True)
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACT_DIR = os.path.join(PROJECT_ROOT, "web", "static", "artifacts")
+ARTIFACT_URL_PREFIX = "/static/artifacts"
+WORKER_SCRIPT = os.path.join(PROJECT_ROOT, "core", "sandbox_worker.py")
+# ตัวแปร Environment ที่ส่งต่อให้ Sandbox ได้ (ที่เหลือ เช่น API Key ถูกตัดทิ้ง)
+SAFE_ENV_KEYS = ("PATH", "LANG", "LC_ALL", "TZ", "SYSTEMROOT", "TEMP", "TMP")
+OUTPUT_POLL_SECONDS = 0.25
+
+
+def _sandbox_env() -> Dict[str, str]:
+    env = {key: os.environ[key] for key in SAFE_ENV_KEYS if key in os.environ}
+    env["PYTHONIOENCODING"] = "utf-8"
+    env["PYTHONUNBUFFERED"] = "1"
+    env["HOME"] = SANDBOX_DIR
+    return env
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def truncate_middle(text: str, max_chars: int) -> str:
+    """ตัดส่วนกลางของข้อความยาวออก เก็บส่วนต้นและส่วนท้ายไว้ (ข้อผิดพลาดมักอยู่ท้าย Output)"""
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n... [ตัดออก {len(text) - 2 * half:,} ตัวอักษร] ...\n{text[-half:]}"
+
+
+class OutputCapture:
+    """
+    อ่านไฟล์ Output ที่โปรเซสกำลังเขียนอยู่ทีละส่วน (poll) เก็บไว้แค่ head_bytes แรกกับ tail_bytes สุดท้าย
+    หน่วยความจำจึงคงที่ไม่ว่าสคริปต์จะ print มากแค่ไหน
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.head_bytes = max_bytes // 2
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.last_line = ""
+        self._offset = 0
+
+    def poll(self) -> bool:
+        """อ่านส่วนที่เพิ่มมาตั้งแต่ครั้งก่อน คืน True ถ้ามี Output ใหม่"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                new = False
+                while chunk := f.read(64 * 1024):
+                    self._feed(chunk)
+                    new = True
+                self._offset = f.tell()
+                return new
+        except FileNotFoundError:
+            return False
+
+    def _feed(self, chunk: bytes):
+        self.total += len(chunk)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self.tail += chunk
+            del self.tail[:-self.tail_bytes]
+        lines = (self.tail or self.head).rstrip(b"\n").rsplit(b"\n", 1)
+        self.last_line = lines[-1].decode("utf-8", errors="replace").strip()
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + len(self.tail)
+
+    def text(self) -> str:
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if not self.truncated:
+            return head + tail
+        return f"{head}\n... [ตัดออก {self.total - len(self.head) - len(self.tail):,} ไบต์] ...\n{tail}"
+
+
+class _SandboxWorker:
+    def __init__(self, preload: str):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_SCRIPT, preload],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=SANDBOX_DIR, env=_sandbox_env(),
+        )
+        self.jobs = 0
+        self._buffer = b""
+        hello = self._read_line(settings.SANDBOX_WORKER_START_TIMEOUT_SECONDS)
+        if not hello or not hello.get("ready"):
+            self.kill()
+            raise RuntimeError("Sandbox worker failed to start.")
+        self.preloaded = hello.get("preloaded", [])
+
+    def _read_line(self, timeout: float) -> Optional[dict]:
+        """อ่านข้อความ JSON หนึ่งบรรทัดจาก Worker (None = หมดเวลาหรือ Worker ปิด pipe)
+        อ่านจาก fd ตรงๆ: ถ้าใช้ readline() ของ TextIO บรรทัดที่สองอาจค้างใน Buffer ขณะที่ select() บอกว่าไม่มีข้อมูล"""
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return json.loads(line)
+
+    def run(self, job: dict, on_tick: Optional[Callable[[], bool]] = None) -> Optional[dict]:
+        """
+        ส่งงานแล้วรอผล (None = Worker ตาย/ไม่ตอบ)
+        ระหว่างรอเรียก on_tick() ทุก OUTPUT_POLL_SECONDS ถ้าคืน True (เช่น Request ถูกยกเลิก) จะฆ่างานนั้นทิ้ง
+        """
+        self.jobs += 1
+        try:
+            self.process.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+            self.process.stdin.flush()
+            started = self._read_line(settings.SANDBOX_WORKER_START_TIMEOUT_SECONDS)
+            if not started or "started" not in started:
+                return started if started and "returncode" in started else None
+            # Worker บังคับ Timeout ของงานเองอยู่แล้ว เผื่อเวลาไว้เฉพาะกรณี Worker ค้าง
+            deadline = time.monotonic() + job["timeout"] + 5.0
+            while True:
+                result = self._read_line(min(OUTPUT_POLL_SECONDS, max(deadline - time.monotonic(), 0.0)))
+                if result is not None:
+                    return result
+                if time.monotonic() >= deadline or not self.alive:
+                    return None
+                if on_tick and on_tick():
+                    _kill_group(started["started"])
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class SandboxPool:
+    """Worker ที่อุ่นเครื่องไว้ SANDBOX_POOL_SIZE ตัว แต่ละตัวรับงานทีละงาน"""
+    def __init__(self, size: Optional[int] = None, max_jobs_per_worker: Optional[int] = None, preload: Optional[str] = None):
+        self.size = size or settings.SANDBOX_POOL_SIZE
+        self.max_jobs_per_worker = max_jobs_per_worker or settings.SANDBOX_MAX_JOBS_PER_WORKER
+        self.preload = settings.SANDBOX_PRELOAD_MODULES if preload is None else preload
+        self._idle: "queue.Queue[_SandboxWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {"jobs": 0, "timeouts": 0, "crashes": 0, "recycled": 0, "spawn_failures": 0}
+        for _ in range(self.size):
+            self._spawn_async()
+
+    @staticmethod
+    def supported() -> bool:
+        return os.name == "posix" and hasattr(os, "fork")
+
+    def _spawn_async(self):
+        """สร้าง Worker ใหม่เบื้องหลัง (Import pandas ใช้เวลา ไม่ให้บล็อกคำขอที่กำลังรอ)"""
+        def spawn():
+            try:
+                worker = _SandboxWorker(self.preload)
+            except Exception as e:
+                with self._lock:
+                    self._stats["spawn_failures"] += 1
+                print(f"❌ [Sandbox] Could not start worker: {e}")
+                return
+            if self._closed:
+                worker.kill()
+                return
+            self._idle.put(worker)
+        threading.Thread(target=spawn, name="sandbox-spawn", daemon=True).start()
+
+    def run(self, job: dict, on_tick: Optional[Callable[[], bool]] = None) -> Optional[dict]:
+        while True:
+            try:
+                worker = self._idle.get(timeout=settings.SANDBOX_WORKER_START_TIMEOUT_SECONDS)
+            except queue.Empty:
+                raise RuntimeError("No sandbox worker became available.")
+            if worker.alive:
+                break
+            # Worker ตายระหว่างรอ (เช่นถูก OOM killer): แทนที่แล้วใช้ตัวถัดไป
+            with self._lock:
+                self._stats["crashes"] += 1
+            worker.kill()
+            self._spawn_async()
+        result = worker.run(job, on_tick)
+        with self._lock:
+            self._stats["jobs"] += 1
+            if result and result.get("timed_out"):
+                self._stats["timeouts"] += 1
+            if result is None:
+                self._stats["crashes"] += 1
+            elif worker.jobs >= self.max_jobs_per_worker:
+                self._stats["recycled"] += 1
+        if result is None or not worker.alive or worker.jobs >= self.max_jobs_per_worker:
+            worker.kill()
+            if not self._closed:
+                self._spawn_async()
+        else:
+            self._idle.put(worker)
+        return result
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pool_size=self.size, idle_workers=self._idle.qsize())
+
+
 class CodeExecutor:
-    def __init__(self):
-        print("🔬 ห้องทดลอง Sandbox พร้อมสำหรับการรันโค้ด (โหมด: Subprocess)")
+    def __init__(self, use_pool: Optional[bool] = None):
+        use_pool = settings.SANDBOX_POOL_ENABLED if use_pool is None else use_pool
+        self.pool = SandboxPool() if use_pool and SandboxPool.supported() else None
+        mode = f"Warm pool x{self.pool.size}" if self.pool else "Subprocess"
+        print(f"🔬 ห้องทดลอง Sandbox พร้อมสำหรับการรันโค้ด (โหมด: {mode})")
 
     def run_code_in_sandbox(self, code: str) -> Tuple[str, bool]:
         """
-        รันโค้ด Python ในโปรเซสลูกที่ถูกจำกัดสิทธิ์
+        รันโค้ด Python ในโปรเซสลูกที่ถูกจำกัดสิทธิ์ คืน (stdout, False) เมื่อสำเร็จ หรือ (stderr/ข้อความ Error, True)
+        """
+        result = self.run(code)
+        return result["output"], result["has_error"]
+
+    def run(self, code: str) -> Dict[str, Any]:
+        """
+        รันโค้ดแล้วคืน dict: output (ข้อความสำหรับสรุปผล ขนาดไม่เกิน SANDBOX_OUTPUT_MAX_BYTES), has_error,
+        stdout, stderr, truncated, artifacts ([{name, url, size}]) และ duration
+        ระหว่างรันส่ง Output ล่าสุดเป็น Progress ('EXECUTING') ให้ Client และหยุดงานทันทีถ้า Request ถูกยกเลิก
         """
-        # สร้างไฟล์ Python ชั่วคราวใน sandbox
-        temp_script_path = os.path.join(SANDBOX_DIR, "temp_script.py")
-        
+        timeout = settings.SANDBOX_TIMEOUT_SECONDS
+        context = current_context()
+        if context is not None and context.remaining() is not None:
+            timeout = max(1.0, min(timeout, context.remaining()))
+
+        job_dir = tempfile.mkdtemp(prefix="job_", dir=SANDBOX_DIR)
+        work_dir = os.path.join(job_dir, "work")
+        os.makedirs(work_dir)
+        stdout = OutputCapture(os.path.join(job_dir, "stdout.log"), settings.SANDBOX_OUTPUT_MAX_BYTES)
+        stderr = OutputCapture(os.path.join(job_dir, "stderr.log"), settings.SANDBOX_OUTPUT_MAX_BYTES)
+        started = time.monotonic()
+        last_report = [started]
+
+        def on_tick() -> bool:
+            """เรียกทุก OUTPUT_POLL_SECONDS ระหว่างรอ: อ่าน Output ใหม่, ส่ง Progress แบบจำกัดความถี่, คืน True ถ้าต้องหยุดงาน"""
+            stderr.poll()
+            if stdout.poll() and time.monotonic() - last_report[0] >= settings.SANDBOX_PROGRESS_INTERVAL_SECONDS:
+                last_report[0] = time.monotonic()
+                report_progress("EXECUTING", "CODER", f"รันโค้ดมาแล้ว {last_report[0] - started:.0f} วินาที: {stdout.last_line[:200]}",
+                                output_bytes=stdout.total)
+            return context is not None and context.cancelled
+
         try:
-            with open(temp_script_path, "w", encoding="utf-8") as f:
+            with open(os.path.join(work_dir, SCRIPT_FILENAME), "w", encoding="utf-8") as f:
                 f.write(code)
-            command = [sys.executable, temp_script_path]
-            
-            # --- รันโค้ดด้วย subprocess ---
-            # timeout=30: จำกัดเวลาทำงาน 30 วินาที
-            # cwd=SANDBOX_DIR: จำกัดให้โปรเซสทำงานอยู่ในโฟลเดอร์ sandbox เท่านั้น
-            # text=True, capture_output=True: เพื่อดักจับผลลัพธ์
-            result = subprocess.run(
-                command,
-                timeout=30,
-                cwd=SANDBOX_DIR,
-                text=True,
-                capture_output=True,
-                # **หมายเหตุ:** การจำกัดสิทธิ์ user และ network บน Windows
-                # จะต้องใช้เทคนิคขั้นสูงเพิ่มเติม แต่ cwd เป็นการป้องกันที่ดีในระดับแรก
-            )
-            
-            if result.returncode != 0:
-                return result.stderr, True
-            else:
-                return result.stdout, False
-
-        except subprocess.TimeoutExpired:
-            return "Execution timed out after 30 seconds.", True
+            job = {
+                "id": os.path.basename(job_dir), "cwd": work_dir, "timeout": timeout,
+                "stdout_path": stdout.path, "stderr_path": stderr.path,
+                "cpu_seconds": settings.SANDBOX_CPU_SECONDS, "memory_mb": settings.SANDBOX_MEMORY_LIMIT_MB,
+                "max_file_bytes": settings.SANDBOX_MAX_FILE_MB * 1024 * 1024,
+            }
+            status = self.pool.run(job, on_tick) if self.pool else self._run_in_subprocess(job, on_tick)
+            stdout.poll(); stderr.poll()
+            check_cancelled()
+            error = self._describe_failure(status, timeout)
+            artifacts = self._collect_artifacts(work_dir, job["id"]) if status else []
         except Exception as e:
-            return f"An unexpected error occurred during execution: {str(e)}", True
+            status, error, artifacts = None, f"An unexpected error occurred during execution: {str(e)}", []
         finally:
-            if os.path.exists(temp_script_path):
-                os.remove(temp_script_path)
\ No newline at end of file
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+        out_text, err_text = stdout.text(), stderr.text()
+        if error is None:
+            output = out_text
+        else:
+            # ผิดพลาด: ส่ง stderr (หรือเหตุผล) พร้อม stdout ที่ได้ก่อนพังให้ LLM ใช้อธิบายสาเหตุ
+            parts = [error] if error != "" else []
+            if err_text.strip(): parts.append(err_text)
+            if out_text.strip(): parts.append(f"[stdout ก่อนเกิดข้อผิดพลาด]\n{out_text}")
+            output = "\n".join(parts)
+        return {
+            "output": truncate_middle(output, settings.SANDBOX_OUTPUT_MAX_BYTES),
+            "has_error": error is not None,
+            "stdout": out_text, "stderr": err_text,
+            "truncated": stdout.truncated or stderr.truncated,
+            "artifacts": artifacts,
+            "duration": time.monotonic() - started,
+        }
+
+    @staticmethod
+    def _describe_failure(status: Optional[dict], timeout: float) -> Optional[str]:
+        """None = สำเร็จ, "" = ล้มเหลวโดยให้ stderr อธิบายเอง, อื่นๆ = ข้อความอธิบายสาเหตุ"""
+        if status is None:
+            return "The sandbox worker crashed while running the code."
+        if status.get("timed_out"):
+            return f"Execution timed out after {timeout:.0f} seconds."
+        if status.get("signal") == "SIGXCPU":
+            return f"Execution exceeded the CPU time limit ({settings.SANDBOX_CPU_SECONDS} seconds)."
+        if status.get("signal"):
+            return f"Execution was terminated by {status['signal']}."
+        if status.get("error"):
+            return f"An unexpected error occurred during execution: {status['error']}"
+        return None if status["returncode"] == 0 else ""
+
+    @staticmethod
+    def _run_in_subprocess(job: dict, on_tick: Callable[[], bool]) -> dict:
+        """โหมดไม่มี Pool: เปิด Interpreter ใหม่ โดยเขียน Output ลงไฟล์เดียวกับโหมด Pool เพื่อให้อ่านแบบ Streaming ได้"""
+        started = time.monotonic()
+        with open(job["stdout_path"], "wb") as out, open(job["stderr_path"], "wb") as err:
+            # cwd=work dir: โปรเซสทำงานอยู่ในโฟลเดอร์ของงานนี้เท่านั้น
+            # **หมายเหตุ:** การจำกัดสิทธิ์ user และ network บน Windows ต้องใช้เทคนิคขั้นสูงเพิ่มเติม
+            process = subprocess.Popen([sys.executable, SCRIPT_FILENAME], cwd=job["cwd"], env=_sandbox_env(),
+                                       stdin=subprocess.DEVNULL, stdout=out, stderr=err,
+                                       start_new_session=os.name == "posix")
+        timed_out = False
+        while True:
+            try:
+                process.wait(timeout=OUTPUT_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                if time.monotonic() - started >= job["timeout"] or on_tick():
+                    timed_out = time.monotonic() - started >= job["timeout"]
+                    process.kill()
+                    process.wait()
+                    break
+        returncode = process.returncode
+        return {"returncode": returncode, "timed_out": timed_out, "duration": time.monotonic() - started,
+                "signal": signal.Signals(-returncode).name if returncode < 0 and not timed_out else None}
+
+    @staticmethod
+    def _collect_artifacts(work_dir: str, job_id: str) -> List[Dict[str, Any]]:
+        """
+        คัดลอกไฟล์ที่โค้ดสร้าง (นามสกุลใน SANDBOX_ARTIFACT_EXTENSIONS) ไปยัง web/static/artifacts/<job_id>/
+        ข้าม Symlink (กันการชี้ไปไฟล์นอก Sandbox) และไฟล์ที่ใหญ่เกิน; ไม่รวม HTML/SVG ที่อาจมีสคริปต์รันบนโดเมนเรา
+        """
+        allowed = {ext.strip().lower() for ext in settings.SANDBOX_ARTIFACT_EXTENSIONS.split(",") if ext.strip()}
+        max_bytes = settings.SANDBOX_ARTIFACT_MAX_MB * 1024 * 1024
+        artifacts = []
+        for root, _, files in os.walk(work_dir, followlinks=False):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if path == os.path.join(work_dir, SCRIPT_FILENAME) or os.path.islink(path):
+                    continue
+                if os.path.splitext(name)[1].lower() not in allowed or os.path.getsize(path) > max_bytes:
+                    continue
+                if len(artifacts) >= settings.SANDBOX_ARTIFACT_MAX_FILES:
+                    break
+                relative = os.path.relpath(path, work_dir).replace(os.sep, "/")
+                safe_name = relative.replace("/", "__")
+                target_dir = os.path.join(ARTIFACT_DIR, job_id)
+                os.makedirs(target_dir, exist_ok=True)
+                shutil.copyfile(path, os.path.join(target_dir, safe_name))
+                artifacts.append({"name": relative, "url": f"{ARTIFACT_URL_PREFIX}/{job_id}/{quote(safe_name)}",
+                                  "size": os.path.getsize(path)})
+        if artifacts:
+            _prune_artifacts()
+        return artifacts
+
+    def metrics(self) -> dict:
+        return self.pool.metrics() if self.pool else {"mode": "subprocess"}
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+
+
+def _prune_artifacts():
+    """ลบโฟลเดอร์ Artifact ที่อายุเกิน SANDBOX_ARTIFACT_TTL_HOURS (ทำตอนมี Artifact ใหม่ ไม่ต้องมี Background task)"""
+    cutoff = time.time() - settings.SANDBOX_ARTIFACT_TTL_HOURS * 3600
+    for entry in os.scandir(ARTIFACT_DIR):
+        try:
+            if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            continue
@@ -45,6 +45,156 @@ class Settings:
 
     NEWS_KEY = os.getenv("NEWS_API_KEY")
 
+    # >> 🔎 Hybrid Retrieval (BM25 + Vector)
+    # จำนวนผู้สมัครต่อหมวดหมู่ในรอบแรก และเพดานจำนวนคู่ที่ส่งเข้า Reranker (ต้นทุน CPU หลัก)
+    RAG_TOP_K_RETRIEVAL = int(os.getenv("RAG_TOP_K_RETRIEVAL", 6))
+    RAG_MAX_RERANK_CANDIDATES = int(os.getenv("RAG_MAX_RERANK_CANDIDATES", 24))
+    RAG_RRF_K = int(os.getenv("RAG_RRF_K", 60))
+
+    # >> 🗃️ Embedding Cache (ใช้ร่วมกันทุก Builder)
+    # float16 ประหยัดพื้นที่ครึ่งหนึ่ง, float32 ให้ผลลัพธ์ตรงกับการรันโมเดลทุกบิต
+    EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+    EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+
+    # >> 🧵 Embedding Pipeline (Builder แบบหลาย Process บน CPU)
+    # แต่ละ Worker โหลดโมเดลของตัวเอง (e5-large ~2GB ต่อ Process) จึงตั้งค่าเริ่มต้นไว้น้อย ๆ
+    # EMBED_WORKERS=0 คือเลือกอัตโนมัติตามจำนวนคอร์ (จำนวนคอร์ / EMBED_THREADS_PER_WORKER) ใช้เมื่อ RAM พอ, 1 คือ Process เดียวแบบเดิม
+    EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 2))
+    EMBED_THREADS_PER_WORKER = int(os.getenv("EMBED_THREADS_PER_WORKER", 2))
+
+    # >> 📦 Inference Batching (Embedder + Reranker)
+    # เพดาน "จำนวน Batch x ความยาว Token ที่ยาวที่สุด" ต่อ Batch และจำนวนข้อความสูงสุดต่อ Batch
+    INFERENCE_BATCH_TOKEN_BUDGET = int(os.getenv("INFERENCE_BATCH_TOKEN_BUDGET", 8192))
+    INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 64))
+
+    # >> ⏱️ Inference Scheduler: รวมงาน encode/rerank ข้าม Request เป็น Batch เดียว
+    # หน้าต่างเวลาที่ยอมรอเพื่อรวมงาน (ms) และจำนวนรายการสูงสุดต่อรอบ
+    INFERENCE_SCHEDULER_ENABLED = os.getenv("INFERENCE_SCHEDULER_ENABLED", "true").lower() == "true"
+    INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", 5))
+    INFERENCE_SCHEDULER_MAX_BATCH = int(os.getenv("INFERENCE_SCHEDULER_MAX_BATCH", 128))
+
+    # >> 🏎️ Inference Backend ของ Embedder/Reranker ฝั่งเซิร์ฟเวอร์: torch | int8 | onnx | onnx-int8
+    # int8, onnx และ onnx-int8 ต้องรัน export_inference_models.py (ซึ่ง Export และตรวจ Parity กับ FP32 ให้) ก่อน ไม่เช่นนั้นใช้ torch
+    INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+    ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "data/onnx_models")
+    ONNX_QUANTIZATION_CONFIG = os.getenv("ONNX_QUANTIZATION_CONFIG", "avx512_vnni")
+
+    # >> 🗜️ Vector Index Storage (ทุก Builder): FAISS factory string เช่น Flat, SQfp16, SQ8, PCA256,SQfp16
+    # ชนิดที่ต้อง Train จะใช้ตัวอย่างไม่เกิน VECTOR_INDEX_TRAIN_SIZE เวกเตอร์ (ดู evaluate_vector_index.py สำหรับ Recall ที่เสียไป)
+    VECTOR_INDEX_SPEC = os.getenv("VECTOR_INDEX_SPEC", "Flat")
+    VECTOR_INDEX_TRAIN_SIZE = int(os.getenv("VECTOR_INDEX_TRAIN_SIZE", 16384))
+
+    # >> 🏭 Book Index Build (manage_data.py)
+    # จำนวน Chunk ต่อ Batch ที่ Embed แล้วต่อท้าย Index ทันที (กำหนดเพดาน RAM) และช่วงห่างขั้นต่ำของ Checkpoint (ต่อหมวดหมู่)
+    RAG_BUILD_BATCH_SIZE = int(os.getenv("RAG_BUILD_BATCH_SIZE", 256))
+    RAG_BUILD_CHECKPOINT_BATCHES = int(os.getenv("RAG_BUILD_CHECKPOINT_BATCHES", 20))
+
+    # >> 📰 News Shards (manage_news.py / RAGEngine): แบ่ง Index ข่าวตามช่วงเวลา (day | week)
+    # Shard ที่เก่ากว่า NEWS_RETENTION_DAYS ถูกลบทั้งโฟลเดอร์ และคะแนนค้นหาลดลงครึ่งหนึ่งทุก NEWS_RECENCY_HALF_LIFE_DAYS วัน
+    NEWS_SHARD_PERIOD = os.getenv("NEWS_SHARD_PERIOD", "week")
+    NEWS_RETENTION_DAYS = int(os.getenv("NEWS_RETENTION_DAYS", 90))
+    NEWS_RECENCY_HALF_LIFE_DAYS = float(os.getenv("NEWS_RECENCY_HALF_LIFE_DAYS", 7))
+
+    # >> 🕸️ News Ingestion (core/news_ingestion.py): HTTP Client เดียวแบบ Pool + มารยาทต่อโดเมน
+    # แต่ละโดเมนยิงพร้อมกันไม่เกิน NEWS_DOMAIN_CONCURRENCY และเว้นระยะเริ่ม Request อย่างน้อย NEWS_DOMAIN_MIN_INTERVAL_MS
+    NEWS_HTTP_MAX_CONNECTIONS = int(os.getenv("NEWS_HTTP_MAX_CONNECTIONS", 32))
+    NEWS_HTTP_TIMEOUT = float(os.getenv("NEWS_HTTP_TIMEOUT", 15))
+    NEWS_DOMAIN_CONCURRENCY = int(os.getenv("NEWS_DOMAIN_CONCURRENCY", 2))
+    NEWS_DOMAIN_MIN_INTERVAL_MS = float(os.getenv("NEWS_DOMAIN_MIN_INTERVAL_MS", 200))
+    NEWS_FETCH_RETRIES = int(os.getenv("NEWS_FETCH_RETRIES", 3))
+    NEWS_FRONTIER_DB = os.getenv("NEWS_FRONTIER_DB", "data/news_index/frontier.db")
+
+    # >> 🧬 News Near-Duplicates (core/near_duplicates.py): MinHash/LSH ก่อน Embed
+    # ข่าวที่ Jaccard โดยประมาณ >= NEWS_DUPLICATE_THRESHOLD ถือเป็นข่าวเดียวกัน (PERMUTATIONS ต้องหารด้วย BANDS ลงตัว)
+    NEWS_DUPLICATE_THRESHOLD = float(os.getenv("NEWS_DUPLICATE_THRESHOLD", 0.8))
+    NEWS_MINHASH_PERMUTATIONS = int(os.getenv("NEWS_MINHASH_PERMUTATIONS", 128))
+    NEWS_LSH_BANDS = int(os.getenv("NEWS_LSH_BANDS", 16))
+    NEWS_DEDUP_DB = os.getenv("NEWS_DEDUP_DB", "data/news_index/near_duplicates.db")
+
+    # >> 🏛️ Memory Consolidation (ในเซิร์ฟเวอร์): แปลงบทสนทนาเป็นความทรงจำระยะยาวและเพิ่มเข้า Index ระหว่างทำงาน
+    # รันเมื่อข้อความค้าง >= MESSAGE_TRIGGER หรือมีข้อความค้างและครบ INTERVAL_SECONDS (ตรวจทุก POLL_SECONDS)
+    MEMORY_CONSOLIDATION_ENABLED = os.getenv("MEMORY_CONSOLIDATION_ENABLED", "true").lower() == "true"
+    MEMORY_CONSOLIDATION_INTERVAL_SECONDS = float(os.getenv("MEMORY_CONSOLIDATION_INTERVAL_SECONDS", 180))
+    MEMORY_CONSOLIDATION_MESSAGE_TRIGGER = int(os.getenv("MEMORY_CONSOLIDATION_MESSAGE_TRIGGER", 40))
+    MEMORY_CONSOLIDATION_POLL_SECONDS = float(os.getenv("MEMORY_CONSOLIDATION_POLL_SECONDS", 15))
+    MEMORY_CONSOLIDATION_SESSIONS_PER_BATCH = int(os.getenv("MEMORY_CONSOLIDATION_SESSIONS_PER_BATCH", 10))
+    MEMORY_CONSOLIDATION_CHUNK_SIZE = int(os.getenv("MEMORY_CONSOLIDATION_CHUNK_SIZE", 20))
+
+    # >> 🔑 API Key Scheduler (core/key_scheduler.py): Token Bucket ต่อคีย์
+    # RPM/TPM = 0 คือยังไม่รู้ขีดจำกัด (จะเรียนรู้จาก 429 เอง) / คืนขีดจำกัดที่เรียนรู้ทีละขั้นทุก RECOVERY_SECONDS
+    GOOGLE_KEY_RPM = int(os.getenv("GOOGLE_KEY_RPM", 0))
+    GOOGLE_KEY_TPM = int(os.getenv("GOOGLE_KEY_TPM", 0))
+    GROQ_KEY_RPM = int(os.getenv("GROQ_KEY_RPM", 0))
+    GROQ_KEY_TPM = int(os.getenv("GROQ_KEY_TPM", 0))
+    KEY_LIMIT_RECOVERY_SECONDS = float(os.getenv("KEY_LIMIT_RECOVERY_SECONDS", 600))
+    KEY_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("KEY_ACQUIRE_TIMEOUT_SECONDS", 30))
+    # Cooldown ที่แชร์ข้าม Process (core/key_cooldowns.py): เซิร์ฟเวอร์และ knowledge_extractor_*.py เห็นคีย์ที่ติด 429/โควต้าตรงกัน
+    KEY_COOLDOWN_SHARED = os.getenv("KEY_COOLDOWN_SHARED", "true").lower() == "true"
+    KEY_COOLDOWN_DB = os.getenv("KEY_COOLDOWN_DB", "data/key_cooldowns.db")
+    KEY_COOLDOWN_CACHE_SECONDS = float(os.getenv("KEY_COOLDOWN_CACHE_SECONDS", 1.0))
+
+    # >> 🔁 LLM Retry Policy (core/retry_policy.py): ใช้กับทุก Agent
+    # ลองไม่เกิน MAX_ATTEMPTS ครั้งต่อโมเดล รอแบบ Exponential backoff + Jitter และไม่เกินงบเวลาต่อ Request (REQUEST_DEADLINE_SECONDS)
+    # แล้วจึง Fallback ไปโมเดลสำรองของ Provider เดิม และ Provider อื่น (ค่าว่าง = ไม่ใช้โมเดลสำรอง)
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+    LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 0.5))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 8))
+    LLM_FALLBACK_GEMINI_MODEL = os.getenv("LLM_FALLBACK_GEMINI_MODEL", "gemini-1.5-flash-8b")
+    LLM_FALLBACK_GROQ_MODEL = os.getenv("LLM_FALLBACK_GROQ_MODEL", SECONDARY_GROQ_MODEL)
+    LLM_CROSS_PROVIDER_FALLBACK = os.getenv("LLM_CROSS_PROVIDER_FALLBACK", "true").lower() == "true"
+
+    # >> 🛑 Request Deadline & Cancellation (core/request_context.py)
+    # งบเวลาทั้งหมดของคำถามหนึ่งครั้ง (Agent + LLM + RAG + Formatter) นับจากที่ Endpoint ได้รับ
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 120))
+
+    # >> 🧪 Code Sandbox (core/code_executor.py)
+    # Worker ที่ Import ไลบรารีไว้แล้วสำหรับ CodeInterpreterAgent (เฉพาะ POSIX) แต่ละงาน fork ใหม่พร้อม rlimit
+    # MEMORY_LIMIT_MB คือหน่วยความจำที่งานใช้ได้เพิ่มจากที่ Worker โหลดไว้, สร้าง Worker ใหม่ทุก MAX_JOBS_PER_WORKER งาน
+    SANDBOX_POOL_ENABLED = os.getenv("SANDBOX_POOL_ENABLED", "true").lower() == "true"
+    SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", 2))
+    SANDBOX_MAX_JOBS_PER_WORKER = int(os.getenv("SANDBOX_MAX_JOBS_PER_WORKER", 50))
+    SANDBOX_PRELOAD_MODULES = os.getenv("SANDBOX_PRELOAD_MODULES", "pandas,numpy,json,math,re,datetime,collections,statistics")
+    SANDBOX_TIMEOUT_SECONDS = float(os.getenv("SANDBOX_TIMEOUT_SECONDS", 30))
+    SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", 20))
+    SANDBOX_MEMORY_LIMIT_MB = int(os.getenv("SANDBOX_MEMORY_LIMIT_MB", 1024))
+    SANDBOX_WORKER_START_TIMEOUT_SECONDS = float(os.getenv("SANDBOX_WORKER_START_TIMEOUT_SECONDS", 30))
+    # Output เก็บแค่ส่วนต้น+ส่วนท้ายรวมไม่เกิน OUTPUT_MAX_BYTES ต่อ stream (และเป็นขนาดสูงสุดที่ส่งให้ LLM สรุป)
+    # MAX_FILE_MB จำกัดขนาดไฟล์ที่โค้ดเขียนได้ (rlimit), ไฟล์ผลลัพธ์ (กราฟ/CSV) ถูกเก็บใน web/static/artifacts/ ตาม TTL
+    SANDBOX_OUTPUT_MAX_BYTES = int(os.getenv("SANDBOX_OUTPUT_MAX_BYTES", 16000))
+    SANDBOX_PROGRESS_INTERVAL_SECONDS = float(os.getenv("SANDBOX_PROGRESS_INTERVAL_SECONDS", 1.0))
+    SANDBOX_MAX_FILE_MB = int(os.getenv("SANDBOX_MAX_FILE_MB", 64))
+    SANDBOX_ARTIFACT_EXTENSIONS = os.getenv("SANDBOX_ARTIFACT_EXTENSIONS", ".png,.jpg,.jpeg,.gif,.webp,.csv,.tsv,.json,.txt,.xlsx,.pdf")
+    SANDBOX_ARTIFACT_MAX_FILES = int(os.getenv("SANDBOX_ARTIFACT_MAX_FILES", 10))
+    SANDBOX_ARTIFACT_MAX_MB = int(os.getenv("SANDBOX_ARTIFACT_MAX_MB", 10))
+    SANDBOX_ARTIFACT_TTL_HOURS = float(os.getenv("SANDBOX_ARTIFACT_TTL_HOURS", 24))
+
+    # >> 🗣️ Text-to-Speech (core/tts_engine.py)
+    # BACKEND: "gtts" (ออนไลน์) หรือ "command" (โปรแกรมในเครื่อง รับข้อความทาง stdin ส่งเสียงทาง stdout ตาม TTS_COMMAND)
+    # คำตอบถูกแบ่งเป็นท่อนไม่เกิน SEGMENT_MAX_CHARS (ท่อนแรกสั้นกว่า ได้ยินเสียงเร็วขึ้น) และสังเคราะห์พร้อมกัน MAX_WORKERS ท่อน
+    TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+    TTS_LANGUAGE = os.getenv("TTS_LANGUAGE", "th")
+    TTS_COMMAND = os.getenv("TTS_COMMAND", "")
+    TTS_COMMAND_FORMAT = os.getenv("TTS_COMMAND_FORMAT", "wav")
+    TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", 4))
+    TTS_SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", 200))
+    TTS_FIRST_SEGMENT_MAX_CHARS = int(os.getenv("TTS_FIRST_SEGMENT_MAX_CHARS", 80))
+    TTS_SEGMENT_TIMEOUT_SECONDS = float(os.getenv("TTS_SEGMENT_TIMEOUT_SECONDS", 20))
+    # ไฟล์เสียงถูก Cache ตามข้อความใน web/static/audio/ จำกัดขนาดรวม CACHE_MAX_MB (ลบไฟล์ที่ไม่ได้ใช้นานที่สุดก่อน)
+    TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", 200))
+    # สถานะงานสร้างเสียงถูกเก็บไว้ AUDIO_TASK_TTL_SECONDS (Push ทาง WebSocket / SSE / Long-poll รอได้นานสุด MAX_WAIT ต่อครั้ง)
+    AUDIO_TASK_TTL_SECONDS = float(os.getenv("AUDIO_TASK_TTL_SECONDS", 600))
+    AUDIO_STATUS_MAX_WAIT_SECONDS = float(os.getenv("AUDIO_STATUS_MAX_WAIT_SECONDS", 25))
+
+    # >> 🏭 Knowledge Graph Extraction (knowledge_extractor*.py, core/kg_job_queue.py)
+    # ความคืบหน้าเก็บใน CHECKPOINT_DB (ไฟล์หนังสือไม่ถูกแก้ไข) Chunk ที่ล้มเหลวครบ MAX_CHUNK_ATTEMPTS ครั้งถูกข้าม
+    # งานพร้อมกันต่อ Provider ปรับอัตโนมัติ สูงสุด MAX_WORKERS_PER_PROVIDER และไม่เกินคีย์ที่ว่าง x WORKERS_PER_KEY
+    KG_CHECKPOINT_DB = os.getenv("KG_CHECKPOINT_DB", "data/kg_checkpoint.db")
+    KG_MAX_CHUNK_ATTEMPTS = int(os.getenv("KG_MAX_CHUNK_ATTEMPTS", 3))
+    KG_MAX_WORKERS_PER_PROVIDER = int(os.getenv("KG_MAX_WORKERS_PER_PROVIDER", 8))
+    KG_WORKERS_PER_KEY = int(os.getenv("KG_WORKERS_PER_KEY", 2))
+    KG_MAX_PAUSE_SECONDS = float(os.getenv("KG_MAX_PAUSE_SECONDS", 300))
+    KG_FLUSH_INTERVAL_SECONDS = float(os.getenv("KG_FLUSH_INTERVAL_SECONDS", 10))
+
     NEO4J_URI = os.getenv("NEO4J_URI")
     NEO4J_USER = os.getenv("NEO4J_USER")
     NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
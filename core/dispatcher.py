@@ -1,10 +1,17 @@
 # core/dispatcher.py
-# (V6.1 - Final, Complete & Resilient Conductor)
+# (V6.2 - Cancellable Conductor)
+# ทุก Request ทำงานภายใต้ RequestContext (core/request_context.py): Agent รันใน asyncio.to_thread
+# (Event loop ไม่ถูกบล็อกระหว่างรอ LLM) และหยุดเมื่อ Request ถูกยกเลิกหรือเลย Deadline
 
+import asyncio
+import time
 import traceback
 from pydantic import BaseModel
 from typing import Optional, Dict, List, Any, Callable 
 
+from core.config import settings
+from core.request_context import RequestCancelled, RequestContext, check_cancelled, use_context
+
 class FinalResponse(BaseModel):
     agent_used: str
     answer: str
@@ -36,7 +43,37 @@ class Dispatcher:
         """
         return [{"role": h.get("role"), "parts": h.get("content")} for h in history_dicts]
 
-    async def handle_query(self, query: str, user_id: str, update_callback: Optional[Callable] = None) -> FinalResponse:
+    async def handle_query(self, query: str, user_id: str, update_callback: Optional[Callable] = None,
+                           context: Optional[RequestContext] = None) -> FinalResponse:
+        """
+        ตอบคำถามหนึ่งครั้งภายใต้ context (Endpoint สร้างผ่าน SessionRequests; ไม่ส่งมา = สร้างใหม่ตาม REQUEST_DEADLINE_SECONDS)
+        เลย Deadline: คืนคำตอบแจ้ง Timeout / ถูกยกเลิกด้วยเหตุผลอื่น: โยน RequestCancelled ให้ Endpoint
+        """
+        context = context or RequestContext(user_id, settings.REQUEST_DEADLINE_SECONDS)
+        if update_callback:
+            # Agent รันใน Thread: ส่ง Progress กลับเข้า Event loop แบบ Thread-safe (core/request_context.report_progress)
+            loop = asyncio.get_running_loop()
+            context.progress_sink = lambda message: asyncio.run_coroutine_threadsafe(update_callback(message), loop)
+        try:
+            with use_context(context):
+                return await asyncio.wait_for(self._handle_query(query, user_id, update_callback=update_callback),
+                                              timeout=context.remaining())
+        except (asyncio.TimeoutError, RequestCancelled) as e:
+            if isinstance(e, RequestCancelled) and e.reason != "deadline":
+                raise
+            context.cancel("deadline")
+            print(f"⏱️ Dispatcher: Request {context.request_id} for '{user_id}' exceeded its deadline after {time.monotonic() - context.started_at:.1f}s.")
+            return FinalResponse(agent_used="TIMEOUT", answer="ขออภัยครับ คำถามนี้ใช้เวลาประมวลผลนานเกินไป ลองถามให้แคบลงหรือถามใหม่อีกครั้งนะครับ", error=True)
+
+    @staticmethod
+    async def _run(func: Callable, *args) -> Any:
+        """รัน Agent (โค้ด Sync) ใน Thread พร้อม RequestContext ปัจจุบัน ตรวจการยกเลิกก่อนและหลัง"""
+        check_cancelled()
+        result = await asyncio.to_thread(func, *args)
+        check_cancelled()
+        return result
+
+    async def _handle_query(self, query: str, user_id: str, update_callback: Optional[Callable] = None) -> FinalResponse:
         self.memory_manager.add_memory(role="user", content=query, session_id=user_id, agent_used="USER")
         
         try:
@@ -49,7 +86,7 @@ class Dispatcher:
             if not feng_agent: raise ValueError("CRITICAL: FengAgent not found.")
 
             short_mem = self.memory_manager.get_last_n_memories(session_id=user_id, n=4)
-            dispatch_order = feng_agent.handle(query, short_mem)
+            dispatch_order = await self._run(feng_agent.handle, query, short_mem)
             
             if dispatch_order.get("type") == "final_answer":
                 print("🚦 Dispatcher: FengAgent provided a quick response. Finalizing.")
@@ -106,23 +143,23 @@ class Dispatcher:
                     })
                 
                 if agent_name in agents_needing_memory:
-                    answer = agent.handle(corrected_query, short_mem)
+                    answer = await self._run(agent.handle, corrected_query, short_mem)
                     return await self._finalize_response(agent_name, answer, user_id, update_callback=update_callback)
 
                 elif agent_name == "PLANNER":
                     return await self._run_deep_analysis(corrected_query, user_id, update_callback=update_callback)
                 
                 elif agent_name == "PROACTIVE_OFFER_HANDLER":
-                    response = agent.handle(corrected_query)
+                    response = await self._run(agent.handle, corrected_query)
                     self.memory_manager.set_pending_deep_dive(user_id, response.get("original_query"))
                     return await self._finalize_response("PROACTIVE_OFFER", response.get("content"), user_id, update_callback=update_callback)
 
                 elif agent_name == "NEWS":
-                    response = agent.handle(corrected_query)
+                    response = await self._run(agent.handle, corrected_query)
                     return await self._finalize_response("NEWS", response.get("answer"), user_id, thought_process=response.get("thought_process"), update_callback=update_callback)
                 
                 elif agent_name == "IMAGE":
-                    image_info = agent.handle(corrected_query)
+                    image_info = await self._run(agent.handle, corrected_query)
                     if image_info:
                         answer = "นี่คือรูปภาพที่ผมหามาให้ครับ"
                         return await self._finalize_response("IMAGE", answer, user_id, image_info=image_info, update_callback=update_callback)
@@ -130,7 +167,7 @@ class Dispatcher:
                     return await self._run_deep_analysis(corrected_query, user_id, update_callback=update_callback)
 
                 else: # Utility agents
-                    answer = agent.handle(corrected_query)
+                    answer = await self._run(agent.handle, corrected_query)
                     if answer is not None:
                         return await self._finalize_response(agent_name, answer, user_id, update_callback=update_callback)
                     print(f"⚠️ Dispatcher: Utility Agent '{agent_name}' returned None. Defaulting to Planner.")
@@ -140,6 +177,8 @@ class Dispatcher:
             return await self._run_deep_analysis(corrected_query, user_id, update_callback=update_callback)
 
         except Exception as e:
+            # Error ที่เกิดเพราะงบเวลาหมด (เช่น DeadlineExceeded) ไม่ต้องขอโทษด้วย LLM อีกรอบ: ให้ handle_query ตอบ Timeout
+            check_cancelled()
             print(f"❌ Unhandled error in Dispatcher handle_query: {e}")
             traceback.print_exc()
             
@@ -147,7 +186,7 @@ class Dispatcher:
             if apology_agent:
                 last_query = self.memory_manager.get_last_user_query(user_id)
                 error_context = f"An exception occurred: {type(e).__name__} - {e}"
-                apology_answer = apology_agent.handle(last_query, error_context)
+                apology_answer = await self._run(apology_agent.handle, last_query, error_context)
                 return await self._finalize_response("APOLOGY_HANDLER", apology_answer, user_id, is_error=True, update_callback=update_callback)
             
             return await self._finalize_response("DISPATCHER_ERROR", "ขออภัยครับ เกิดข้อผิดพลาดร้ายแรงในระบบจัดการ", user_id, is_error=True, update_callback=update_callback)
@@ -174,7 +213,7 @@ class Dispatcher:
 
         short_mem = self.memory_manager.get_last_n_memories(session_id=user_id)
         available_cats = self.rag_engine.available_categories if self.rag_engine else []
-        planner_result = planner_agent.handle(query, short_mem, available_cats)
+        planner_result = await self._run(planner_agent.handle, query, short_mem, available_cats)
         
         final_draft = planner_result.get("answer", "ขออภัย มีข้อผิดพลาดในการสร้างบทวิเคราะห์")
         thought_process = planner_result.get("thought_process")
@@ -211,7 +250,7 @@ class Dispatcher:
                      "history": self.memory_manager.get_last_n_memories(session_id=user_id, n=4),
                      "draft_to_review": final_answer
                  }
-                 final_answer = formatter.handle(synthesis_order)
+                 final_answer = await self._run(formatter.handle, synthesis_order)
         
         self.memory_manager.add_memory(
             role="model", 
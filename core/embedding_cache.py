@@ -0,0 +1,169 @@
+# core/embedding_cache.py
+# (V1.0 - Content-Addressed Embedding Cache)
+# คลัง Embedding บนดิสก์ที่ใช้ร่วมกันทุก Builder (manage_*.py)
+# Key = (ชื่อโมเดล, prefix, sha256 ของข้อความ) -> เวกเตอร์ที่เคยคำนวณไว้แล้ว
+# แยกโฟลเดอร์ตาม Variant ของโมเดล (Backend/ความแม่นยำ เช่น int8, onnx-int8, fp16): เวกเตอร์จากโมเดลที่ Quantize
+# ต้องไม่ปนกับ FP32 ที่ Builder ใช้สร้าง Index (ค่าว่าง = FP32 ปกติ ใช้โฟลเดอร์เดิม)
+# ทำให้การสร้าง Index ใหม่ (เช่น เปลี่ยนชนิด Index) ไม่ต้องรันโมเดลซ้ำเลย
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import settings
+
+_SQLITE_MAX_PARAMS = 900
+
+
+def cache_variant(model) -> str:
+    """Variant ของโมเดลที่ใช้แยก Cache: load_embedder() / EmbeddingPipeline ตั้ง cache_variant ไว้ (ไม่มี = FP32)"""
+    return getattr(model, "cache_variant", "") or ""
+
+
+class EmbeddingCache:
+    """
+    โครงสร้างบนดิสก์ (ต่อหนึ่งโมเดล):
+    - vectors.bin : Array ของเวกเตอร์ (float32 หรือ float16) ต่อท้ายกันไปเรื่อยๆ อ่านผ่าน np.memmap
+    - keys.db     : SQLite ที่เก็บ key -> หมายเลขแถวใน vectors.bin
+    - meta.json   : dim และ dtype ของไฟล์เวกเตอร์
+    """
+    def __init__(self, model_name: str, cache_dir: Optional[str] = None, dtype: Optional[str] = None,
+                 variant: str = ""):
+        self.model_name = model_name
+        self.variant = variant
+        safe_name = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+        if variant:
+            safe_name += "@" + re.sub(r'[^A-Za-z0-9._-]+', '_', variant)
+        self.folder = os.path.join(cache_dir or settings.EMBEDDING_CACHE_DIR, safe_name)
+        os.makedirs(self.folder, exist_ok=True)
+        self.vectors_path = os.path.join(self.folder, "vectors.bin")
+        self.db_path = os.path.join(self.folder, "keys.db")
+        self.meta_path = os.path.join(self.folder, "meta.json")
+
+        self.dim: Optional[int] = None
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_CACHE_DTYPE)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, row INTEGER NOT NULL) WITHOUT ROWID")
+
+        self._memmap: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+
+    # --- Key & Storage ---
+
+    @staticmethod
+    def make_key(prefix: str, text: str) -> bytes:
+        text_digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return hashlib.sha256(prefix.encode("utf-8") + b"\x00" + text_digest).digest()
+
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _vectors(self) -> np.memmap:
+        rows = os.path.getsize(self.vectors_path) // self._row_bytes() if os.path.exists(self.vectors_path) else 0
+        if self._memmap is None or self._memmap.shape[0] != rows:
+            self._memmap = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim)) if rows else None
+        return self._memmap
+
+    def _lookup(self, conn: sqlite3.Connection, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        found = {}
+        for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+            batch = keys[start:start + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch).fetchall())
+        return found
+
+    def _store(self, conn: sqlite3.Connection, keys: List[bytes], vectors: np.ndarray):
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model_name": self.model_name, "variant": self.variant, "dim": self.dim, "dtype": self.dtype.name}, f)
+
+        # BEGIN IMMEDIATE ทำหน้าที่เป็น Lock ข้ามโปรเซส ระหว่างต่อท้ายไฟล์เวกเตอร์
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            with open(self.vectors_path, "ab") as f:
+                if size % self._row_bytes():
+                    # แถวที่เขียนไม่ครบจากการ Crash ครั้งก่อน: ตัดทิ้งให้ไฟล์กลับมาตรงแนว
+                    size -= size % self._row_bytes()
+                    f.truncate(size)
+                f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            first_row = size // self._row_bytes()
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (key, row) VALUES (?, ?)",
+                [(key, first_row + i) for i, key in enumerate(keys)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- Public API ---
+
+    def encode(self, model, texts: Sequence[str], prefix: str = "", **encode_kwargs) -> np.ndarray:
+        """
+        คืนค่า Embedding (float32) ของ texts ตามลำดับเดิม
+        ดึงจาก Cache ก่อน แล้วส่งเฉพาะข้อความที่ยังไม่เคยเห็นให้ model.encode
+        """
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype="float32")
+        keys = [self.make_key(prefix, text) for text in texts]
+
+        with sqlite3.connect(self.db_path, isolation_level=None) as conn:
+            found = self._lookup(conn, keys)
+
+            missing: Dict[bytes, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in found and key not in missing:
+                    missing[key] = text
+            num_misses = sum(1 for key in keys if key not in found)
+            self.hits += len(keys) - num_misses
+            self.misses += num_misses
+
+            if missing:
+                new_vectors = model.encode(
+                    [prefix + text for text in missing.values()], convert_to_numpy=True, **encode_kwargs
+                ).astype("float32")
+                self._store(conn, list(missing), new_vectors)
+                found = self._lookup(conn, keys)
+
+        vectors = self._vectors()
+        rows = np.fromiter((found[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(vectors[rows], dtype="float32")
+
+    def lookup(self, texts: Sequence[str], prefix: str = "") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        อ่านอย่างเดียว ไม่เรียกโมเดล: คืนค่า (vectors, found) โดยแถวที่ไม่มีใน Cache เป็นศูนย์และ found=False
+        """
+        keys = [self.make_key(prefix, text) for text in texts]
+        with sqlite3.connect(self.db_path) as conn:
+            found = self._lookup(conn, keys)
+        mask = np.array([key in found for key in keys], dtype=bool)
+        vectors = np.zeros((len(keys), self.dim or 0), dtype="float32")
+        if mask.any():
+            rows = np.array([found[key] for key in keys if key in found], dtype=np.int64)
+            vectors[mask] = self._vectors()[rows]
+        return vectors, mask
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self, label: str = "Embedding cache"):
+        total = self.hits + self.misses
+        print(f"  - 🗃️  {label}: {self.hits}/{total} hits ({self.hit_rate:.1%}), {self.misses} computed by the model.")
@@ -0,0 +1,168 @@
+# core/embedding_pipeline.py
+# (V1.0 - Multi-Process Embedding Pipeline for Offline Builders)
+# Pool ของ Worker Process ที่แต่ละตัวโหลดโมเดลของตัวเอง ใช้ร่วมกันทุก Builder (manage_*.py)
+# มี .encode() หน้าตาเดียวกับ SentenceTransformer จึงส่งเข้า EmbeddingCache.encode() ได้ทันที
+
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from core.batching import plan_batches, token_lengths
+from core.config import settings
+
+# --- Worker Process State ---
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_in_worker(task: Tuple[int, List[str], Dict]) -> Tuple[int, np.ndarray]:
+    batch_no, texts, encode_kwargs = task
+    vectors = _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                   show_progress_bar=False, **encode_kwargs)
+    return batch_no, vectors.astype("float32")
+
+
+class EmbeddingPipeline:
+    """
+    - workers <= 1 หรือมี GPU: รันโมเดลใน Process เดียว (เหมือนเดิม)
+    - workers > 1: กระจาย Batch ที่จัดกลุ่มตามความยาวให้ Worker แต่ละตัว (ตัวละ threads_per_worker เธรด)
+    Batch ถูกวางแผนด้วย core.batching (Token Budget) โดยนับ Token จาก Tokenizer ใน Process หลัก
+    """
+    def __init__(self, model_name: str, workers: Optional[int] = None,
+                 threads_per_worker: Optional[int] = None, batch_size: int = 32, half: bool = False):
+        import torch
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.threads_per_worker = max(1, threads_per_worker or settings.EMBED_THREADS_PER_WORKER)
+        workers = settings.EMBED_WORKERS if workers is None else workers
+        if workers <= 0:
+            workers = max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.workers = 1 if self.device == "cuda" else workers
+
+        self._model = None
+        self._pool = None
+        # FP16 ใช้เฉพาะ GPU แบบ Process เดียว: ให้ EmbeddingCache แยกเวกเตอร์ FP16 ออกจาก FP32
+        self.cache_variant = "fp16" if half and self.workers == 1 and self.device == "cuda" else ""
+        if self.workers == 1:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(model_name, device=self.device)
+            if half and self.device == "cuda":
+                self._model.half()
+            self.tokenizer = self._model.tokenizer
+            self.max_length = self._model.max_seq_length
+        else:
+            ctx = mp.get_context("spawn")
+            self._pool = ctx.Pool(self.workers, initializer=_init_worker,
+                                  initargs=(model_name, self.threads_per_worker))
+            self.tokenizer, self.max_length = self._load_tokenizer(model_name)
+        print(f"  - ⚙️  Embedding pipeline: {self.workers} worker(s) x {self.threads_per_worker} thread(s) on {self.device.upper()}")
+
+    @staticmethod
+    def _load_tokenizer(model_name: str):
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            return tokenizer, min(tokenizer.model_max_length, 512)
+        except Exception as e:
+            print(f"  - ⚠️ Could not load tokenizer for batch planning, estimating lengths instead: {e}")
+            return None, 512
+
+    def encode(self, texts: Sequence[str], batch_size: Optional[int] = None, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, max_tokens: Optional[int] = None, **encode_kwargs) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        lengths = token_lengths(self.tokenizer, texts, max_length=self.max_length)
+        batches = plan_batches(lengths, max_tokens, batch_size or self.batch_size)
+        tasks = [(batch_no, [texts[i] for i in idx], encode_kwargs) for batch_no, idx in enumerate(batches)]
+
+        if self._pool is not None:
+            results = self._pool.imap_unordered(_encode_in_worker, tasks)
+        else:
+            results = (
+                (batch_no, self._model.encode(batch, batch_size=len(batch), convert_to_numpy=True,
+                                              show_progress_bar=False, **kwargs).astype("float32"))
+                for batch_no, batch, kwargs in tasks
+            )
+
+        output: Optional[np.ndarray] = None
+        for batch_no, vectors in tqdm(results, total=len(tasks), desc="  - Encoding", disable=not show_progress_bar):
+            if output is None:
+                output = np.empty((len(texts), vectors.shape[1]), dtype="float32")
+            output[batches[batch_no]] = vectors
+        return output
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _load_benchmark_texts(path: Optional[str], limit: int) -> List[str]:
+    paths = [path] if path else sorted(glob.glob("data/books/**/*.jsonl", recursive=True))
+    texts = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    content = json.loads(line).get("content")
+                except json.JSONDecodeError:
+                    continue
+                if content:
+                    texts.append(content)
+                if len(texts) >= limit:
+                    return texts
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-process embedding pipeline.")
+    parser.add_argument("--benchmark", action="store_true", help="Measure sentences/sec for each worker/thread combination.")
+    parser.add_argument("--model", default="intfloat/multilingual-e5-large")
+    parser.add_argument("--input", help="A .jsonl file with 'content' fields (default: data/books).")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[settings.EMBED_WORKERS])
+    parser.add_argument("--threads", type=int, nargs="+", default=[settings.EMBED_THREADS_PER_WORKER])
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        raise SystemExit(0)
+
+    sample = _load_benchmark_texts(args.input, args.limit)
+    if not sample:
+        print("🟡 No texts found for benchmarking.")
+        raise SystemExit(1)
+
+    print(f"\n--- ⏱️  Benchmarking '{args.model}' on {len(sample)} texts ---")
+    for workers in args.workers:
+        for threads in args.threads:
+            with EmbeddingPipeline(args.model, workers=workers, threads_per_worker=threads, batch_size=args.batch_size) as pipeline:
+                pipeline.encode(sample[:pipeline.workers * args.batch_size])  # Warm-up
+                start = time.perf_counter()
+                pipeline.encode(sample)
+                elapsed = time.perf_counter() - start
+            print(f"  - 📈 workers={pipeline.workers} threads={threads}: {len(sample) / elapsed:.1f} sentences/sec")
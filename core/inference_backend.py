@@ -0,0 +1,103 @@
+# core/inference_backend.py
+# (V1.0 - Selectable CPU Inference Backends)
+# โหลด Embedder (e5) และ Reranker (bge) ตาม settings.INFERENCE_BACKEND
+# - torch     : FP32 PyTorch (เหมือนเดิม)
+# - int8      : PyTorch + Dynamic Int8 Quantization ของชั้น Linear (ไม่ต้อง Export)
+# - onnx      : ONNX Runtime FP32 (ต้องรัน export_inference_models.py ก่อน)
+# - onnx-int8 : ONNX Runtime + Dynamic Int8 Quantization (ต้องรัน export_inference_models.py ก่อน)
+# Backend ที่ไม่ใช่ torch จะถูกใช้ก็ต่อเมื่อผ่าน Parity Check (parity.json จาก export_inference_models.py) แล้วเท่านั้น
+# ไม่เช่นนั้นจะถอยกลับไปใช้ torch
+
+import json
+import os
+import re
+from typing import Dict, Optional
+
+import torch
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+from core.config import settings
+
+SUPPORTED_BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+EXPORTED_BACKENDS = ("onnx", "onnx-int8")
+PARITY_CHECKED_BACKENDS = ("int8",) + EXPORTED_BACKENDS
+PARITY_FILENAME = "parity.json"
+
+DEFAULT_EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+DEFAULT_RERANKER_MODEL = "BAAI/bge-reranker-base"
+
+
+def export_dir(model_name: str) -> str:
+    return os.path.join(settings.ONNX_MODEL_DIR, re.sub(r'[^A-Za-z0-9._-]+', '_', model_name))
+
+
+def quantized_onnx_filename() -> str:
+    return f"onnx/model_qint8_{settings.ONNX_QUANTIZATION_CONFIG}.onnx"
+
+
+def read_parity_report(model_name: str) -> Dict:
+    path = os.path.join(export_dir(model_name), PARITY_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _resolve_backend(model_name: str, backend: Optional[str], require_parity: bool = True) -> str:
+    backend = (backend or settings.INFERENCE_BACKEND).lower()
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}'. Choose one of {SUPPORTED_BACKENDS}.")
+    if backend in PARITY_CHECKED_BACKENDS and require_parity:
+        report = read_parity_report(model_name).get(backend)
+        if not report:
+            print(f"  - ⚠️ '{model_name}' has no '{backend}' parity result. Run export_inference_models.py. Falling back to torch.")
+            return "torch"
+        if not report.get("passed"):
+            print(f"  - ⚠️ '{model_name}' {backend} backend failed its parity check "
+                  f"(recall@{report.get('k')}={report.get('recall'):.3f}). Falling back to torch.")
+            return "torch"
+    return backend
+
+
+def _onnx_kwargs(model_name: str, backend: str) -> Dict:
+    kwargs = {"backend": "onnx"}
+    if backend == "onnx-int8":
+        kwargs["model_kwargs"] = {"file_name": quantized_onnx_filename()}
+    return kwargs
+
+
+def load_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: Optional[str] = None,
+                  device: Optional[str] = None, require_parity: bool = True) -> SentenceTransformer:
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    backend = _resolve_backend(model_name, backend, require_parity)
+    if backend in EXPORTED_BACKENDS:
+        model = SentenceTransformer(export_dir(model_name), device="cpu", **_onnx_kwargs(model_name, backend))
+    else:
+        model = SentenceTransformer(model_name, device=device)
+        if backend == "int8":
+            transformer = model[0]
+            transformer.auto_model = torch.quantization.quantize_dynamic(
+                transformer.auto_model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+            )
+            model.to("cpu")
+    # EmbeddingCache แยกโฟลเดอร์ตาม Backend: เวกเตอร์จาก int8/onnx ต้องไม่ปนกับ FP32 ที่ใช้สร้าง Index
+    model.cache_variant = "" if backend == "torch" else backend
+    print(f"  - 🧠 Embedder '{model_name}' loaded with backend: {backend}")
+    return model
+
+
+def load_reranker(model_name: str = DEFAULT_RERANKER_MODEL, backend: Optional[str] = None,
+                  device: Optional[str] = None, require_parity: bool = True) -> CrossEncoder:
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    backend = _resolve_backend(model_name, backend, require_parity)
+    if backend in EXPORTED_BACKENDS:
+        model = CrossEncoder(export_dir(model_name), device="cpu", **_onnx_kwargs(model_name, backend))
+    else:
+        model = CrossEncoder(model_name, device=device)
+        if backend == "int8":
+            model.model = torch.quantization.quantize_dynamic(
+                model.model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+            )
+            model.to("cpu")
+    print(f"  - ⚖️  Reranker '{model_name}' loaded with backend: {backend}")
+    return model
@@ -0,0 +1,232 @@
+# core/inference_scheduler.py
+# (V1.0 - Cross-Request Micro-Batching for Embedder & Reranker)
+# ทุก Request ส่งงาน encode/predict เข้าคิวเดียวกัน Worker Thread จะรอรวมงานภายในหน้าต่างเวลาสั้นๆ (เช่น 5 ms)
+# แล้วรันเป็น Batch เดียว ก่อนแจกผลลัพธ์คืนให้ Future ของแต่ละ Request
+# BatchingEmbedder / BatchingReranker ใช้แทน SentenceTransformer / CrossEncoder ได้ทันที (encode / predict)
+# ผู้เรียกภายใน Request รอผลเป็นช่วงสั้นๆ และตรวจ RequestContext ระหว่างนั้น: Request ที่ถูกยกเลิก/หมดเวลาเลิกรอทันที
+# และงานที่ยังอยู่ในคิวถูกถอนออก (งานที่กำลังรันอยู่ใน Batch รันต่อจนจบ แต่ไม่มีใครรอผล)
+
+import bisect
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.batching import encode_texts, predict_pairs
+from core.config import settings
+from core.request_context import RequestCancelled, check_cancelled, current_context
+
+QUEUE_WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# ช่วงรอผลแต่ละครั้งก่อนตรวจว่า Request ถูกยกเลิกหรือยัง
+RESULT_WAIT_SLICE_SECONDS = 0.05
+
+
+class Histogram:
+    """Histogram แบบสะสม (เหมือน Prometheus): นับจำนวนค่าที่ <= แต่ละขอบ และผลรวมทั้งหมด"""
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, running = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+
+class _Job:
+    __slots__ = ("items", "kwargs_key", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, items: List, kwargs: Dict):
+        self.items = items
+        self.kwargs = kwargs
+        self.kwargs_key = tuple(sorted(kwargs.items()))
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    """
+    คิวงานเดียวต่อหนึ่งโมเดล รวมงานที่มี kwargs เหมือนกันเข้าด้วยกันจนครบ max_batch_size รายการ
+    หรือจนหมดหน้าต่างเวลา window_ms นับจากงานแรก แล้วเรียก run_batch(items, **kwargs) ครั้งเดียว
+    """
+    def __init__(self, name: str, run_batch: Callable[..., np.ndarray],
+                 window_ms: Optional[float] = None, max_batch_size: Optional[int] = None):
+        self.name = name
+        self.run_batch = run_batch
+        self.window = (window_ms if window_ms is not None else settings.INFERENCE_BATCH_WINDOW_MS) / 1000.0
+        self.max_batch_size = max_batch_size or settings.INFERENCE_SCHEDULER_MAX_BATCH
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(QUEUE_WAIT_BUCKETS_MS)
+
+        self._queue: Deque[_Job] = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._dropped_jobs = 0
+        self._thread = threading.Thread(target=self._worker, name=f"{name}-scheduler", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, items: Sequence, kwargs: Dict) -> _Job:
+        job = _Job(list(items), kwargs)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"Inference scheduler '{self.name}' is stopped.")
+            self._queue.append(job)
+            self._cond.notify()
+        return job
+
+    def submit(self, items: Sequence, **kwargs) -> Future:
+        return self._enqueue(items, kwargs).future
+
+    def run(self, items: Sequence, **kwargs) -> np.ndarray:
+        """
+        ส่งงานแล้วรอผล ภายใน Request รอทีละ RESULT_WAIT_SLICE_SECONDS (ไม่เกินเวลาที่เหลือของ Request)
+        และเรียก check_cancelled() ระหว่างนั้น ถูกยกเลิก/หมดเวลา = ถอนงานออกจากคิว แล้วโยน RequestCancelled
+        """
+        job = self._enqueue(items, kwargs)
+        context = current_context()
+        if context is None:
+            return job.future.result()
+        try:
+            while True:
+                remaining = context.remaining()
+                wait = RESULT_WAIT_SLICE_SECONDS if remaining is None else max(0.0, min(RESULT_WAIT_SLICE_SECONDS, remaining))
+                try:
+                    return job.future.result(timeout=wait)
+                except FutureTimeoutError:
+                    check_cancelled()
+        except RequestCancelled:
+            self._drop(job)
+            raise
+
+    def _drop(self, job: _Job):
+        """ถอนงานที่ยังไม่ถูกหยิบเข้า Batch ออกจากคิว (งานที่รันอยู่แล้วปล่อยให้จบ ผลถูกทิ้ง)"""
+        with self._cond:
+            if job in self._queue:
+                self._queue.remove(job)
+                job.future.cancel()
+                self._dropped_jobs += 1
+
+    def _take_batch(self) -> List[_Job]:
+        """ดึงงานแรก แล้วรองานที่ kwargs ตรงกันเพิ่มจนเต็ม Batch หรือหมดหน้าต่างเวลา"""
+        with self._cond:
+            while True:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                # งานที่ Future ถูกยกเลิกไปแล้ว (ผู้เรียก submit() ยกเลิกเอง) ไม่ต้องรัน
+                while self._queue and not self._queue[0].future.set_running_or_notify_cancel():
+                    self._queue.popleft()
+                if self._queue or self._stopped:
+                    break
+            if not self._queue:
+                return []
+            first = self._queue.popleft()
+            batch, size = [first], len(first.items)
+            deadline = time.perf_counter() + self.window
+            while size < self.max_batch_size:
+                match = next((job for job in self._queue if job.kwargs_key == first.kwargs_key), None)
+                if match is not None:
+                    if size + len(match.items) > self.max_batch_size:
+                        break
+                    self._queue.remove(match)
+                    if match.future.set_running_or_notify_cancel():
+                        batch.append(match)
+                        size += len(match.items)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or self._stopped:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            started = time.perf_counter()
+            for job in batch:
+                self.queue_wait_histogram.observe((started - job.enqueued_at) * 1000.0)
+            items = [item for job in batch for item in job.items]
+            self.batch_size_histogram.observe(len(items))
+            try:
+                results = self.run_batch(items, **batch[0].kwargs)
+            except Exception as e:
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+            offset = 0
+            for job in batch:
+                job.future.set_result(results[offset:offset + len(job.items)])
+                offset += len(job.items)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            queued, dropped = len(self._queue), self._dropped_jobs
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "queued_jobs": queued,
+            "dropped_jobs": dropped,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+        }
+
+
+class BatchingEmbedder:
+    """ห่อ SentenceTransformer: encode() ผ่าน Scheduler ส่วน Attribute อื่นส่งต่อให้โมเดลเดิม"""
+    schedules_batches = True
+
+    def __init__(self, model, window_ms: Optional[float] = None, max_batch_size: Optional[int] = None):
+        self.model = model
+        self.scheduler = InferenceScheduler(
+            "embedder", lambda texts, **kw: encode_texts(model, texts, **kw), window_ms, max_batch_size
+        )
+
+    def encode(self, sentences, convert_to_numpy: bool = True, show_progress_bar: bool = False,
+               batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        # batch_size ถูกละไว้: Scheduler เป็นผู้จัด Batch เอง
+        single = isinstance(sentences, str)
+        vectors = self.scheduler.run([sentences] if single else list(sentences), **kwargs)
+        return vectors[0] if single else vectors
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class BatchingReranker:
+    """ห่อ CrossEncoder: predict() ผ่าน Scheduler ส่วน Attribute อื่นส่งต่อให้โมเดลเดิม"""
+    schedules_batches = True
+
+    def __init__(self, model, window_ms: Optional[float] = None, max_batch_size: Optional[int] = None):
+        self.model = model
+        self.scheduler = InferenceScheduler(
+            "reranker", lambda pairs, **kw: predict_pairs(model, pairs, **kw), window_ms, max_batch_size
+        )
+
+    def predict(self, sentences: Sequence[Tuple[str, str]], convert_to_numpy: bool = True,
+                show_progress_bar: bool = False, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        return self.scheduler.run([tuple(pair) for pair in sentences], **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
@@ -0,0 +1,190 @@
+# core/key_cooldowns.py
+# (V1.0 - Shared Key Cooldown Registry)
+# Cooldown ของ API Key ที่ทุก Process ใช้ร่วมกัน (เซิร์ฟเวอร์, uvicorn worker อื่น, knowledge_extractor_*.py)
+# - เก็บใน SQLite (WAL) เขียนแบบ UPSERT ที่เก็บค่าเวลาที่ไกลกว่าเสมอ จึงไม่มีใครย่น Cooldown ของคนอื่น
+# - เก็บเฉพาะ Hash ของคีย์ ไม่เก็บคีย์จริงลงดิสก์
+# - ฝั่งอ่านใช้ Snapshot ใน Memory ที่รีเฟรชไม่เกินทุก KEY_COOLDOWN_CACHE_SECONDS: Lookup บน Hot path เป็นแค่ dict
+# ถ้าไฟล์ใช้ไม่ได้ (ล็อก/สิทธิ์) จะเตือนแล้วทำงานแบบ Cooldown เฉพาะ Process ต่อไป
+# ล้าง Cooldown ที่ตั้งผิด (เช่น invalid_key 365 วัน) ได้ด้วย clear() หรือ:
+#   python -m core.key_cooldowns                          # ดู Cooldown ที่ยังมีผล
+#   python -m core.key_cooldowns --clear [--provider google] [--key abcd]   # abcd = 4 ตัวท้ายของคีย์
+
+import argparse
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.config import settings
+
+EXPIRED_RETENTION_SECONDS = 24 * 60 * 60
+
+
+def key_fingerprint(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+
+class CooldownRegistry:
+    def __init__(self, db_path: Optional[str] = None, cache_seconds: Optional[float] = None):
+        self.db_path = db_path or settings.KEY_COOLDOWN_DB
+        self.cache_seconds = settings.KEY_COOLDOWN_CACHE_SECONDS if cache_seconds is None else cache_seconds
+        self._lock = threading.Lock()
+        self._snapshot: Dict[str, Dict[str, float]] = {}
+        self._loaded_at = 0.0
+        self._disabled = False
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS key_cooldowns (
+                        provider TEXT NOT NULL, key_hash TEXT NOT NULL,
+                        cooldown_until REAL NOT NULL, reason TEXT, updated_at REAL NOT NULL,
+                        PRIMARY KEY (provider, key_hash)
+                    )
+                """)
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=2.0)
+
+    def _disable(self, error: Exception):
+        if not self._disabled:
+            print(f"⚠️ [Key Cooldowns] Shared registry '{self.db_path}' unavailable, using per-process cooldowns: {error}")
+        self._disabled = True
+
+    def snapshot(self, provider: str) -> Dict[str, float]:
+        """{key_hash: cooldown_until} ของคีย์ที่ยังติด Cooldown (อ่านจาก Cache ถ้ายังไม่หมดอายุ)"""
+        now = time.time()
+        with self._lock:
+            if self._disabled or now - self._loaded_at < self.cache_seconds:
+                return self._snapshot.get(provider, {})
+            self._loaded_at = now
+        try:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT provider, key_hash, cooldown_until FROM key_cooldowns WHERE cooldown_until > ?",
+                                    (now,)).fetchall()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return self._snapshot.get(provider, {})
+        snapshot: Dict[str, Dict[str, float]] = {}
+        for row_provider, key_hash, until in rows:
+            snapshot.setdefault(row_provider, {})[key_hash] = until
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot.get(provider, {})
+
+    def set_cooldown(self, provider: str, key: str, until: float, reason: str = ""):
+        """บันทึก Cooldown (เก็บค่าที่ไกลกว่าระหว่างของเดิมกับของใหม่) และอัปเดต Cache ของ Process นี้ทันที"""
+        key_hash = key_fingerprint(key)
+        with self._lock:
+            provider_snapshot = self._snapshot.setdefault(provider, {})
+            provider_snapshot[key_hash] = max(until, provider_snapshot.get(key_hash, 0.0))
+            if self._disabled:
+                return
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    INSERT INTO key_cooldowns (provider, key_hash, cooldown_until, reason, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(provider, key_hash) DO UPDATE SET
+                        reason = CASE WHEN excluded.cooldown_until > cooldown_until THEN excluded.reason ELSE reason END,
+                        cooldown_until = MAX(cooldown_until, excluded.cooldown_until),
+                        updated_at = excluded.updated_at
+                """, (provider, key_hash, until, reason, now))
+                conn.execute("DELETE FROM key_cooldowns WHERE cooldown_until < ?", (now - EXPIRED_RETENTION_SECONDS,))
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def entries(self) -> List[Tuple[str, str, float, str]]:
+        """(provider, key_hash, cooldown_until, reason) ของ Cooldown ที่ยังมีผล"""
+        if self._disabled:
+            return []
+        with self._connect() as conn:
+            return conn.execute("SELECT provider, key_hash, cooldown_until, reason FROM key_cooldowns "
+                                "WHERE cooldown_until > ? ORDER BY provider, cooldown_until DESC", (time.time(),)).fetchall()
+
+    def clear(self, provider: Optional[str] = None, key: Optional[str] = None) -> int:
+        """
+        ลบ Cooldown ของคีย์ (หรือทุกคีย์ของ provider / ทั้งหมด) ออกจาก Registry คืนจำนวนแถวที่ถูกลบ
+        Process อื่นที่รันอยู่ยังจำ Cooldown เดิมในหน่วยความจำ: ใช้ KeyScheduler.clear_cooldown() ในแต่ละ Process หรือรีสตาร์ท
+        """
+        conditions, params = [], []
+        if provider:
+            conditions.append("provider = ?")
+            params.append(provider)
+        if key:
+            conditions.append("key_hash = ?")
+            params.append(key_fingerprint(key))
+        with self._lock:
+            for snapshot_provider, provider_snapshot in self._snapshot.items():
+                if provider and snapshot_provider != provider:
+                    continue
+                if key:
+                    provider_snapshot.pop(key_fingerprint(key), None)
+                else:
+                    provider_snapshot.clear()
+            if self._disabled:
+                return 0
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            with self._connect() as conn:
+                return conn.execute(f"DELETE FROM key_cooldowns{where}", params).rowcount
+        except sqlite3.Error as e:
+            self._disable(e)
+            return 0
+
+
+_shared_registry: Optional[CooldownRegistry] = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_shared_registry() -> Optional[CooldownRegistry]:
+    """Registry เดียวต่อ Process (None ถ้าปิด KEY_COOLDOWN_SHARED)"""
+    global _shared_registry
+    if not settings.KEY_COOLDOWN_SHARED:
+        return None
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = CooldownRegistry()
+        return _shared_registry
+
+
+def _configured_keys() -> Dict[str, List[str]]:
+    return {"google": list(settings.GOOGLE_API_KEYS or []), "groq": list(settings.GROQ_API_KEYS or [])}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or clear API key cooldowns in the shared registry.")
+    parser.add_argument("--clear", action="store_true", help="Clear cooldowns (all, or filtered by --provider / --key)")
+    parser.add_argument("--provider", choices=["google", "groq"])
+    parser.add_argument("--key", help="Last characters of a configured API key")
+    args = parser.parse_args()
+
+    registry = CooldownRegistry()
+    configured = _configured_keys()
+    labels = {(provider, key_fingerprint(key)): f"...{key[-4:]}" for provider, keys in configured.items() for key in keys}
+
+    if args.clear:
+        if args.key:
+            matches = [(provider, key) for provider, keys in configured.items() for key in keys
+                       if key.endswith(args.key) and (args.provider in (None, provider))]
+            if not matches:
+                print(f"⚠️ No configured key ends with '{args.key}'.")
+                raise SystemExit(1)
+            removed = sum(registry.clear(provider, key) for provider, key in matches)
+        else:
+            removed = registry.clear(args.provider)
+        print(f"🧹 Cleared {removed} cooldown(s).")
+    else:
+        rows = registry.entries()
+        if not rows:
+            print("✅ No active key cooldowns.")
+        for provider, key_hash, until, reason in rows:
+            label = labels.get((provider, key_hash), key_hash[:8])
+            print(f"  {provider:<7} {label:<10} until {datetime.datetime.fromtimestamp(until):%Y-%m-%d %H:%M:%S} ({reason or '-'})")
@@ -0,0 +1,378 @@
+# core/key_scheduler.py
+# (V1.0 - Token-Bucket API Key Scheduler, Thread-safe & Non-sleeping)
+# ฐานร่วมของ ApiKeyManager (Google) และ GroqApiKeyManager
+# - ทุกสถานะ (Cooldown, Bucket, สถิติ) ถูกแก้ภายใต้ Lock เดียว จึงเรียกจากหลาย Thread ได้
+# - get_key() ไม่เคย sleep: เลือกคีย์ที่ "ว่างที่สุด" ทันที หรือโยน Error ถ้าทุกคีย์ติด Cooldown (สคริปต์ Extractor)
+# - acquire() รอ (interruptible_sleep: ตื่นทันทีเมื่อ Request ถูกยกเลิก) จนกว่า Bucket ของคีย์ใดคีย์หนึ่งจะมี Token
+#   call_llm() ของทุก Agent ขอคีย์ผ่านทางนี้
+# - Token Bucket ต่อคีย์: RPM และ TPM ตั้งจาก Config หรือ "เรียนรู้" จาก 429
+#   RPM: ลดเหลือ ~90% ของจำนวน Request ใน 60 วินาทีที่ผ่านมา
+#   TPM: ใช้ขีดจำกัดที่ API บอกมา (ถ้ามี) ไม่เช่นนั้น ~90% ของ Token ที่ใช้จริงใน 60 วินาทีที่ผ่านมา (จาก report_usage())
+#   แล้วเพิ่มทีละ 25% ทุก KEY_LIMIT_RECOVERY_SECONDS ที่ไม่เจอ 429
+# - TPM หักตามจริงหลังได้คำตอบ (report_usage): คีย์ที่ Bucket ติดลบต้องรอจนเติมกลับเป็นบวกก่อน
+# - Cooldown ถูกแชร์ข้าม Process ผ่าน core/key_cooldowns.py (Bucket ยังเป็นของแต่ละ Process)
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
+
+from core.config import settings
+from core.key_cooldowns import CooldownRegistry, get_shared_registry, key_fingerprint
+from core.request_context import interruptible_sleep
+
+WINDOW_SECONDS = 60.0
+LEARNED_LIMIT_FACTOR = 0.9
+LIMIT_RECOVERY_FACTOR = 1.25
+_SHARED_REGISTRY = object()
+
+
+class AllKeysUnavailableError(Exception):
+    """ฐานของ Error เมื่อไม่มีคีย์ใดพร้อมใช้งาน (แต่ละ Provider มีคลาสย่อยของตัวเอง)"""
+    pass
+
+
+class TokenBucket:
+    """Bucket แบบเติมต่อเนื่อง: capacity Token ต่อ WINDOW_SECONDS ยอมให้ติดลบได้ (หนี้) เมื่อผู้เรียนแบบ Sync ใช้เกิน"""
+    def __init__(self, per_minute: float, now: float):
+        self.per_minute = float(per_minute)
+        self.tokens = self.per_minute
+        self.updated_at = now
+
+    def refill(self, now: float):
+        rate = self.per_minute / WINDOW_SECONDS
+        self.tokens = min(self.per_minute, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def seconds_until(self, amount: float) -> float:
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * WINDOW_SECONDS / self.per_minute
+
+    def set_limit(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.tokens = min(self.tokens, self.per_minute)
+
+
+class _KeyState:
+    __slots__ = ("rpm", "tpm", "requests", "tokens_used", "cooldown_until", "last_limited_at", "tpm_limited_at",
+                 "successes", "failures", "configured_rpm", "configured_tpm")
+
+    def __init__(self, rpm: int, tpm: int, now: float):
+        self.configured_rpm = rpm
+        self.configured_tpm = tpm
+        self.rpm: Optional[TokenBucket] = TokenBucket(rpm, now) if rpm > 0 else None
+        self.tpm: Optional[TokenBucket] = TokenBucket(tpm, now) if tpm > 0 else None
+        self.requests: Deque[float] = deque()
+        self.tokens_used: Deque[Tuple[float, float]] = deque()  # (เวลา, Token) จาก report_usage()
+        self.cooldown_until = 0.0
+        self.last_limited_at = 0.0
+        self.tpm_limited_at = 0.0
+        self.successes = 0
+        self.failures = 0
+
+
+def mask_key(key: str) -> str:
+    return f"...{key[-4:]}"
+
+
+class KeyScheduler:
+    """
+    ตัวจัดสรร API Key แบบ Least-loaded: ในคีย์ที่ไม่ติด Cooldown เลือกคีย์ที่ใช้ Bucket ไปน้อยที่สุด
+    (ถ้ายังไม่รู้ขีดจำกัด ใช้จำนวน Request ใน 60 วินาทีล่าสุด) เสมอกันให้วนแบบ Round-robin
+    คลาสย่อยกำหนด provider, label, error_class, cooldowns และ throttle_seconds
+    """
+    provider = "default"
+    label = "Key Scheduler"
+    error_class: Type[AllKeysUnavailableError] = AllKeysUnavailableError
+    cooldowns: Dict[str, float] = {"rate_limit": 65, "generic": 65}
+    default_cooldown = 65
+    throttle_seconds = 2.0
+
+    def __init__(self, keys: List[str], silent: bool = False, rpm: int = 0, tpm: int = 0,
+                 registry: Optional[CooldownRegistry] = _SHARED_REGISTRY):
+        self.all_keys = list(keys or [])
+        self.silent = silent
+        # registry=None = Cooldown เฉพาะ Process นี้
+        self.registry = get_shared_registry() if registry is _SHARED_REGISTRY else registry
+        self._fingerprints = {key: key_fingerprint(key) for key in self.all_keys}
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._states: Dict[str, _KeyState] = {key: _KeyState(rpm, tpm, now) for key in self.all_keys}
+        self.current_index = 0
+        self.last_failure_time: float = 0.0
+        self.failure_streak: int = 0
+
+    # --- Cooldown (เวลาแบบ Wall-clock เพื่อให้ส่งต่อ/บันทึกข้าม Process ได้) ---
+
+    @property
+    def key_cooldowns(self) -> Dict[str, float]:
+        with self._lock:
+            return {key: state.cooldown_until for key, state in self._states.items()}
+
+    def _cooldown_until(self, key: str) -> float:
+        return self._states[key].cooldown_until
+
+    def _set_cooldown(self, key: str, until: float):
+        self._states[key].cooldown_until = until
+
+    def _shared_cooldowns(self) -> Dict[str, float]:
+        """Snapshot จาก Registry (เรียกก่อนถือ Lock: อาจอ่าน SQLite ไม่เกินครั้งละ KEY_COOLDOWN_CACHE_SECONDS)"""
+        return self.registry.snapshot(self.provider) if self.registry is not None else {}
+
+    def _merge_shared(self, shared: Dict[str, float]):
+        """รับ Cooldown ที่ Process อื่นบันทึกไว้ (ต้องถือ Lock อยู่)"""
+        if not shared:
+            return
+        for key, fingerprint in self._fingerprints.items():
+            until = shared.get(fingerprint)
+            if until is not None and until > self._states[key].cooldown_until:
+                self._states[key].cooldown_until = until
+
+    # --- การเลือกคีย์ ---
+
+    @staticmethod
+    def _recover(bucket: Optional[TokenBucket], configured: int, limited_at: float, now: float) -> float:
+        """ไม่เจอ 429 มานานพอ: ค่อยๆ คืนขีดจำกัดที่เรียนรู้ไว้ (ไม่เกินค่าที่ตั้งไว้ใน Config ถ้ามี) คืน limited_at ใหม่"""
+        if bucket is None or not limited_at or now - limited_at < settings.KEY_LIMIT_RECOVERY_SECONDS:
+            return limited_at
+        recovered = bucket.per_minute * LIMIT_RECOVERY_FACTOR
+        if configured and recovered >= configured:
+            bucket.set_limit(configured)
+            return 0.0
+        bucket.set_limit(recovered)
+        return now
+
+    def _refresh(self, state: _KeyState, now: float):
+        while state.requests and now - state.requests[0] > WINDOW_SECONDS:
+            state.requests.popleft()
+        while state.tokens_used and now - state.tokens_used[0][0] > WINDOW_SECONDS:
+            state.tokens_used.popleft()
+        for bucket in (state.rpm, state.tpm):
+            if bucket is not None:
+                bucket.refill(now)
+        state.last_limited_at = self._recover(state.rpm, state.configured_rpm, state.last_limited_at, now)
+        state.tpm_limited_at = self._recover(state.tpm, state.configured_tpm, state.tpm_limited_at, now)
+
+    def _load(self, state: _KeyState) -> float:
+        loads = [1.0 - bucket.tokens / bucket.per_minute for bucket in (state.rpm, state.tpm) if bucket is not None]
+        return max(loads) if loads else float(len(state.requests))
+
+    def _wait_seconds(self, key: str, state: _KeyState, tokens: float, now: float, wall_now: float) -> float:
+        wait = max(0.0, self._cooldown_until(key) - wall_now)
+        if state.rpm is not None:
+            wait = max(wait, state.rpm.seconds_until(1))
+        if state.tpm is not None:
+            # ไม่รู้จำนวน Token ล่วงหน้า: อย่างน้อยต้องไม่ติดหนี้จากคำตอบก่อนหน้า
+            wait = max(wait, state.tpm.seconds_until(min(tokens, state.tpm.per_minute) if tokens else 1))
+        return wait
+
+    def _choose(self, tokens: float, allow_debt: bool):
+        """คืน (key, 0) ถ้ามีคีย์พร้อม ไม่เช่นนั้น (None, เวลารอที่สั้นที่สุด) ต้องถือ Lock อยู่"""
+        now, wall_now = time.monotonic(), time.time()
+        best_key, best_load, shortest_wait = None, None, None
+        count = len(self.all_keys)
+        for offset in range(count):
+            key = self.all_keys[(self.current_index + offset) % count]
+            state = self._states[key]
+            self._refresh(state, now)
+            if self._cooldown_until(key) > wall_now:
+                wait = self._cooldown_until(key) - wall_now
+            else:
+                wait = 0.0 if allow_debt else self._wait_seconds(key, state, tokens, now, wall_now)
+            if wait > 0:
+                shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+                continue
+            load = self._load(state)
+            if best_load is None or load < best_load:
+                best_key, best_load = key, load
+        return best_key, shortest_wait
+
+    def _take(self, key: str, tokens: float) -> str:
+        state = self._states[key]
+        state.requests.append(time.monotonic())
+        if state.rpm is not None:
+            state.rpm.tokens -= 1
+        if state.tpm is not None and tokens:
+            state.tpm.tokens -= tokens
+        self.current_index = (self.all_keys.index(key) + 1) % len(self.all_keys)
+        self.failure_streak = 0
+        return key
+
+    def get_key(self, tokens: float = 0) -> str:
+        """
+        คืนคีย์ที่ว่างที่สุดทันทีโดยไม่ sleep (ผู้เรียนแบบ Sync ใช้เกิน Bucket ได้ เป็นหนี้ที่ acquire() จะเคารพ)
+        โยน error_class ถ้าทุกคีย์ติด Cooldown
+        """
+        if not self.all_keys:
+            raise self.error_class(f"No {self.label} API keys were provided to the manager.")
+        shared = self._shared_cooldowns()
+        with self._lock:
+            self._merge_shared(shared)
+            key, _ = self._choose(tokens, allow_debt=False)
+            if key is None:
+                key, _ = self._choose(tokens, allow_debt=True)
+            if key is None:
+                raise self.error_class(f"All {len(self.all_keys)} keys are on cooldown. Try again later.")
+            return self._take(key, tokens)
+
+    def acquire(self, tokens: float = 0, timeout: Optional[float] = None) -> str:
+        """
+        รอจนกว่าจะมีคีย์ที่ Bucket (RPM/TPM) มี Token และไม่ติด Cooldown แล้วคืนคีย์นั้น
+        รอด้วย interruptible_sleep: Request ที่ถูกยกเลิกหรือหมดเวลาหยุดรอทันที (RequestCancelled)
+        เคารพช่วงหน่วงหลังล้มเหลวติดกัน (throttle_seconds) แทนการ time.sleep แบบเดิม
+        โยน error_class เมื่อรอเกิน timeout (ค่าเริ่มต้น KEY_ACQUIRE_TIMEOUT_SECONDS)
+        """
+        if not self.all_keys:
+            raise self.error_class(f"No {self.label} API keys were provided to the manager.")
+        deadline = time.monotonic() + (settings.KEY_ACQUIRE_TIMEOUT_SECONDS if timeout is None else timeout)
+        while True:
+            shared = self._shared_cooldowns()
+            with self._lock:
+                self._merge_shared(shared)
+                throttle = 0.0
+                if self.failure_streak >= len(self.all_keys) / 2:
+                    throttle = max(0.0, self.throttle_seconds - (time.time() - self.last_failure_time))
+                key, wait = self._choose(tokens, allow_debt=False) if not throttle else (None, throttle)
+                if key is not None:
+                    return self._take(key, tokens)
+            remaining = deadline - time.monotonic()
+            if wait is None or wait > remaining:
+                raise self.error_class(f"No {self.label} key became available within the timeout "
+                                       f"(next in {wait or 0:.1f}s).")
+            interruptible_sleep(min(wait, 1.0))
+
+    # --- Feedback จากผู้เรียก ---
+
+    def report_usage(self, key: str, tokens: float = 0):
+        """รายงานการเรียกที่สำเร็จพร้อม Token ที่ใช้จริง: หักจาก TPM (ถ้ามี) และเก็บไว้เรียนรู้ TPM เมื่อเจอ 429"""
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return
+            state.successes += 1
+            if tokens:
+                now = time.monotonic()
+                state.tokens_used.append((now, float(tokens)))
+                if state.tpm is not None:
+                    state.tpm.refill(now)
+                    state.tpm.tokens -= tokens
+
+    def report_failure(self, failed_key: str, error_type: str = "generic", retry_after: Optional[float] = None,
+                       limited_on: str = "requests", stated_limit: Optional[float] = None):
+        """
+        รายงานว่าคีย์ใช้งานไม่ได้: ตั้ง Cooldown ตามประเภท Error (หรือ retry_after ถ้า API บอกมา)
+        ถ้าเป็น rate_limit จะเรียนรู้ขีดจำกัดของคีย์: limited_on="requests" เรียนรู้ RPM จากจำนวน Request ใน 60 วินาทีล่าสุด
+        limited_on="tokens" เรียนรู้ TPM จาก stated_limit (ขีดจำกัดที่ API บอกมา) หรือ Token ที่ใช้ใน 60 วินาทีล่าสุด
+        """
+        with self._lock:
+            state = self._states.get(failed_key)
+            if state is None:
+                return
+            self.last_failure_time = time.time()
+            self.failure_streak += 1
+            state.failures += 1
+
+            cooldown_duration = retry_after if retry_after is not None else self.cooldowns.get(error_type, self.default_cooldown)
+            cooldown_until = time.time() + cooldown_duration
+            self._set_cooldown(failed_key, cooldown_until)
+
+            if error_type == "rate_limit" and limited_on == "tokens":
+                self._learn_tpm(state, stated_limit)
+            elif error_type == "rate_limit":
+                now = time.monotonic()
+                self._refresh(state, now)
+                learned = max(1, int(len(state.requests) * LEARNED_LIMIT_FACTOR))
+                if state.rpm is None:
+                    state.rpm = TokenBucket(learned, now)
+                elif learned < state.rpm.per_minute:
+                    state.rpm.set_limit(learned)
+                state.rpm.tokens = min(state.rpm.tokens, 0.0)
+                state.last_limited_at = now
+
+            self.current_index = (self.all_keys.index(failed_key) + 1) % len(self.all_keys)
+            streak = self.failure_streak
+
+        if self.registry is not None:
+            self.registry.set_cooldown(self.provider, failed_key, cooldown_until, error_type)
+        if not self.silent:
+            print(f"🔻 [{self.label}] Key '{mask_key(failed_key)}' failed ({error_type}). Cooldown for {cooldown_duration:.0f}s. Streak: {streak}")
+
+    def _learn_tpm(self, state: _KeyState, stated_limit: Optional[float]):
+        """ตั้ง/ลด TPM หลังเจอ 429 ที่เกิดจาก Token (ต้องถือ Lock อยู่); ไม่รู้ทั้งขีดจำกัดและการใช้งาน = ลด Bucket เดิม 10%"""
+        now = time.monotonic()
+        self._refresh(state, now)
+        used = sum(tokens for _, tokens in state.tokens_used)
+        learned = stated_limit or (used * LEARNED_LIMIT_FACTOR if used else 0)
+        if not learned and state.tpm is not None:
+            learned = state.tpm.per_minute * LEARNED_LIMIT_FACTOR
+        if not learned:
+            return
+        if state.tpm is None:
+            state.tpm = TokenBucket(learned, now)
+        elif learned < state.tpm.per_minute:
+            state.tpm.set_limit(learned)
+        state.tpm.tokens = min(state.tpm.tokens, 0.0)
+        state.tpm_limited_at = now
+
+    def clear_cooldown(self, key: Optional[str] = None) -> int:
+        """ล้าง Cooldown ของคีย์ (หรือทุกคีย์) ทั้งใน Process นี้และใน Registry ที่แชร์ คืนจำนวนคีย์ที่ถูกล้าง"""
+        keys = [key] if key is not None else list(self.all_keys)
+        with self._lock:
+            keys = [k for k in keys if k in self._states]
+            for k in keys:
+                self._states[k].cooldown_until = 0.0
+        if self.registry is not None:
+            for k in keys:
+                self.registry.clear(self.provider, k)
+        return len(keys)
+
+    def _rotate(self):
+        """หมุน index ไปยังคีย์ตัวถัดไปในลิสต์"""
+        if not self.all_keys:
+            return
+        with self._lock:
+            self.current_index = (self.current_index + 1) % len(self.all_keys)
+
+    # --- สถานะ ---
+
+    def get_active_key_count(self) -> int:
+        """คืนค่าจำนวนคีย์ที่ไม่ติด Cooldown ในขณะนี้"""
+        shared = self._shared_cooldowns()
+        with self._lock:
+            self._merge_shared(shared)
+            now = time.time()
+            return sum(1 for key in self.all_keys if now >= self._cooldown_until(key))
+
+    def metrics(self) -> Dict[str, Any]:
+        """การใช้งานต่อคีย์ (คีย์ถูกปิดเหลือ 4 ตัวท้าย) สำหรับ /metrics/keys"""
+        shared = self._shared_cooldowns()
+        with self._lock:
+            self._merge_shared(shared)
+            now, wall_now = time.monotonic(), time.time()
+            keys = []
+            for key in self.all_keys:
+                state = self._states[key]
+                self._refresh(state, now)
+                keys.append({
+                    "key": mask_key(key),
+                    "available": self._cooldown_until(key) <= wall_now,
+                    "cooldown_remaining_seconds": round(max(0.0, self._cooldown_until(key) - wall_now), 1),
+                    "requests_last_minute": len(state.requests),
+                    "rpm_limit": round(state.rpm.per_minute, 1) if state.rpm else None,
+                    "rpm_learned": bool(state.rpm and state.last_limited_at),
+                    "tpm_limit": round(state.tpm.per_minute) if state.tpm else None,
+                    "tpm_learned": bool(state.tpm and state.tpm_limited_at),
+                    "tokens_last_minute": round(sum(tokens for _, tokens in state.tokens_used)),
+                    "utilization": round(self._load(state), 3) if state.rpm else None,
+                    "successes": state.successes,
+                    "failures": state.failures,
+                })
+            return {
+                "keys": keys,
+                "total_keys": len(self.all_keys),
+                "available_keys": sum(1 for k in keys if k["available"]),
+                "failure_streak": self.failure_streak,
+                "requests_last_minute": sum(k["requests_last_minute"] for k in keys),
+                "shared_cooldowns": self.registry is not None,
+            }
@@ -0,0 +1,89 @@
+# core/kg_checkpoint.py
+# (V1.0 - Knowledge Graph Extraction Checkpoint Store)
+# บันทึกว่า Chunk ใดของไฟล์หนังสือถูกสกัดและเขียนลง Neo4j แล้ว แทนการเขียนบรรทัดที่เหลือกลับลงไฟล์ต้นฉบับ
+# - ไฟล์ .jsonl ใน data/books/ ไม่ถูกแก้ไขหรือย้ายอีกต่อไป: รันซ้ำกี่ครั้งก็ข้ามเฉพาะ Chunk ที่เสร็จแล้ว
+# - chunk_id = Hash ของเนื้อหาบรรทัด (ไม่ใช่เลขบรรทัด) แก้ไข/แทรกบรรทัดในไฟล์แล้ว Chunk เดิมยังถูกจำได้
+# - Chunk ถูกบันทึกว่า done หลังเขียน Neo4j สำเร็จเท่านั้น (ตายกลางทาง = สกัดใหม่ ซึ่งปลอดภัยเพราะเขียนด้วย MERGE)
+# - Chunk ที่ล้มเหลวเกิน KG_MAX_CHUNK_ATTEMPTS ครั้งถูกข้าม (ไม่ให้ Chunk เสียวนกินโควต้าทุกรอบ) ล้างได้ด้วย reset_failed()
+# SQLite (WAL) ใช้ได้จากหลาย Thread/หลาย Process พร้อมกัน
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Iterable, Optional, Set
+
+from core.config import settings
+
+
+def chunk_id(line: str) -> str:
+    return hashlib.sha256(line.strip().encode("utf-8")).hexdigest()[:32]
+
+
+class ExtractionCheckpoint:
+    def __init__(self, db_path: Optional[str] = None, max_attempts: Optional[int] = None):
+        self.db_path = db_path or settings.KG_CHECKPOINT_DB
+        self.max_attempts = max_attempts or settings.KG_MAX_CHUNK_ATTEMPTS
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS kg_chunks (
+                    file TEXT NOT NULL, chunk_id TEXT NOT NULL, status TEXT NOT NULL,
+                    provider TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at REAL NOT NULL,
+                    PRIMARY KEY (file, chunk_id)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0)
+
+    def skip_ids(self, file: str) -> Set[str]:
+        """Chunk ที่ไม่ต้องสกัดอีก: เสร็จแล้ว หรือล้มเหลวครบจำนวนครั้งที่อนุญาต"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT chunk_id FROM kg_chunks WHERE file = ? AND (status = 'done' OR attempts >= ?)",
+                                (file, self.max_attempts)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_done(self, file: str, chunk_ids: Iterable[str], provider: str = ""):
+        now = time.time()
+        rows = [(file, cid, provider, now) for cid in chunk_ids]
+        if not rows:
+            return
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany("""
+                INSERT INTO kg_chunks (file, chunk_id, status, provider, updated_at) VALUES (?, ?, 'done', ?, ?)
+                ON CONFLICT (file, chunk_id) DO UPDATE SET status = 'done', provider = excluded.provider,
+                    error = NULL, updated_at = excluded.updated_at
+            """, rows)
+
+    def mark_failed(self, file: str, cid: str, error: str, provider: str = ""):
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("""
+                INSERT INTO kg_chunks (file, chunk_id, status, provider, attempts, error, updated_at)
+                VALUES (?, ?, 'failed', ?, 1, ?, ?)
+                ON CONFLICT (file, chunk_id) DO UPDATE SET attempts = attempts + 1, provider = excluded.provider,
+                    error = excluded.error, updated_at = excluded.updated_at
+                WHERE status != 'done'
+            """, (file, cid, provider, error[:500], time.time()))
+
+    def reset_failed(self, file: Optional[str] = None) -> int:
+        """ให้ Chunk ที่ล้มเหลวถูกลองใหม่ในรอบถัดไป คืนจำนวนที่ถูกล้าง"""
+        with self._lock, closing(self._connect()) as conn, conn:
+            if file:
+                cursor = conn.execute("DELETE FROM kg_chunks WHERE status = 'failed' AND file = ?", (file,))
+            else:
+                cursor = conn.execute("DELETE FROM kg_chunks WHERE status = 'failed'")
+            return cursor.rowcount
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """{file: {"done": n, "failed": n}} สำหรับรายงานความคืบหน้า"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT file, status, COUNT(*) FROM kg_chunks GROUP BY file, status").fetchall()
+        result: Dict[str, Dict[str, int]] = {}
+        for file, status, count in rows:
+            result.setdefault(file, {"done": 0, "failed": 0})[status] = count
+        return result
@@ -0,0 +1,318 @@
+# core/kg_job_queue.py
+# (V1.0 - Unified, Adaptive Knowledge Graph Extraction Queue)
+# คิวงานเดียวสำหรับสกัด Knowledge Graph จากทุกไฟล์หนังสือ ใช้ Extractor หลาย Provider (Gemini + Groq) พร้อมกันได้
+# - Feeder อ่านไฟล์ทีละบรรทัดแล้วส่งเข้าคิว (ข้าม Chunk ที่ ExtractionCheckpoint บอกว่าเสร็จแล้ว)
+# - Worker ของแต่ละ Provider ดึงงานจากคิวเดียวกัน: Provider ที่เร็วกว่า/มีคีย์ว่างมากกว่าได้งานมากกว่าเอง
+# - จำนวนงานพร้อมกันต่อ Provider ปรับเองด้วย AdaptiveConcurrency (AIMD):
+#   เพิ่มทีละ 1 เมื่อสำเร็จต่อเนื่อง, ลดครึ่งหนึ่งเมื่อคีย์ของ Provider นั้นโดน 429/โควต้า
+#   และไม่เกิน (จำนวนคีย์ที่ว่าง x KG_WORKERS_PER_KEY)
+# - ทุกคีย์ของ Provider ติด Cooldown: คืนงานเข้าคิวแล้วพัก Provider นั้นจนคีย์แรกว่าง (นานเกิน KG_MAX_PAUSE_SECONDS = เลิกใช้ในรอบนี้)
+# - Error ชั่วคราวของ Chunk (429/โควต้า/5xx/Timeout): คืนงานไปท้ายคิวพร้อม Backoff แบบ Jitter (5xx/Timeout พัก Provider ด้วย)
+#   นับจำนวนครั้งต่อ Chunk ครบ KG_MAX_CHUNK_ATTEMPTS แล้วบันทึกเป็นล้มเหลว (ไม่วนเรียก API ไม่รู้จบ)
+# - ผลลัพธ์ถูกเขียนลง Neo4j เป็น Batch แล้วจึงบันทึก Checkpoint: หยุดกลางทางเมื่อไหร่ก็รันต่อได้
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from tqdm import tqdm
+
+from core.config import settings
+from core.key_scheduler import AllKeysUnavailableError
+from core.kg_checkpoint import ExtractionCheckpoint, chunk_id
+from core.retry_policy import DEFAULT_POLICY, classify_error
+
+# Error ชั่วคราว: คืนงานไปท้ายคิวให้ลองใหม่ภายหลัง (นับครั้งต่อ Chunk ไม่เกิน KG_MAX_CHUNK_ATTEMPTS)
+TRANSIENT_ERRORS = ("rate_limit", "quota", "server_error", "timeout")
+# Error ฝั่งเซิร์ฟเวอร์: พัก Provider ทั้งตัวชั่วครู่ด้วย (ยิงต่อทันทีมีแต่จะเจอ Error ซ้ำ)
+BACKOFF_ERRORS = ("server_error", "timeout")
+
+
+@dataclass
+class ExtractionJob:
+    file: str
+    chunk_id: str
+    line: str
+    attempts: int = 0        # จำนวนครั้งที่ล้มเหลวด้วย Error ชั่วคราวในรอบนี้
+    not_before: float = 0.0  # เวลา (monotonic) ที่ลองใหม่ได้
+
+
+class AdaptiveConcurrency:
+    """
+    ขีดจำกัดงานพร้อมกันของ Provider หนึ่งตัว (AIMD) อ่านสัญญาณจาก Key Manager โดยตรง:
+    จำนวนความล้มเหลวของคีย์ที่เพิ่มขึ้น = โดน Rate limit, จำนวนคีย์ที่ไม่ติด Cooldown = เพดาน
+    """
+    def __init__(self, key_manager: Any, max_limit: Optional[int] = None, per_key: Optional[int] = None, min_limit: int = 1):
+        self.key_manager = key_manager
+        self.max_limit = max_limit or settings.KG_MAX_WORKERS_PER_PROVIDER
+        self.per_key = per_key or settings.KG_WORKERS_PER_KEY
+        self.min_limit = min_limit
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._successes = 0
+        self._failures_seen = self._key_failures()
+        self.limit = max(self.min_limit, min(self.max_limit, self.key_manager.get_active_key_count()))
+        self.increases = 0
+        self.decreases = 0
+
+    def _key_failures(self) -> int:
+        return sum(key["failures"] for key in self.key_manager.metrics()["keys"])
+
+    def _ceiling(self) -> int:
+        return max(self.min_limit, min(self.max_limit, self.key_manager.get_active_key_count() * self.per_key))
+
+    def acquire(self, should_stop: Callable[[], bool]) -> bool:
+        """รอจนได้ช่องทำงาน คืน False ถ้า should_stop() เป็นจริงระหว่างรอ (ถูกสั่งหยุด/ไม่มีงานเหลือ)"""
+        with self._cond:
+            while not should_stop():
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return True
+                self._cond.wait(min(max(pause, 0.05), 0.5))
+            return False
+
+    def release(self, success: Optional[bool]):
+        """คืนช่องทำงาน success: True = สำเร็จ, False = ล้มเหลว, None = ไม่ได้ทำงาน (คิวว่าง)"""
+        failures = self._key_failures() if success is not None else None
+        ceiling = self._ceiling() if success is not None else None
+        with self._cond:
+            self.in_flight -= 1
+            if failures is not None:
+                if failures > self._failures_seen:
+                    # มีคีย์โดน 429/โควต้าตั้งแต่ครั้งก่อน: ลดครึ่งหนึ่ง (นับครั้งเดียวต่อชุดความล้มเหลว)
+                    self.limit = max(self.min_limit, self.limit // 2)
+                    self._successes = 0
+                    self.decreases += 1
+                elif success:
+                    self._successes += 1
+                    if self._successes >= self.limit:
+                        self.limit += 1
+                        self._successes = 0
+                        self.increases += 1
+                self._failures_seen = failures
+                self.limit = min(self.limit, ceiling)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.limit = self.min_limit
+            self._cond.notify_all()
+
+
+class ExtractionJobQueue:
+    """
+    extractors: Extractor ของแต่ละ Provider (KnowledgeGraphExtractorGemini / KnowledgeGraphExtractorLlama)
+    ต้องมี key_manager, _process_single_chunk(line, max_retries) และ _write_batch_to_neo4j(graphs)
+    """
+    def __init__(self, extractors: List[Any], checkpoint: Optional[ExtractionCheckpoint] = None,
+                 batch_size: int = 30, max_workers: Optional[int] = None):
+        if not extractors:
+            raise ValueError("ExtractionJobQueue needs at least one extractor.")
+        self.extractors = {extractor.key_manager.provider: extractor for extractor in extractors}
+        self.checkpoint = checkpoint or ExtractionCheckpoint()
+        self.batch_size = batch_size
+        self.max_workers = max_workers or settings.KG_MAX_WORKERS_PER_PROVIDER
+        self.controllers = {name: AdaptiveConcurrency(extractor.key_manager, self.max_workers)
+                            for name, extractor in self.extractors.items()}
+        self._jobs: "queue.Queue[ExtractionJob]" = queue.Queue(maxsize=self.max_workers * len(self.extractors) * 4)
+        self._retry: Deque[ExtractionJob] = deque()
+        self._results: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._feeding_done = threading.Event()
+        self._active_jobs = 0
+        self._retired: Dict[str, str] = {}
+        self.stats = {"queued": 0, "done": 0, "failed": 0, "requeued": 0, "skipped": 0,
+                      "completed_by": {name: 0 for name in self.extractors}}
+
+    # --- Feeder ---
+    def _feed(self, file_paths: List[str]):
+        try:
+            for file_path in file_paths:
+                file_name = os.path.basename(file_path)
+                skip = self.checkpoint.skip_ids(file_name)
+                queued = skipped = 0
+                with open(file_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if self._stop.is_set():
+                            return
+                        if not line.strip():
+                            continue
+                        cid = chunk_id(line)
+                        if cid in skip:
+                            skipped += 1
+                            continue
+                        skip.add(cid)
+                        self._put(ExtractionJob(file_name, cid, line))
+                        queued += 1
+                self.stats["skipped"] += skipped
+                print(f"  - 📖 {file_name}: {queued} chunk(s) queued, {skipped} already done/skipped.")
+        finally:
+            self._feeding_done.set()
+
+    def _put(self, job: ExtractionJob):
+        while not self._stop.is_set():
+            try:
+                self._jobs.put(job, timeout=0.5)
+                self.stats["queued"] += 1
+                return
+            except queue.Full:
+                continue
+
+    def _take_due_retry(self) -> Optional[ExtractionJob]:
+        """งานที่คืนเข้าคิวและพ้นเวลา Backoff แล้ว (ต้องถือ Lock อยู่)"""
+        now = time.monotonic()
+        for job in self._retry:
+            if job.not_before <= now:
+                self._retry.remove(job)
+                return job
+        return None
+
+    def _next_job(self) -> Optional[ExtractionJob]:
+        # งานใหม่ในคิวก่อน งานที่คืนเข้าคิวอยู่ท้ายสุด (และต้องพ้นเวลา Backoff)
+        try:
+            job = self._jobs.get_nowait()
+        except queue.Empty:
+            job = None
+        with self._lock:
+            job = job or self._take_due_retry()
+            if job is not None:
+                self._active_jobs += 1
+                return job
+        try:
+            job = self._jobs.get(timeout=0.2)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._active_jobs += 1
+        return job
+
+    def _drained(self) -> bool:
+        with self._lock:
+            return self._feeding_done.is_set() and self._jobs.empty() and not self._retry and self._active_jobs == 0
+
+    # --- Worker ---
+    def _pause_seconds(self, key_manager: Any) -> float:
+        remaining = [key["cooldown_remaining_seconds"] for key in key_manager.metrics()["keys"]]
+        return max(1.0, min(remaining, default=1.0))
+
+    def _worker(self, provider: str):
+        extractor = self.extractors[provider]
+        controller = self.controllers[provider]
+        max_retries = len(extractor.key_manager.all_keys)
+        should_stop = lambda: self._stop.is_set() or provider in self._retired or self._drained()
+        while not should_stop():
+            if not controller.acquire(should_stop):
+                return
+            job = self._next_job()
+            if job is None:
+                controller.release(None)
+                if self._drained():
+                    return
+                continue
+            success, requeue = False, False
+            try:
+                graph_data = extractor._process_single_chunk(job.line, max_retries)
+                self._results.put((job, provider, graph_data, None))
+                success = True
+            except AllKeysUnavailableError:
+                # ไม่ใช่ความผิดของ Chunk: ไม่นับครั้ง
+                requeue = True
+                pause = self._pause_seconds(extractor.key_manager)
+                if pause > settings.KG_MAX_PAUSE_SECONDS:
+                    self._retired[provider] = f"all keys cooling down for {pause:.0f}s"
+                    print(f"\n  - 💤 [{provider}] All keys cooling down for {pause:.0f}s; provider retired for this run.")
+                else:
+                    controller.pause(pause)
+            except Exception as e:
+                kind, retry_after = classify_error(e)
+                if kind not in TRANSIENT_ERRORS:
+                    self._results.put((job, provider, None, e))
+                else:
+                    job.attempts += 1
+                    if job.attempts >= self.checkpoint.max_attempts:
+                        self._results.put((job, provider, None, e))
+                    else:
+                        requeue = True
+                        delay = max(DEFAULT_POLICY.backoff(job.attempts), retry_after or 0.0)
+                        job.not_before = time.monotonic() + delay
+                        if kind in BACKOFF_ERRORS:
+                            controller.pause(delay)
+            finally:
+                with self._lock:
+                    if requeue:
+                        self._retry.append(job)
+                        self.stats["requeued"] += 1
+                    self._active_jobs -= 1
+                controller.release(success)
+
+    # --- Writer ---
+    def _flush(self, pending: List[tuple]):
+        graphs = [graph_data for _, _, graph_data in pending if graph_data]
+        if graphs:
+            next(iter(self.extractors.values()))._write_batch_to_neo4j(graphs)
+        by_file: Dict[tuple, List[str]] = {}
+        for job, provider, _ in pending:
+            by_file.setdefault((job.file, provider), []).append(job.chunk_id)
+        for (file_name, provider), chunk_ids in by_file.items():
+            self.checkpoint.mark_done(file_name, chunk_ids, provider)
+        self.stats["done"] += len(pending)
+
+    def run(self, file_paths: List[str]) -> Dict[str, Any]:
+        """สกัดทุก Chunk ที่ยังไม่เสร็จของไฟล์ที่กำหนด คืนสถิติของรอบนี้ (หยุดได้ทุกเมื่อด้วย Ctrl+C แล้วรันต่อภายหลัง)"""
+        started = time.time()
+        threads = [threading.Thread(target=self._feed, args=(file_paths,), daemon=True, name="kg-feeder")]
+        for provider in self.extractors:
+            threads += [threading.Thread(target=self._worker, args=(provider,), daemon=True, name=f"kg-{provider}-{i}")
+                        for i in range(self.max_workers)]
+        for thread in threads:
+            thread.start()
+        workers = threads[1:]
+
+        pending: List[tuple] = []
+        last_flush = time.monotonic()
+        progress = tqdm(desc="🧠 Extracting", unit="chunk")
+        try:
+            while True:
+                try:
+                    job, provider, graph_data, error = self._results.get(timeout=1.0)
+                    if error is not None:
+                        self.checkpoint.mark_failed(job.file, job.chunk_id, f"{type(error).__name__}: {error}", provider)
+                        self.stats["failed"] += 1
+                    else:
+                        pending.append((job, provider, graph_data))
+                        self.stats["completed_by"][provider] += 1
+                    progress.update(1)
+                    progress.set_postfix({name: f"{c.in_flight}/{c.limit}" for name, c in self.controllers.items()}, refresh=False)
+                except queue.Empty:
+                    pass
+                workers_alive = any(thread.is_alive() for thread in workers)
+                if pending and (len(pending) >= self.batch_size or not workers_alive
+                                or time.monotonic() - last_flush > settings.KG_FLUSH_INTERVAL_SECONDS):
+                    self._flush(pending)
+                    pending, last_flush = [], time.monotonic()
+                if not workers_alive and self._results.empty():
+                    break
+        except KeyboardInterrupt:
+            print("\n  - ⏸️ Interrupted: saving finished chunks; chunks still in flight will be redone next run.")
+            self._stop.set()
+            if pending:
+                self._flush(pending)
+        except Exception as e:
+            print(f"\n❌ Failed to write batch to Neo4j: {e}. Stopping; unwritten chunks will be retried next run.")
+        finally:
+            self._stop.set()
+            progress.close()
+
+        pending_left = self._jobs.qsize() + len(self._retry)
+        return dict(self.stats, duration=round(time.time() - started, 1), retired=dict(self._retired),
+                    halted=bool(pending_left) or not self._feeding_done.is_set(),
+                    concurrency={name: {"limit": c.limit, "increases": c.increases, "decreases": c.decreases}
+                                 for name, c in self.controllers.items()})
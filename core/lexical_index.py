@@ -0,0 +1,161 @@
+# core/lexical_index.py
+# (V1.0 - Thai-Aware BM25 Inverted Index)
+# ดัชนีคำ (Lexical Index) ที่สร้างคู่กับ FAISS ของแต่ละหมวดหมู่
+# ช่วยให้คำค้นที่เป็นชื่อเฉพาะ/ชื่อหนังสือ ("Atomic Habits", "ซุนวู") ไม่หลุดเมื่อ Embedding คลาดเคลื่อน
+
+import math
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from pythainlp.tokenize import word_tokenize as _thai_word_tokenize
+except ImportError:  # pythainlp เป็น dependency ที่ไม่บังคับ ถ้าไม่มีจะใช้ Bigram แทน
+    _thai_word_tokenize = None
+
+LEXICAL_INDEX_FILENAME = "lexical_index.npz"
+
+_THAI_RUN = re.compile(r"[\u0E00-\u0E7F]+")
+_TOKEN_RUN = re.compile(r"[\u0E00-\u0E7F]+|[^\W_]+", re.UNICODE)
+_THAI_MARKS_ONLY = re.compile(r"^[\u0E30-\u0E3A\u0E47-\u0E4E]+$")
+
+
+class ThaiTokenizer:
+    """
+    ตัดคำภาษาไทยด้วย pythainlp (newmm) ถ้ามีติดตั้งไว้ ไม่เช่นนั้นใช้ Character Bigram
+    ชื่อ engine จะถูกบันทึกลงใน Index เพื่อให้ฝั่งค้นหาตัดคำแบบเดียวกับตอนสร้างเสมอ
+    """
+    def __init__(self, engine: Optional[str] = None):
+        if engine is None:
+            engine = "newmm" if _thai_word_tokenize else "bigram"
+        if engine == "newmm" and _thai_word_tokenize is None:
+            raise RuntimeError("Lexical index was built with 'newmm' but pythainlp is not installed.")
+        if engine not in ("newmm", "bigram"):
+            raise ValueError(f"Unknown Thai tokenizer engine: '{engine}'")
+        self.engine = engine
+
+    def _segment_thai(self, run: str) -> List[str]:
+        if self.engine == "newmm":
+            return [w for w in _thai_word_tokenize(run, engine="newmm", keep_whitespace=False) if w.strip()]
+        if len(run) < 2:
+            return [run]
+        return [run[i:i + 2] for i in range(len(run) - 1)]
+
+    def tokenize(self, text: str) -> List[str]:
+        if not text:
+            return []
+        tokens = []
+        for run in _TOKEN_RUN.findall(text.lower()):
+            if _THAI_RUN.fullmatch(run):
+                tokens.extend(t for t in self._segment_thai(run) if not _THAI_MARKS_ONLY.match(t))
+            else:
+                tokens.append(run)
+        return tokens
+
+
+class BM25Index:
+    """
+    Inverted Index แบบ BM25 เก็บเป็น CSR Arrays (.npz) เพื่อให้ไฟล์เล็กและโหลดเร็ว
+    - vocab: รายการคำ (ลำดับคือ term id)
+    - offsets/doc_ids/tfs: Posting list ของแต่ละคำ
+    - doc_lens: ความยาวเอกสาร (จำนวน Token) สำหรับ Length Normalization
+    """
+    def __init__(self, vocab: Sequence[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_lens: np.ndarray, tokenizer: ThaiTokenizer,
+                 k1: float = 1.2, b: float = 0.75):
+        self.term_to_id: Dict[str, int] = {term: i for i, term in enumerate(vocab)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.num_docs = int(len(doc_lens))
+        self.avg_doc_len = float(doc_lens.mean()) if self.num_docs else 0.0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], tokenizer: Optional[ThaiTokenizer] = None,
+              k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        tokenizer = tokenizer or ThaiTokenizer()
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lens = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenizer.tokenize(text)
+            doc_lens.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc_id, tf))
+
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for i, term in enumerate(vocab):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for i, term in enumerate(vocab):
+            start, end = offsets[i], offsets[i + 1]
+            entries = postings[term]
+            doc_ids[start:end] = [d for d, _ in entries]
+            tfs[start:end] = [min(tf, np.iinfo(np.uint16).max) for _, tf in entries]
+
+        return cls(vocab, offsets, doc_ids, tfs, np.asarray(doc_lens, dtype=np.int32), tokenizer, k1, b)
+
+    def save(self, path: str):
+        vocab = np.array(sorted(self.term_to_id, key=self.term_to_id.get), dtype=np.str_)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            vocab=vocab, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs, doc_lens=self.doc_lens,
+            params=np.array([self.k1, self.b], dtype=np.float64),
+            tokenizer=np.array(self.tokenizer.engine),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = (float(x) for x in data["params"])
+            tokenizer = ThaiTokenizer(str(data["tokenizer"]))
+            return cls(data["vocab"].tolist(), data["offsets"], data["doc_ids"], data["tfs"],
+                       data["doc_lens"], tokenizer, k1, b)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """คืนค่า [(doc_id, bm25_score), ...] เรียงจากคะแนนมากไปน้อย"""
+        if not self.num_docs or top_k <= 0:
+            return []
+        term_ids = {self.term_to_id[t] for t in self.tokenizer.tokenize(query) if t in self.term_to_id}
+        if not term_ids:
+            return []
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[docs] / max(self.avg_doc_len, 1e-9))
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in ranked]
+
+
+def reciprocal_rank_fusion(ranked_lists: Iterable[Sequence], k: int = 60) -> List[Tuple[object, float]]:
+    """
+    รวมผลการค้นหาหลายรายการด้วย Reciprocal Rank Fusion: score(d) = Σ 1 / (k + rank)
+    รับ list ของ "key" ที่เรียงลำดับมาแล้ว คืนค่า [(key, rrf_score), ...] เรียงจากมากไปน้อย
+    """
+    fused: Dict[object, float] = {}
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
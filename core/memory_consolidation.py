@@ -0,0 +1,498 @@
+# core/memory_consolidation.py
+# (V1.0 - Incremental Memory Consolidation, In-Server)
+# แปลงบทสนทนาใน conversation_history เป็นความทรงจำระยะยาว (long_term_memories) แล้วเพิ่มเข้า Memory Index
+# - MemoryConsolidator : ขั้นตอนทั้งหมด (ดึง Chunk -> สกัด -> บันทึก -> Embed -> Index -> Archive) ใช้ทั้ง manage_memory.py และเซิร์ฟเวอร์
+# - เพิ่มเวกเตอร์ลง Back Buffer (สำเนา) ของ LiveIndex แล้วสลับทีเดียว ผู้ค้นหาเห็นความทรงจำใหม่ทันทีโดยไม่ต้อง Reload
+# - MemoryConsolidationWorker : Thread เบื้องหลังในเซิร์ฟเวอร์ ทำงานเมื่อครบรอบเวลาหรือมีข้อความค้างถึงเกณฑ์ พร้อม Metrics
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.atomic_files import TMP_SUFFIX, apply_commit_journal, commit_files_atomically
+from core.config import settings
+from core.embedding_cache import EmbeddingCache, cache_variant
+from core.memory_manager import DEFAULT_HISTORY_LIMIT
+from core.vector_index import META_SUFFIX, LiveIndex, build_index, read_index_meta, write_index
+
+MEMORY_FAISS_FILENAME = "memory_faiss.index"
+MEMORY_MAPPING_FILENAME = "memory_mapping.jsonl"
+
+
+def ensure_session_stats(conn: sqlite3.Connection):
+    """
+    session_stats: High-water mark ต่อ Session (ข้อความล่าสุด vs. ที่ประมวลผลแล้ว) ดูแลโดย Trigger ตอน INSERT
+    การหา Session ที่ค้างจึงเป็น Range Scan บน Partial Index แทนการ Scan conversation_history ทั้งตาราง
+    ครั้งแรกที่สร้าง Trigger จะเติมค่าจากข้อมูลเดิมใน Transaction เดียวกัน (ไม่พลาดข้อความที่เข้ามาระหว่างนั้น)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        backfill = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_ch_session_stats'").fetchone() is None
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_stats (
+                session_id TEXT PRIMARY KEY, last_message_id INTEGER NOT NULL,
+                last_message_at TIMESTAMP, last_processed_id INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_session_stats_pending ON session_stats(last_message_at)
+            WHERE last_message_id > last_processed_id
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_ch_session_stats AFTER INSERT ON conversation_history
+            BEGIN
+                INSERT INTO session_stats (session_id, last_message_id, last_message_at)
+                VALUES (NEW.session_id, NEW.id, NEW.timestamp)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    last_message_id = MAX(last_message_id, excluded.last_message_id),
+                    last_message_at = excluded.last_message_at;
+            END
+        """)
+        if backfill:
+            conn.execute("""
+                INSERT INTO session_stats (session_id, last_message_id, last_message_at, last_processed_id)
+                SELECT h.session_id, MAX(h.id), MAX(h.timestamp), COALESCE(s.last_processed_id, 0)
+                FROM conversation_history h
+                LEFT JOIN memory_processing_state s ON s.session_id = h.session_id
+                GROUP BY h.session_id
+                ON CONFLICT(session_id) DO UPDATE SET
+                    last_message_id = MAX(last_message_id, excluded.last_message_id),
+                    last_message_at = excluded.last_message_at,
+                    last_processed_id = excluded.last_processed_id
+            """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def fetch_pending_chunks(conn: sqlite3.Connection, num_sessions: int, chunk_size: int) -> List[Dict[str, Any]]:
+    """Chunk ถัดไป (สูงสุด chunk_size ข้อความ) ของ Session ที่ค้างอยู่ไม่เกิน num_sessions Session โดย Session ที่เงียบไปนานที่สุดมาก่อน"""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    # อ่านเฉพาะแถวใน Partial Index (ขนาดตามจำนวน Session ที่ค้าง ไม่ใช่ประวัติทั้งหมด)
+    sessions = cursor.execute("""
+        SELECT session_id, last_processed_id FROM session_stats
+        WHERE last_message_id > last_processed_id
+        ORDER BY last_message_at LIMIT ?
+    """, (num_sessions,)).fetchall()
+    if not sessions: return []
+
+    # Query เดียวสำหรับทุก Session: แต่ละส่วนเป็น Range Scan บน (session_id, id) จำกัด chunk_size แถว
+    branch = "SELECT * FROM (SELECT session_id, id, role, content, timestamp FROM conversation_history WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?)"
+    params = [value for session in sessions for value in (session['session_id'], session['last_processed_id'], chunk_size)]
+    messages_by_session: Dict[str, List[Dict]] = {session['session_id']: [] for session in sessions}
+    for row in cursor.execute(" UNION ALL ".join([branch] * len(sessions)), params):
+        message = dict(row)
+        messages_by_session[message.pop('session_id')].append(message)
+
+    chunks = []
+    for session_id, messages in messages_by_session.items():
+        messages.sort(key=lambda m: m['id'])
+        if messages:
+            chunks.append({
+                "session_id": session_id, "messages": messages,
+                "start_message_id": messages[0]['id'], "end_message_id": messages[-1]['id'],
+                "conversation_start_time": messages[0]['timestamp'],
+                "conversation_end_time": messages[-1]['timestamp']
+            })
+    stale = [session_id for session_id, messages in messages_by_session.items() if not messages]
+    if stale:
+        # High-water mark ชี้ไปยังข้อความที่ไม่มีอยู่แล้ว: ปิดไว้เพื่อไม่ให้กินโควตา num_sessions ทุกรอบ
+        cursor.executemany("UPDATE session_stats SET last_processed_id = last_message_id WHERE session_id = ?",
+                           [(session_id,) for session_id in stale])
+        conn.commit()
+    return chunks
+
+
+class MemoryConsolidator:
+    def __init__(self, embedder, model_name: str = "intfloat/multilingual-e5-large",
+                 db_path: str = "data/memory.db", index_dir: str = "data/memory_index",
+                 live: Optional[LiveIndex] = None):
+        self.DB_PATH = db_path
+        self.MEMORY_INDEX_DIR = index_dir
+        self.MEMORY_FAISS_PATH = os.path.join(index_dir, MEMORY_FAISS_FILENAME)
+        self.MEMORY_MAPPING_PATH = os.path.join(index_dir, MEMORY_MAPPING_FILENAME)
+
+        self.model = embedder
+        self.embedding_cache = EmbeddingCache(model_name, variant=cache_variant(embedder))
+        os.makedirs(index_dir, exist_ok=True)
+        apply_commit_journal(index_dir)
+        # ถ้าไม่ได้รับ LiveIndex ของเซิร์ฟเวอร์มา (เช่นรันจาก manage_memory.py) จะโหลดจากดิสก์เอง
+        self.live = live if live is not None else LiveIndex.load(self.MEMORY_FAISS_PATH, self.MEMORY_MAPPING_PATH)
+
+        self._ensure_db_schema()
+
+    def _ensure_db_schema(self):
+        """[UPGRADE] เพิ่มคอลัมน์สำหรับเก็บ 'ช่วงเวลา' ของบทสนทนา"""
+        with sqlite3.connect(self.DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS memory_processing_state (
+                    session_id TEXT PRIMARY KEY, last_processed_id INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS long_term_memories (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+                    title TEXT NOT NULL, summary TEXT NOT NULL, keywords TEXT,
+                    start_message_id INTEGER, end_message_id INTEGER,
+                    conversation_start_time TIMESTAMP,
+                    conversation_end_time TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_history (
+                    id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, session_id TEXT NOT NULL,
+                    role TEXT NOT NULL, content TEXT NOT NULL, agent_used TEXT
+                )
+            ''')
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS archived_conversations (
+                    id INTEGER, timestamp DATETIME, session_id TEXT,
+                    role TEXT, content TEXT, agent_used TEXT,
+                    PRIMARY KEY (session_id, id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ltm_session_id ON long_term_memories(session_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ch_session_id ON conversation_history(session_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ch_session_id_id ON conversation_history(session_id, id)")
+            conn.commit()
+            ensure_session_stats(conn)
+            print("🗄️  LTM DB Schema (V12.4 - Session Stats) is ready.")
+
+    def pending_message_stats(self) -> Tuple[int, Optional[str]]:
+        """จำนวนข้อความที่ยังไม่ถูกประมวลผล และเวลาของข้อความที่เก่าที่สุดในนั้น (ใช้วัด Lag)"""
+        with sqlite3.connect(self.DB_PATH) as conn:
+            count, oldest = conn.execute("""
+                SELECT COUNT(h.id), MIN(h.timestamp) FROM session_stats s
+                JOIN conversation_history h ON h.session_id = s.session_id AND h.id > s.last_processed_id
+                WHERE s.last_message_id > s.last_processed_id
+            """).fetchone()
+        return count, oldest
+
+    def get_unprocessed_conversation_chunks(self, num_sessions: int = 5, chunk_size: int = 20) -> List[Dict[str, Any]]:
+        try:
+            with sqlite3.connect(self.DB_PATH) as conn:
+                chunks_to_process = fetch_pending_chunks(conn, num_sessions, chunk_size)
+            if chunks_to_process:
+                print(f"🔍 Found {len(chunks_to_process)} active sessions with new messages.")
+            return chunks_to_process
+        except Exception as e:
+            print(f"❌ Could not retrieve conversation chunks: {e}")
+            return []
+
+    def extract_memories_from_chunks(self, conversation_chunks: List[Dict[str, Any]]) -> List[Dict]:
+        if not conversation_chunks: return []
+
+        print(f"\n--- ✍️  Extracting memories from {len(conversation_chunks)} chunks (Rule-based)... ---")
+        successful_memories = []
+
+        for chunk in conversation_chunks:
+            try:
+                user_messages = [msg['content'] for msg in chunk['messages'] if msg['role'] == 'user']
+                model_messages = [msg['content'] for msg in chunk['messages'] if msg['role'] == 'model']
+
+                if not user_messages or not model_messages: continue
+
+                title = user_messages[0][:100]
+                summary = model_messages[-1]
+                keywords = list(set(re.findall(r'\b\w{4,}\b', title.lower())))[:5]
+
+                memory_data = {
+                    "title": title, "summary": summary, "keywords": keywords
+                }
+                memory_data.update(chunk)
+                successful_memories.append(memory_data)
+            except Exception as e:
+                print(f"  - ⚠️ Error processing chunk for session {chunk['session_id']} with rules: {e}")
+
+        print(f"  - ✅ Extracted {len(successful_memories)} memories successfully.")
+        return successful_memories
+
+    def save_memories_to_db(self, memories: List[Dict]):
+        if not memories: return
+        try:
+            with sqlite3.connect(self.DB_PATH) as conn:
+                cursor = conn.cursor()
+                for mem in memories:
+                    cursor.execute(
+                        """INSERT INTO long_term_memories (session_id, title, summary, keywords, start_message_id, end_message_id, conversation_start_time, conversation_end_time)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (mem['session_id'], mem['title'], mem['summary'], ", ".join(mem.get('keywords', [])),
+                         mem['start_message_id'], mem['end_message_id'],
+                         mem['conversation_start_time'], mem['conversation_end_time'])
+                    )
+                conn.commit()
+                print(f"  - 💾 Saved {len(memories)} new memories to database.")
+        except Exception as e:
+            print(f"  - ❌ Could not save memories to DB: {e}")
+
+    def update_processing_state(self, chunks: List[Dict]):
+        if not chunks: return
+        try:
+            with sqlite3.connect(self.DB_PATH) as conn:
+                cursor = conn.cursor()
+                for chunk in chunks:
+                    cursor.execute(
+                        "INSERT INTO memory_processing_state (session_id, last_processed_id) VALUES (?, ?) ON CONFLICT(session_id) DO UPDATE SET last_processed_id = excluded.last_processed_id",
+                        (chunk['session_id'], chunk['end_message_id'])
+                    )
+                    cursor.execute(
+                        "UPDATE session_stats SET last_processed_id = MAX(last_processed_id, ?) WHERE session_id = ?",
+                        (chunk['end_message_id'], chunk['session_id'])
+                    )
+                conn.commit()
+            print(f"  - 🔄 Updated processing state for {len(chunks)} chunks.")
+        except Exception as e:
+            print(f"  - ❌ Could not update processing state: {e}")
+
+    def build_and_save_index(self, memories: List[Dict]) -> int:
+        """
+        Embed ความทรงจำใหม่ ต่อท้ายลงสำเนาของ Index ที่ใช้อยู่ (Back Buffer) เขียนลงดิสก์แบบ All-or-nothing
+        แล้วสลับให้ผู้ค้นหาเห็นทันที คืนจำนวนความทรงจำที่เพิ่มเข้า Index
+        """
+        if not memories:
+            print("  - 🟡 No new memories to index.")
+            return 0
+
+        print(f"\n--- 🏭 Updating Memory RAG Index ---")
+        texts_to_embed = []
+        mapping_data = []
+        for mem in memories:
+            embedding_text = f"หัวข้อ: {mem.get('title', '')}\nสรุป: {mem.get('summary', '')}"
+            texts_to_embed.append(embedding_text)
+
+            mem_copy = mem.copy()
+            mem_copy['embedding_text'] = embedding_text
+            mapping_data.append(mem_copy)
+
+        print(f"  - 🧠 Generating {len(texts_to_embed)} new embeddings...")
+        new_embeddings = self.embedding_cache.encode(
+            self.model,
+            texts_to_embed,
+            prefix="passage: ",
+            show_progress_bar=False
+        )
+
+        self._sync_with_disk()
+        index = self.live.back_buffer()
+        if index is None:
+            index, spec = build_index(new_embeddings)
+        else:
+            spec = read_index_meta(self.MEMORY_FAISS_PATH)["spec"]
+            index.add(new_embeddings)
+
+        _, current_items = self.live.snapshot()
+        write_index(index, self.MEMORY_FAISS_PATH + TMP_SUFFIX, spec,
+                    meta_file=self.MEMORY_FAISS_PATH + META_SUFFIX + TMP_SUFFIX)
+        with open(self.MEMORY_MAPPING_PATH + TMP_SUFFIX, "w", encoding="utf-8") as f:
+            for item in current_items + mapping_data:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        commit_files_atomically(self.MEMORY_INDEX_DIR, {
+            MEMORY_FAISS_FILENAME: MEMORY_FAISS_FILENAME + TMP_SUFFIX,
+            MEMORY_FAISS_FILENAME + META_SUFFIX: MEMORY_FAISS_FILENAME + META_SUFFIX + TMP_SUFFIX,
+            MEMORY_MAPPING_FILENAME: MEMORY_MAPPING_FILENAME + TMP_SUFFIX,
+        })
+        self.live.publish(index, mapping_data)
+        print(f"  - ✅ Memory RAG Index updated successfully! Total memories in index: {index.ntotal}")
+        return len(mapping_data)
+
+    def _sync_with_disk(self):
+        """ถ้า Index บนดิสก์ถูกเขียนโดย Process อื่น (เช่นรัน manage_memory.py ขณะเซิร์ฟเวอร์ทำงาน) ให้โหลดใหม่ก่อนต่อท้าย"""
+        if not os.path.exists(self.MEMORY_FAISS_PATH):
+            return
+        disk_total = read_index_meta(self.MEMORY_FAISS_PATH).get("ntotal")
+        if disk_total is not None and disk_total != self.live.ntotal:
+            print(f"  - 🔄 Memory index on disk has {disk_total} entries (live: {self.live.ntotal}); reloading it first.")
+            loaded = LiveIndex.load(self.MEMORY_FAISS_PATH, self.MEMORY_MAPPING_PATH)
+            self.live.replace(*loaded.snapshot())
+
+    def archive_processed_conversations(self, chunks: List[Dict], keep_recent: int = DEFAULT_HISTORY_LIMIT,
+                                        vacuum: bool = False):
+        """
+        ย้ายข้อความดิบใน conversation_history ที่ถูกประมวลผลแล้ว
+        ไปเก็บไว้ในตาราง archived_conversations
+        โดยเว้นข้อความล่าสุด keep_recent ข้อความของแต่ละ Session ไว้เป็นความจำระยะสั้นของบทสนทนาที่ยังดำเนินอยู่
+        """
+        if not chunks: return
+
+        print(f"\n--- 🗄️  Archiving {len(chunks)} processed conversation chunks... ---")
+        try:
+            with sqlite3.connect(self.DB_PATH) as conn:
+                cursor = conn.cursor()
+                total_moved = 0
+                for chunk in chunks:
+                    session_id = chunk['session_id']
+                    end_id = chunk['end_message_id']
+                    recent_start = cursor.execute(
+                        "SELECT MIN(id) FROM (SELECT id FROM conversation_history WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                        (session_id, keep_recent)
+                    ).fetchone()[0]
+                    if recent_start is not None:
+                        end_id = min(end_id, recent_start - 1)
+
+                    cursor.execute(
+                        """
+                        INSERT OR IGNORE INTO archived_conversations (id, timestamp, session_id, role, content, agent_used)
+                        SELECT id, timestamp, session_id, role, content, agent_used
+                        FROM conversation_history
+                        WHERE session_id = ? AND id <= ?
+                        """,
+                        (session_id, end_id)
+                    )
+
+                    cursor.execute(
+                        "DELETE FROM conversation_history WHERE session_id = ? AND id <= ?",
+                        (session_id, end_id)
+                    )
+                    total_moved += cursor.rowcount
+
+                conn.commit()
+                print(f"  - ✅ Archived and cleaned up {total_moved} old messages.")
+
+                if vacuum:
+                    print("  - Running VACUUM to reclaim disk space...")
+                    conn.execute("VACUUM")
+
+        except Exception as e:
+            print(f"  - ❌ Could not archive processed conversations: {e}")
+
+    def run(self, num_sessions: int = 10, chunk_size: int = 20, vacuum: bool = False,
+            on_batch=None) -> Dict[str, int]:
+        """ประมวลผลทุก Session ที่ค้างอยู่เป็นรอบๆ จนหมด คืนสถิติของการรันครั้งนี้"""
+        stats = {"batches": 0, "chunks": 0, "memories": 0}
+        seen = set()
+        while True:
+            unprocessed_chunks = self.get_unprocessed_conversation_chunks(num_sessions=num_sessions, chunk_size=chunk_size)
+            if not unprocessed_chunks:
+                break
+            chunk_keys = {(c['session_id'], c['end_message_id']) for c in unprocessed_chunks}
+            if chunk_keys & seen:
+                # สถานะไม่ถูกบันทึก (เช่น DB ถูกล็อก) จึงได้ Chunk เดิมซ้ำ หยุดไว้ก่อนแล้วค่อยลองใหม่รอบหน้า
+                print("  - ⚠️ Processing state did not advance; stopping this consolidation run.")
+                break
+            seen |= chunk_keys
+
+            new_memories = self.extract_memories_from_chunks(unprocessed_chunks)
+            self.save_memories_to_db(new_memories)
+            stats["memories"] += self.build_and_save_index(new_memories)
+            self.update_processing_state(unprocessed_chunks)
+            self.archive_processed_conversations(unprocessed_chunks, vacuum=vacuum)
+
+            stats["batches"] += 1
+            stats["chunks"] += len(unprocessed_chunks)
+            if on_batch:
+                on_batch(stats)
+        return stats
+
+
+class MemoryConsolidationWorker:
+    """
+    Thread เบื้องหลังในเซิร์ฟเวอร์: ตรวจข้อความที่ค้างทุก poll_seconds
+    และรัน MemoryConsolidator เมื่อมีข้อความค้าง >= message_trigger หรือมีข้อความค้างและครบ interval_seconds นับจากรอบก่อน
+    """
+    def __init__(self, consolidator: MemoryConsolidator, interval_seconds: Optional[float] = None,
+                 message_trigger: Optional[int] = None, poll_seconds: Optional[float] = None):
+        self.consolidator = consolidator
+        self.interval = interval_seconds or settings.MEMORY_CONSOLIDATION_INTERVAL_SECONDS
+        self.message_trigger = message_trigger or settings.MEMORY_CONSOLIDATION_MESSAGE_TRIGGER
+        self.poll = poll_seconds or settings.MEMORY_CONSOLIDATION_POLL_SECONDS
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {
+            "running": False, "runs": 0, "failures": 0, "memories_indexed_total": 0,
+            "last_run_started_at": None, "last_run_seconds": None, "last_run": None,
+            "current_run": None, "last_error": None,
+        }
+        self._last_run_at = time.time()
+        self._thread = threading.Thread(target=self._loop, name="memory-consolidation", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        print(f"  - 🏛️  Memory consolidation worker started (every {self.interval:.0f}s or {self.message_trigger} pending messages).")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=30)
+
+    def request_run(self):
+        """ปลุกให้รันรอบถัดไปทันที (ไม่ต้องรอ Trigger)"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            forced = self._wake.wait(self.poll)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                pending, _ = self.consolidator.pending_message_stats()
+            except Exception as e:
+                self._record_error(e)
+                continue
+            due = pending >= self.message_trigger or (pending and time.time() - self._last_run_at >= self.interval)
+            if pending and (forced or due):
+                self._run_once()
+
+    def _run_once(self):
+        started = time.time()
+        with self._lock:
+            self._metrics.update(running=True, last_run_started_at=started, current_run={"batches": 0, "chunks": 0, "memories": 0})
+
+        def on_batch(stats: Dict[str, int]):
+            with self._lock:
+                self._metrics["current_run"] = dict(stats)
+
+        try:
+            stats = self.consolidator.run(num_sessions=settings.MEMORY_CONSOLIDATION_SESSIONS_PER_BATCH,
+                                          chunk_size=settings.MEMORY_CONSOLIDATION_CHUNK_SIZE, on_batch=on_batch)
+            with self._lock:
+                self._metrics["runs"] += 1
+                self._metrics["memories_indexed_total"] += stats["memories"]
+                self._metrics["last_run"] = stats
+                self._metrics["last_error"] = None
+        except Exception as e:
+            traceback.print_exc()
+            self._record_error(e)
+        finally:
+            self._last_run_at = time.time()
+            with self._lock:
+                self._metrics.update(running=False, current_run=None, last_run_seconds=self._last_run_at - started)
+
+    def _record_error(self, error: Exception):
+        with self._lock:
+            self._metrics["failures"] += 1
+            self._metrics["last_error"] = f"{type(error).__name__}: {error}"
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        try:
+            pending, oldest = self.consolidator.pending_message_stats()
+        except Exception:
+            pending, oldest = None, None
+        lag = None
+        if oldest:
+            try:
+                lag = max(0.0, time.time() - datetime.datetime.fromisoformat(str(oldest)).timestamp())
+            except ValueError:
+                pass
+        metrics.update(
+            pending_messages=pending,
+            lag_seconds=lag,
+            indexed_memories=self.consolidator.live.ntotal,
+            seconds_since_last_run=time.time() - self._last_run_at,
+        )
+        return metrics
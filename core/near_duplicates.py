@@ -0,0 +1,156 @@
+# core/near_duplicates.py
+# (V1.0 - MinHash/LSH Near-Duplicate Detection for News)
+# ข่าวเดียวกันที่ถูกส่งต่อหลายฟีด (Syndication) มักมี URL ต่างกันแต่เนื้อหาเกือบเหมือนกัน
+# - ลายเซ็น MinHash จาก Character Shingles ของข้อความที่ sanitize แล้ว (ใช้ได้ทั้งภาษาไทยที่ไม่มีช่องว่างและภาษาอังกฤษ)
+# - LSH (แบ่งลายเซ็นเป็น Band) หา Candidate จาก SQLite แล้วยืนยันด้วย Jaccard โดยประมาณ >= NEWS_DUPLICATE_THRESHOLD
+# - ข่าวซ้ำถูกผูกเข้ากับ Cluster ของข่าวตัวแทน (cluster_id = URL ของตัวแทน) และไม่ถูก Embed/Index
+# ลายเซ็นถูกเก็บถาวรจึงตรวจข้ามรอบการรันได้ และลบทิ้งตาม Retention เดียวกับ Shard ข่าว
+
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+
+SHINGLE_SIZE = 5
+MIN_SHINGLES = 20
+_MERSENNE_PRIME = (1 << 31) - 1
+_MAX_HASH = np.uint64(_MERSENNE_PRIME)
+
+
+def normalize_for_shingles(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").lower()).strip()
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Hash 31 บิตของ Character Shingles ที่ไม่ซ้ำกัน"""
+    text = normalize_for_shingles(text)
+    shingles = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) & _MERSENNE_PRIME for s in shingles),
+                       dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    """Permutation แบบ (a*x + b) mod p ที่ seed ตายตัว ลายเซ็นจึงเทียบกันได้ข้ามรอบการรัน"""
+    def __init__(self, num_perm: Optional[int] = None, seed: int = 1):
+        self.num_perm = num_perm or settings.NEWS_MINHASH_PERMUTATIONS
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, size=self.num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, size=self.num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """คืน None เมื่อข้อความสั้นเกินกว่าจะตัดสินความซ้ำได้อย่างน่าเชื่อถือ"""
+        hashes = shingle_hashes(text)
+        if len(hashes) < MIN_SHINGLES:
+            return None
+        # a, x < 2^31 ดังนั้น a*x + b < 2^63 ไม่ล้น uint64
+        permuted = (np.outer(hashes, self.a) + self.b) % _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def estimated_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+class NearDuplicateIndex:
+    """
+    คลังลายเซ็นบนดิสก์ (SQLite):
+    - signatures : url -> (cluster_id, ลายเซ็น MinHash)
+    - bands      : (band, bucket hash) -> url สำหรับหา Candidate แบบ LSH
+    """
+    def __init__(self, db_path: Optional[str] = None, threshold: Optional[float] = None,
+                 num_perm: Optional[int] = None, bands: Optional[int] = None):
+        self.db_path = db_path or settings.NEWS_DEDUP_DB
+        self.threshold = threshold or settings.NEWS_DUPLICATE_THRESHOLD
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands or settings.NEWS_LSH_BANDS
+        if self.hasher.num_perm % self.bands:
+            raise ValueError(f"NEWS_MINHASH_PERMUTATIONS ({self.hasher.num_perm}) must be divisible by NEWS_LSH_BANDS ({self.bands}).")
+        self.rows = self.hasher.num_perm // self.bands
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS signatures (url TEXT PRIMARY KEY, cluster_id TEXT NOT NULL, "
+                         "signature BLOB NOT NULL, created_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_signatures_cluster ON signatures(cluster_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket BLOB NOT NULL, url TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands(band, bucket)")
+
+    def _buckets(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest())
+                for band in range(self.bands)]
+
+    def find_cluster(self, conn: sqlite3.Connection, url: str, signature: np.ndarray) -> Optional[str]:
+        """cluster_id ของข่าวที่คล้ายที่สุด (ถ้าผ่านเกณฑ์) โดยไม่นับตัวเอง"""
+        candidates = set()
+        for band, bucket in self._buckets(signature):
+            candidates.update(row[0] for row in conn.execute(
+                "SELECT url FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        candidates.discard(url)
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            row = conn.execute("SELECT cluster_id, signature FROM signatures WHERE url = ?", (candidate,)).fetchone()
+            if row is None:
+                continue
+            score = estimated_jaccard(signature, np.frombuffer(row[1], dtype=np.uint32))
+            if score >= best_score:
+                best, best_score = row[0], score
+        return best
+
+    def _add(self, conn: sqlite3.Connection, url: str, cluster_id: str, signature: np.ndarray):
+        conn.execute("INSERT OR REPLACE INTO signatures (url, cluster_id, signature, created_at) VALUES (?, ?, ?, ?)",
+                     (url, cluster_id, signature.tobytes(), time.time()))
+        conn.execute("DELETE FROM bands WHERE url = ?", (url,))
+        conn.executemany("INSERT INTO bands (band, bucket, url) VALUES (?, ?, ?)",
+                         [(band, bucket, url) for band, bucket in self._buckets(signature)])
+
+    def filter_articles(self, articles: List[Dict], text_key: str = "full_content") -> Tuple[List[Dict], List[Dict]]:
+        """
+        แยกบทความเป็น (ตัวแทนที่ต้อง Embed, ข่าวซ้ำ) เทียบทั้งกับคลังเดิมและกับบทความก่อนหน้าในชุดเดียวกัน
+        ทุกบทความได้ฟิลด์ cluster_id; ข่าวซ้ำชี้ไปที่ URL ของตัวแทน
+        และถ้าตัวแทนอยู่ในชุดเดียวกัน แหล่งข่าวของข่าวซ้ำจะถูกบันทึกไว้ใน also_reported_by ของตัวแทน
+        """
+        unique, duplicates = [], []
+        batch = {}
+        with sqlite3.connect(self.db_path) as conn:
+            for article in articles:
+                url = article["url"]
+                signature = self.hasher.signature(f"{article.get('title') or ''}\n{article.get(text_key) or ''}")
+                cluster_id = self.find_cluster(conn, url, signature) if signature is not None else None
+                if cluster_id == url:
+                    # รันซ้ำหลัง Crash: ข่าวตัวแทนเจอสมาชิกใน Cluster ของตัวเอง
+                    cluster_id = None
+                article["cluster_id"] = cluster_id or url
+                if signature is not None:
+                    self._add(conn, url, article["cluster_id"], signature)
+                if cluster_id:
+                    duplicates.append(article)
+                    if (representative := batch.get(cluster_id)) and article.get("source_name"):
+                        sources = representative.setdefault("also_reported_by", [])
+                        if article["source_name"] not in sources and article["source_name"] != representative.get("source_name"):
+                            sources.append(article["source_name"])
+                else:
+                    unique.append(article)
+                    batch[url] = article
+        if duplicates:
+            print(f"  - 🧬 Skipped {len(duplicates)} near-duplicate articles (Jaccard >= {self.threshold}); "
+                  f"{len(unique)} unique articles remain.")
+        return unique, duplicates
+
+    def cluster_members(self, cluster_id: str) -> List[str]:
+        with sqlite3.connect(self.db_path) as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT url FROM signatures WHERE cluster_id = ? ORDER BY created_at", (cluster_id,))]
+
+    def prune(self, older_than_days: float) -> int:
+        cutoff = time.time() - older_than_days * 86400.0
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM bands WHERE url IN (SELECT url FROM signatures WHERE created_at < ?)", (cutoff,))
+            return conn.execute("DELETE FROM signatures WHERE created_at < ?", (cutoff,)).rowcount
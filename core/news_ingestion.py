@@ -0,0 +1,352 @@
+# core/news_ingestion.py
+# (V1.0 - Async News Ingestion with Per-Domain Politeness)
+# เครื่องดึงข่าวแบบ asyncio ที่ใช้แทน ThreadPoolExecutor + time.sleep ของ manage_news.py เดิม
+# - aiohttp ClientSession เดียว (Connection Pool) สำหรับ RSS, NewsAPI และการดาวน์โหลดบทความ
+# - DomainThrottle: จำกัดจำนวน Request พร้อมกันและระยะห่างระหว่าง Request ต่อโดเมน (โดเมนอื่นไม่ต้องรอ)
+# - RSS ใช้ Conditional GET (ETag / Last-Modified) ฟีดที่ไม่เปลี่ยนได้ 304 และไม่ต้อง Parse ใหม่
+# - Retry แบบ Exponential Backoff + Jitter (เคารพ Retry-After เมื่อเจอ 429)
+# - CrawlFrontier (SQLite) จำสถานะทุก URL: pending -> scraped -> indexed ทำให้รันที่ถูกขัดจังหวะทำต่อได้
+# ทุก URL (ฟีด, NewsAPI) ส่งเข้ามาเป็นพารามิเตอร์ จึงรันกับ Fixture Server บน localhost ได้ทั้งหมด
+
+import asyncio
+import datetime
+import json
+import os
+import random
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+import feedparser
+from newspaper import Article, ArticleException, Config
+from tqdm import tqdm
+
+from core.config import settings
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+
+def sanitize_text(text: str) -> str:
+    if not text:
+        return ""
+    # ลบตัวอักษรแปลก ๆ เช่น U+2028 (LS) และ U+2029 (PS)
+    return text.replace("\u2028", " ").replace("\u2029", " ")
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url).netloc.replace('www.', '')
+
+
+class FetchError(Exception):
+    """ดึง URL ไม่สำเร็จหลัง Retry ครบ (หรือได้สถานะที่ไม่ควร Retry)"""
+    def __init__(self, url: str, reason: str, status: Optional[int] = None):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.status = status
+
+
+class CrawlFrontier:
+    """
+    สถานะการดึงข่าวบนดิสก์ (SQLite):
+    - feeds    : ETag / Last-Modified ล่าสุดของแต่ละฟีด สำหรับ Conditional GET
+    - articles : ทุก URL ที่เคยพบ พร้อมข้อมูลบทความ (JSON) และสถานะ pending | scraped | indexed | duplicate | skipped | failed
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.NEWS_FRONTIER_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS feeds (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at REAL)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY, domain TEXT NOT NULL, status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, payload TEXT NOT NULL, updated_at REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_status ON articles(status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+    def feed_validators(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT etag, last_modified FROM feeds WHERE url = ?", (url,)).fetchone()
+        return row if row else (None, None)
+
+    def save_feed_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO feeds (url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)",
+                         (url, etag, last_modified, time.time()))
+
+    def add_discovered(self, articles: Iterable[Dict], known_urls: Set[str]) -> int:
+        """เพิ่มบทความที่พบใหม่เป็น pending (ข้าม URL ที่อยู่ใน Index แล้วหรือเคยอยู่ใน Frontier)"""
+        now = time.time()
+        rows = [(a["url"], domain_of(a["url"]), json.dumps(a, ensure_ascii=False), now)
+                for a in articles if a.get("url") and a["url"] not in known_urls]
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO articles (url, domain, status, payload, updated_at) "
+                             "VALUES (?, ?, 'pending', ?, ?)", rows)
+            return conn.total_changes - before
+
+    def pending(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT payload FROM articles WHERE status = 'pending' ORDER BY updated_at").fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def mark_scraped(self, article: Dict):
+        self._set_status(article["url"], "scraped", payload=article)
+
+    def mark_skipped(self, url: str):
+        self._set_status(url, "skipped")
+
+    def mark_attempt_failed(self, url: str, max_attempts: int):
+        """นับความล้มเหลวข้ามรอบการรัน: ครบ max_attempts แล้วเลิกพยายาม (failed)"""
+        with self._connect() as conn:
+            conn.execute("UPDATE articles SET attempts = attempts + 1, updated_at = ?, "
+                         "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE url = ?",
+                         (time.time(), max_attempts, url))
+
+    def mark_duplicates(self, urls: Iterable[str]):
+        # ข่าวซ้ำไม่ถูก Index ลิงก์ไปยังข่าวตัวแทนอยู่ใน core/near_duplicates.py
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("UPDATE articles SET status = 'duplicate', payload = '{}', updated_at = ? WHERE url = ?",
+                             [(now, url) for url in urls])
+
+    def scraped(self) -> List[Dict]:
+        """บทความที่ดึงเนื้อหาแล้วแต่ยังไม่ได้เข้า Index (รวมของรอบก่อนที่ถูกขัดจังหวะ)"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT payload FROM articles WHERE status = 'scraped' ORDER BY updated_at").fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def mark_indexed(self, urls: Iterable[str]):
+        # เนื้อหาเต็มอยู่ใน Shard แล้ว ไม่ต้องเก็บซ้ำใน Frontier
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("UPDATE articles SET status = 'indexed', payload = '{}', updated_at = ? WHERE url = ?",
+                             [(now, url) for url in urls])
+
+    def prune(self, older_than_days: float) -> int:
+        """ลบแถวที่จบแล้ว (indexed / duplicate / skipped / failed) ที่เก่ากว่า Retention เพื่อไม่ให้ Frontier โตไม่สิ้นสุด"""
+        cutoff = time.time() - older_than_days * 86400.0
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM articles WHERE status IN ('indexed', 'duplicate', 'skipped', 'failed') AND updated_at < ?",
+                                  (cutoff,))
+            return cursor.rowcount
+
+    def _set_status(self, url: str, status: str, payload: Optional[Dict] = None):
+        with self._connect() as conn:
+            if payload is None:
+                conn.execute("UPDATE articles SET status = ?, updated_at = ? WHERE url = ?", (status, time.time(), url))
+            else:
+                conn.execute("UPDATE articles SET status = ?, payload = ?, updated_at = ? WHERE url = ?",
+                             (status, json.dumps(payload, ensure_ascii=False), time.time(), url))
+
+
+class DomainThrottle:
+    """
+    มารยาทต่อโดเมน: Semaphore จำกัดจำนวน Request ที่ค้างอยู่ และเวลาเริ่ม Request ถัดไปต้องห่างจากครั้งก่อนอย่างน้อย min_interval
+    การรอเป็น asyncio.sleep ของโดเมนนั้นเท่านั้น โดเมนอื่นทำงานต่อได้ตามปกติ
+    """
+    def __init__(self, concurrency: Optional[int] = None, min_interval_ms: Optional[float] = None):
+        self.concurrency = concurrency or settings.NEWS_DOMAIN_CONCURRENCY
+        self.min_interval = (min_interval_ms if min_interval_ms is not None else settings.NEWS_DOMAIN_MIN_INTERVAL_MS) / 1000.0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+
+    def slot(self, domain: str) -> asyncio.Semaphore:
+        if domain not in self._semaphores:
+            self._semaphores[domain] = asyncio.Semaphore(self.concurrency)
+            self._locks[domain] = asyncio.Lock()
+        return self._semaphores[domain]
+
+    async def wait_turn(self, domain: str):
+        self.slot(domain)
+        async with self._locks[domain]:
+            loop = asyncio.get_running_loop()
+            delay = self._next_start.get(domain, 0.0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_start[domain] = loop.time() + self.min_interval
+
+
+class NewsIngestor:
+    """
+    ดึงฟีด (RSS + NewsAPI) -> บันทึกบทความใหม่ลง Frontier -> ดาวน์โหลดและแยกเนื้อหาของทุกบทความที่ยัง pending
+    คืนค่าบทความที่ดึงเนื้อหาแล้วแต่ยังไม่เข้า Index (เรียก frontier.mark_indexed หลังเขียน Index สำเร็จ)
+    """
+    def __init__(self, frontier: CrawlFrontier, rss_feeds: Dict[str, str],
+                 newsapi_url: Optional[str] = None, newsapi_key: Optional[str] = None,
+                 throttle: Optional[DomainThrottle] = None, retries: Optional[int] = None,
+                 timeout: Optional[float] = None, max_connections: Optional[int] = None):
+        self.frontier = frontier
+        self.rss_feeds = rss_feeds
+        self.newsapi_url = newsapi_url
+        self.newsapi_key = newsapi_key
+        self.throttle = throttle or DomainThrottle()
+        self.retries = retries if retries is not None else settings.NEWS_FETCH_RETRIES
+        self.timeout = timeout or settings.NEWS_HTTP_TIMEOUT
+        self.max_connections = max_connections or settings.NEWS_HTTP_MAX_CONNECTIONS
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def _request(self, url: str, headers: Optional[Dict] = None,
+                       params: Optional[Dict] = None) -> Tuple[int, Mapping[str, str], bytes]:
+        """GET หนึ่ง URL ภายใต้ DomainThrottle พร้อม Retry คืนค่า (status, headers, body)"""
+        domain = domain_of(url)
+        last_reason = "no attempt"
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            async with self.throttle.slot(domain):
+                await self.throttle.wait_turn(domain)
+                try:
+                    async with self.session.get(url, headers=headers, params=params) as resp:
+                        body = await resp.read()
+                        if resp.status not in RETRYABLE_STATUSES:
+                            if resp.status >= 400:
+                                raise FetchError(url, f"HTTP {resp.status}", resp.status)
+                            return resp.status, resp.headers.copy(), body
+                        last_reason = f"HTTP {resp.status}"
+                        retry_after = resp.headers.get("Retry-After")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    last_reason = f"{type(e).__name__}: {e}"
+            if attempt < self.retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+        raise FetchError(url, f"gave up after {self.retries + 1} attempts ({last_reason})")
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX_SECONDS, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    # --- ฟีด ---
+
+    async def fetch_rss(self, source: str, url: str) -> Tuple[List[Dict], Optional[Tuple[Optional[str], Optional[str]]]]:
+        """
+        ดึง RSS แบบ Conditional GET: ได้ 304 แปลว่าไม่มีอะไรใหม่
+        คืนค่า (บทความ, (ETag, Last-Modified) ใหม่ของฟีด หรือ None) ผู้เรียนต้องบันทึก Validators หลังเก็บบทความลง Frontier แล้วเท่านั้น
+        """
+        etag, last_modified = self.frontier.feed_validators(url)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            status, resp_headers, body = await self._request(url, headers=headers)
+        except FetchError as e:
+            print(f"  - ❌ RSS Error ({source}): {e}")
+            return [], None
+        if status == 304:
+            print(f"  - 💤 {source}: not modified since last run.")
+            return [], None
+
+        feed = await asyncio.to_thread(feedparser.parse, body)
+        print(f"  - Fetched {len(feed.entries)} entries from {source}.")
+        validators = (resp_headers.get("ETag"), resp_headers.get("Last-Modified"))
+        return [{
+            "published_at": entry.get("published", datetime.datetime.now().isoformat()),
+            "source_name": source,
+            "title": entry.get("title"),
+            "description": entry.get("summary"),
+            "url": entry.get("link")
+        } for entry in feed.entries], validators
+
+    async def fetch_newsapi(self) -> List[Dict]:
+        if not self.newsapi_url:
+            return []
+        if not self.newsapi_key:
+            print("  - ⚠️ NewsAPI key not found in .env file.")
+            return []
+        params = {'country': 'us', 'pageSize': 20, 'apiKey': self.newsapi_key}
+        try:
+            _, _, body = await self._request(self.newsapi_url, params=params)
+            articles = json.loads(body).get('articles', [])
+        except (FetchError, ValueError) as e:
+            print(f"  - ❌ NewsAPI Error: {e}")
+            return []
+        print(f"  - Fetched {len(articles)} articles from NewsAPI.")
+        return [{
+            "published_at": a.get("publishedAt"),
+            "source_name": (a.get("source") or {}).get("name"),
+            "title": a.get("title"),
+            "description": a.get("description"),
+            "url": a.get("url")
+        } for a in articles]
+
+    # --- บทความ ---
+
+    @staticmethod
+    def extract_content(url: str, html: str) -> str:
+        """แยกเนื้อหาบทความจาก HTML ที่ดาวน์โหลดมาแล้ว (newspaper3k ไม่ต้องยิง HTTP เอง)"""
+        try:
+            config = Config()
+            config.browser_user_agent = USER_AGENT
+            article = Article(url, config=config)
+            article.download(input_html=html)
+            article.parse()
+            return sanitize_text(article.text)
+        except ArticleException:
+            return ""
+
+    async def scrape(self, article: Dict) -> Optional[Dict]:
+        url = article["url"]
+        try:
+            _, _, body = await self._request(url)
+        except FetchError as e:
+            # 4xx ถาวร (เช่น 404) ไม่ต้องลองใหม่ในรอบถัดไป
+            if e.status is not None and e.status < 500 and e.status not in RETRYABLE_STATUSES:
+                self.frontier.mark_skipped(url)
+            else:
+                self.frontier.mark_attempt_failed(url, self.retries + 1)
+            return None
+        content = await asyncio.to_thread(self.extract_content, url, body.decode("utf-8", errors="replace"))
+        if not content:
+            self.frontier.mark_skipped(url)
+            return None
+        article["full_content"] = content
+        self.frontier.mark_scraped(article)
+        return article
+
+    async def run(self, known_urls: Set[str]) -> List[Dict]:
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                         headers={"User-Agent": USER_AGENT}) as session:
+            self.session = session
+            try:
+                print("📰 Fetching feeds...")
+                newsapi_articles, *rss_results = await asyncio.gather(
+                    self.fetch_newsapi(), *[self.fetch_rss(name, url) for name, url in self.rss_feeds.items()]
+                )
+                discovered = list(newsapi_articles)
+                for entries, _ in rss_results:
+                    discovered.extend(entries)
+                added = self.frontier.add_discovered(discovered, known_urls)
+                # บันทึก ETag / Last-Modified หลังบทความของฟีดอยู่ใน Frontier แล้วเท่านั้น
+                # (ถ้าบันทึกก่อนแล้ว Crash รอบถัดไปจะได้ 304 และบทความชุดนั้นหายไปถาวร)
+                for url, (_, validators) in zip(self.rss_feeds.values(), rss_results):
+                    if validators:
+                        self.frontier.save_feed_validators(url, *validators)
+
+                pending = self.frontier.pending()
+                print(f"\n🔬 Found {added} new articles; {len(pending)} articles pending scrape (including resumed).")
+                if pending:
+                    progress_bar = tqdm(total=len(pending), desc="Scraping New Articles")
+                    for future in asyncio.as_completed([self.scrape(a) for a in pending]):
+                        await future
+                        progress_bar.update(1)
+                    progress_bar.close()
+            finally:
+                self.session = None
+
+        articles = self.frontier.scraped()
+        print(f"\n💾 Collected {len(articles)} articles with full content waiting to be indexed.")
+        return articles
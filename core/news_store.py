@@ -0,0 +1,377 @@
+# core/news_store.py
+# (V1.0 - Time-Partitioned News Shards with Recency-Aware Search)
+# Index ข่าวถูกแบ่งเป็น Shard ตามช่วงเวลาที่ Ingest (รายวันหรือรายสัปดาห์ ตาม settings.NEWS_SHARD_PERIOD)
+#   data/news_index/shards/<key>/news_faiss.index (+ .meta.json) และ articles.db
+# - articles.db (SQLite) เก็บบทความแบบต่อท้าย: id = ลำดับเวกเตอร์ใน FAISS, เนื้อหาเต็มโหลดเมื่อต้องการเท่านั้น
+# - Ingest แต่ละรอบเขียนเฉพาะ Shard ล่าสุด (INSERT ใน Transaction + สลับ Index แบบ All-or-nothing ผ่าน core.atomic_files)
+#   ภายใต้ Writer Lock ของ Shard; ผู้อ่าน (RAGEngine) เปิด articles.db แบบ Read-only และเห็นเฉพาะแถวที่ id < ntotal ของ Index
+# - Shard ที่เก่ากว่า NEWS_RETENTION_DAYS ถูกลบทั้งโฟลเดอร์ โดยไม่ต้องเขียน Shard อื่นใหม่
+# - การค้นหาไล่จาก Shard ใหม่ไปเก่า คูณคะแนนด้วย Recency Decay และหยุดทันทีเมื่อ Shard ที่เหลือไม่มีทางชนะผลที่มีอยู่
+
+import datetime
+import email.utils
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import time
+import urllib.parse
+from contextlib import closing, contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+from core.atomic_files import TMP_SUFFIX, apply_commit_journal, commit_files_atomically
+from core.config import settings
+from core.vector_index import META_SUFFIX, build_index, read_index, read_index_meta, write_index
+
+SHARDS_DIRNAME = "shards"
+SHARD_FAISS_FILENAME = "news_faiss.index"
+SHARD_ARTICLES_FILENAME = "articles.db"
+SHARD_WRITER_LOCK_FILENAME = "writer.lock"
+SHARD_MAPPING_FILENAME = "news_mapping.jsonl"  # รูปแบบเดิมก่อนมี articles.db (ถูกแปลงอัตโนมัติ)
+LEGACY_FAISS_FILENAME = "news_faiss.index"
+LEGACY_MAPPING_FILENAME = "news_mapping.json"
+LEGACY_SUFFIX = ".legacy"
+
+# ดึงผู้สมัครจากแต่ละ Shard มากกว่า top_k เพราะ Decay อาจสลับลำดับภายใน Shard เดียวกัน
+SHARD_CANDIDATE_FACTOR = 3
+SECONDS_PER_DAY = 86400.0
+
+# คอลัมน์ของบทความ ฟิลด์อื่นที่ไม่อยู่ในรายการนี้เก็บรวมใน extra (JSON)
+ARTICLE_COLUMNS = ("url", "source_name", "title", "description", "published_at", "published_ts",
+                   "cluster_id", "also_reported_by", "full_content", "embedding_text")
+# ฟิลด์ที่ RAGEngine โหลดเข้าหน่วยความจำเพื่อใช้ค้นหาและแสดงผล
+SUMMARY_COLUMNS = ("id", "url", "source_name", "title", "description", "published_ts", "cluster_id", "also_reported_by")
+
+
+def shard_key(ts: float, period: Optional[str] = None) -> str:
+    """ชื่อ Shard ของเวลา ts: รายวัน 'YYYY-MM-DD' หรือรายสัปดาห์แบบ ISO 'YYYY-Www'"""
+    dt = datetime.datetime.fromtimestamp(ts)
+    if (period or settings.NEWS_SHARD_PERIOD).lower() == "day":
+        return dt.strftime("%Y-%m-%d")
+    return dt.strftime("%G-W%V")
+
+
+def shard_bounds(key: str) -> Tuple[float, float]:
+    """ช่วงเวลา [เริ่ม, สิ้นสุด) ของ Shard จากชื่อ (รองรับทั้งสองรูปแบบ เผื่อเปลี่ยน NEWS_SHARD_PERIOD ภายหลัง)"""
+    if "-W" in key:
+        start = datetime.datetime.strptime(key + "-1", "%G-W%V-%u")
+        end = start + datetime.timedelta(days=7)
+    else:
+        start = datetime.datetime.strptime(key, "%Y-%m-%d")
+        end = start + datetime.timedelta(days=1)
+    return start.timestamp(), end.timestamp()
+
+
+def parse_published(value, default: Optional[float] = None) -> float:
+    """แปลง published_at (RSS แบบ RFC 2822 หรือ ISO 8601 จาก NewsAPI) เป็น epoch; อ่านไม่ได้ใช้ default"""
+    default = time.time() if default is None else default
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value or not isinstance(value, str):
+        return default
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return default
+
+
+def recency_weight(published_ts: float, now: Optional[float] = None,
+                   half_life_days: Optional[float] = None) -> float:
+    """ตัวคูณคะแนนตามอายุข่าว: 1.0 สำหรับข่าวใหม่ ลดลงครึ่งหนึ่งทุก half_life_days วัน"""
+    now = time.time() if now is None else now
+    half_life_days = half_life_days or settings.NEWS_RECENCY_HALF_LIFE_DAYS
+    age_days = max(0.0, (now - published_ts) / SECONDS_PER_DAY)
+    return 0.5 ** (age_days / half_life_days)
+
+
+class NewsShard:
+    """
+    Shard ที่โหลดแล้ว: Index + สรุปบทความ (ลำดับตรงกับ id ใน Index) + เวลาเผยแพร่ล่าสุดของข่าวใน Shard
+    เนื้อหาเต็ม (full_content) ไม่ถูกโหลดไว้ ใช้ load_article() เมื่อต้องการ
+    """
+    def __init__(self, key: str, index: faiss.Index, items: List[Dict], db_path: Optional[str] = None):
+        self.key = key
+        self.index = index
+        self.items = items
+        self.db_path = db_path
+        self.newest_ts = max((item.get("published_ts") or 0.0 for item in items), default=0.0)
+
+    def load_article(self, article_id: int) -> Optional[Dict]:
+        if not self.db_path:
+            return None
+        with closing(_connect_readonly(self.db_path)) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM articles WHERE id = ?", (article_id,)).fetchone()
+        return _row_to_article(row) if row else None
+
+
+def _connect_readonly(db_path: str) -> sqlite3.Connection:
+    """เปิด SQLite แบบ Read-only (mode=ro): ผู้อ่านไม่สร้างไฟล์ ไม่รัน DDL และใช้ได้บน Deployment ที่เขียนดิสก์ไม่ได้"""
+    return sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+
+
+def _read_legacy_mapping(folder: str) -> List[Dict]:
+    """บทความจาก news_mapping.jsonl ของ Shard รูปแบบเดิม (ลำดับบรรทัด = id ใน Index)"""
+    with open(os.path.join(folder, SHARD_MAPPING_FILENAME), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _article_to_row(article_id: int, article: Dict) -> Tuple:
+    values = [article.get(column) for column in ARTICLE_COLUMNS]
+    values[ARTICLE_COLUMNS.index("also_reported_by")] = json.dumps(article.get("also_reported_by") or [], ensure_ascii=False)
+    extra = {k: v for k, v in article.items() if k not in ARTICLE_COLUMNS and k not in ("id", "shard")}
+    return (article_id, *values, json.dumps(extra, ensure_ascii=False))
+
+
+def _row_to_article(row: sqlite3.Row) -> Dict:
+    article = dict(row)
+    article.update(json.loads(article.pop("extra", None) or "{}"))
+    if "also_reported_by" in article:
+        article["also_reported_by"] = json.loads(article["also_reported_by"] or "[]")
+    return {k: v for k, v in article.items() if v is not None}
+
+
+class NewsStore:
+    def __init__(self, news_dir: str = "data/news_index"):
+        self.news_dir = news_dir
+        self.shards_dir = os.path.join(news_dir, SHARDS_DIRNAME)
+
+    def shard_path(self, key: str) -> str:
+        return os.path.join(self.shards_dir, key)
+
+    def shard_names(self) -> List[str]:
+        """ชื่อ Shard ทั้งหมด เรียงจากใหม่ไปเก่า"""
+        if not os.path.isdir(self.shards_dir):
+            return []
+        names = []
+        for name in os.listdir(self.shards_dir):
+            if not os.path.isdir(self.shard_path(name)):
+                continue
+            try:
+                names.append((shard_bounds(name)[0], name))
+            except ValueError:
+                print(f"  - ⚠️ Ignoring unrecognised news shard folder '{name}'.")
+        return [name for _, name in sorted(names, reverse=True)]
+
+    def drop_expired(self, now: Optional[float] = None) -> List[str]:
+        """ลบ Shard ที่สิ้นสุดก่อนหน้าต่าง Retention ทั้งโฟลเดอร์ (Shard อื่นไม่ถูกแตะต้อง)"""
+        cutoff = (time.time() if now is None else now) - settings.NEWS_RETENTION_DAYS * SECONDS_PER_DAY
+        dropped = [name for name in self.shard_names() if shard_bounds(name)[1] <= cutoff]
+        for name in dropped:
+            shutil.rmtree(self.shard_path(name))
+        if dropped:
+            print(f"  - 🗑️ Dropped {len(dropped)} news shard(s) older than {settings.NEWS_RETENTION_DAYS} days: {', '.join(dropped)}")
+        return dropped
+
+    def _open_articles(self, folder: str) -> sqlite3.Connection:
+        """
+        ผู้เขียนเท่านั้น (ถือ _writer_lock อยู่): เปิด articles.db ของ Shard (สร้างถ้ายังไม่มี)
+        และแปลง news_mapping.jsonl รูปแบบเดิมเข้า articles.db แล้วลบไฟล์เดิม
+        """
+        conn = sqlite3.connect(os.path.join(folder, SHARD_ARTICLES_FILENAME))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, "
+                     f"{', '.join(ARTICLE_COLUMNS)}, extra TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_url ON articles(url)")
+
+        legacy_mapping = os.path.join(folder, SHARD_MAPPING_FILENAME)
+        if os.path.exists(legacy_mapping):
+            rows = [_article_to_row(i, article) for i, article in enumerate(_read_legacy_mapping(folder))]
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO articles VALUES ({', '.join('?' * (len(ARTICLE_COLUMNS) + 2))})", rows)
+            os.remove(legacy_mapping)
+        return conn
+
+    def _read_articles(self, folder: str, columns: Tuple[str, ...], limit: int) -> List[Dict]:
+        """
+        ผู้อ่าน: บทความที่ id < limit (เฉพาะ columns) จาก articles.db แบบ Read-only
+        Shard รูปแบบเดิมที่ยังไม่ถูกแปลง (migrate_legacy() ของผู้เขียนยังไม่ได้รัน) อ่านจาก news_mapping.jsonl ตรง ๆ
+        """
+        db_path = os.path.join(folder, SHARD_ARTICLES_FILENAME)
+        if os.path.exists(db_path):
+            with closing(_connect_readonly(db_path)) as conn:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute(f"SELECT {', '.join(columns)} FROM articles WHERE id < ? ORDER BY id", (limit,)).fetchall()
+            return [_row_to_article(row) for row in rows]
+        if os.path.exists(os.path.join(folder, SHARD_MAPPING_FILENAME)):
+            return [{k: v for k, v in dict(article, id=i).items() if k in columns}
+                    for i, article in enumerate(_read_legacy_mapping(folder)[:limit])]
+        return []
+
+    @staticmethod
+    def _indexed_count(folder: str) -> int:
+        """จำนวนเวกเตอร์ใน Index ของ Shard: แถวใน articles.db ที่ id ไม่น้อยกว่านี้ยังไม่มีผล (ผู้อ่านต้องกรองออก)"""
+        index_path = os.path.join(folder, SHARD_FAISS_FILENAME)
+        if not os.path.exists(index_path):
+            return 0
+        ntotal = read_index_meta(index_path).get("ntotal")
+        return faiss.read_index(index_path).ntotal if ntotal is None else ntotal
+
+    @contextmanager
+    def _writer_lock(self, folder: str):
+        """Lock ผู้เขียนของ Shard ข้ามโปรเซส (BEGIN IMMEDIATE บนไฟล์ Lock แยก) ถือไว้ตลอดการ append()"""
+        conn = sqlite3.connect(os.path.join(folder, SHARD_WRITER_LOCK_FILENAME), timeout=300.0, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield
+        finally:
+            conn.close()
+
+    def _reconcile(self, folder: str, conn: sqlite3.Connection):
+        """
+        ผู้เขียนเท่านั้น (ถือ _writer_lock อยู่): ทำ Commit ของ Index ที่ค้างให้เสร็จ
+        แล้วลบแถวที่ id >= ntotal ซึ่งมาจากรอบที่ Crash ก่อนสลับ Index สำเร็จ
+        """
+        if apply_commit_journal(folder):
+            print(f"  - ♻️  Recovered an interrupted commit in news shard '{os.path.basename(folder)}'.")
+        with conn:
+            conn.execute("DELETE FROM articles WHERE id >= ?", (self._indexed_count(folder),))
+
+    def existing_urls(self) -> Set[str]:
+        urls = set()
+        for name in self.shard_names():
+            folder = self.shard_path(name)
+            urls.update(article["url"] for article in self._read_articles(folder, ("url",), self._indexed_count(folder))
+                        if article.get("url"))
+        return urls
+
+    def append(self, articles: List[Dict], embeddings: np.ndarray, now: Optional[float] = None, key: Optional[str] = None) -> str:
+        """
+        ต่อท้ายข่าวเข้า Shard ของช่วงเวลาปัจจุบัน (หรือ key ที่ระบุ): INSERT บทความใหม่เท่านั้น (ไม่เขียนของเดิมซ้ำ)
+        แล้วสลับ Index + Meta พร้อมกัน คืนชื่อ Shard ที่ถูกเขียน
+        """
+        now = time.time() if now is None else now
+        key = key or shard_key(now)
+        folder = self.shard_path(key)
+        os.makedirs(folder, exist_ok=True)
+
+        index_path = os.path.join(folder, SHARD_FAISS_FILENAME)
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        with self._writer_lock(folder), closing(self._open_articles(folder)) as conn:
+            self._reconcile(folder, conn)
+            if os.path.exists(index_path):
+                index, spec = faiss.read_index(index_path), read_index_meta(index_path)["spec"]
+                start_id = index.ntotal
+                index.add(embeddings)
+            else:
+                # Shard ใหม่: Index ชนิดที่ต้อง Train จะ Train จากข่าวชุดแรกของ Shard
+                (index, spec), start_id = build_index(embeddings), 0
+
+            for article in articles:
+                article.setdefault("published_ts", parse_published(article.get("published_at"), now))
+
+            write_index(index, index_path + TMP_SUFFIX, spec, meta_file=index_path + META_SUFFIX + TMP_SUFFIX)
+            # บทความถูก INSERT ก่อนสลับ Index: ผู้อ่านกรอง id < ntotal จึงยังไม่เห็นจนกว่าจะสลับเสร็จ
+            # ถ้า Crash ระหว่างนี้ แถวที่เกินมาจะถูกลบโดย _reconcile() ของผู้เขียนรอบถัดไป
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO articles VALUES ({', '.join('?' * (len(ARTICLE_COLUMNS) + 2))})",
+                                 [_article_to_row(start_id + j, a) for j, a in enumerate(articles)])
+            commit_files_atomically(folder, {
+                SHARD_FAISS_FILENAME: SHARD_FAISS_FILENAME + TMP_SUFFIX,
+                SHARD_FAISS_FILENAME + META_SUFFIX: SHARD_FAISS_FILENAME + META_SUFFIX + TMP_SUFFIX,
+            })
+        return key
+
+    def migrate_legacy(self) -> int:
+        """
+        แปลง Index ข่าวแบบไฟล์เดียว (news_faiss.index + news_mapping.json) เป็น Shard ตามวันที่เผยแพร่
+        ใช้เวกเตอร์เดิมจาก Index (ไม่ต้อง Embed ใหม่) แล้วเปลี่ยนชื่อไฟล์เดิมเป็น .legacy
+        และแปลง news_mapping.jsonl ของ Shard รูปแบบเดิมเข้า articles.db (ภายใต้ Writer Lock ของแต่ละ Shard)
+        """
+        for name in self.shard_names():
+            folder = self.shard_path(name)
+            if os.path.exists(os.path.join(folder, SHARD_MAPPING_FILENAME)):
+                with self._writer_lock(folder), closing(self._open_articles(folder)):
+                    pass
+                print(f"  - 🔀 Converted news shard '{name}' mapping into {SHARD_ARTICLES_FILENAME}.")
+
+        faiss_path = os.path.join(self.news_dir, LEGACY_FAISS_FILENAME)
+        mapping_path = os.path.join(self.news_dir, LEGACY_MAPPING_FILENAME)
+        if not (os.path.exists(faiss_path) and os.path.exists(mapping_path)):
+            return 0
+
+        print("  - 🔀 Migrating the single-file news index into time shards...")
+        index = faiss.read_index(faiss_path)
+        with open(mapping_path, "r", encoding="utf-8") as f:
+            mapping = json.load(f)
+        try:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        except RuntimeError as e:
+            print(f"  - ⚠️ Cannot reconstruct vectors from the legacy news index ({e}); re-run ingestion to rebuild it.")
+            return 0
+
+        now = time.time()
+        groups: Dict[str, List[int]] = {}
+        for i in range(index.ntotal):
+            if item := mapping.get(str(i)):
+                item["published_ts"] = parse_published(item.get("published_at"), now)
+                groups.setdefault(shard_key(min(item["published_ts"], now)), []).append(i)
+        for key, ids in groups.items():
+            self.append([mapping[str(i)] for i in ids], vectors[ids], now=now, key=key)
+
+        for path in (faiss_path, faiss_path + META_SUFFIX, mapping_path):
+            if os.path.exists(path):
+                os.replace(path, path + LEGACY_SUFFIX)
+        print(f"  - ✅ Migrated {sum(len(ids) for ids in groups.values())} articles into {len(groups)} shard(s).")
+        return len(groups)
+
+    def load_shards(self, expected_dim: Optional[int] = None) -> List[NewsShard]:
+        """โหลดทุก Shard (เรียงจากใหม่ไปเก่า) สำหรับใช้ค้นหา อ่านเฉพาะ SUMMARY_COLUMNS ไม่อ่านเนื้อหาเต็ม"""
+        shards = []
+        for name in self.shard_names():
+            folder = self.shard_path(name)
+            index_path = os.path.join(folder, SHARD_FAISS_FILENAME)
+            if not os.path.exists(index_path):
+                continue
+            index = read_index(index_path, expected_dim)
+            items: List[Dict] = [{}] * index.ntotal
+            for article in self._read_articles(folder, SUMMARY_COLUMNS, index.ntotal):
+                items[article["id"]] = dict(article, shard=name)
+            db_path = os.path.join(folder, SHARD_ARTICLES_FILENAME)
+            shards.append(NewsShard(name, index, items, db_path if os.path.exists(db_path) else None))
+        return shards
+
+
+def search_shards(shards: List[NewsShard], query_vector: np.ndarray, top_k: int,
+                  now: Optional[float] = None) -> List[Tuple[float, Dict]]:
+    """
+    ค้นหาข้าม Shard โดยคะแนน = ความใกล้ (1 / (1 + L2)) x Recency Decay ของข่าวแต่ละชิ้น
+    ไล่จาก Shard ใหม่ไปเก่า และหยุดเมื่อคะแนนอันดับที่ top_k สูงกว่าเพดานคะแนนของทุก Shard ที่เหลือ
+    (เพดาน = Decay ของข่าวที่ใหม่ที่สุดใน Shard เพราะความใกล้มีค่าไม่เกิน 1)
+    ข่าวใน Cluster เดียวกัน (core/near_duplicates.py) จะเหลือเฉพาะตัวที่คะแนนสูงสุด
+    """
+    now = time.time() if now is None else now
+    query_vector = np.ascontiguousarray(query_vector, dtype="float32").reshape(1, -1)
+    ceilings = [recency_weight(shard.newest_ts, now) for shard in shards]
+    # เพดานสูงสุดของ Shard ที่เหลือตั้งแต่ตำแหน่ง i เป็นต้นไป
+    remaining_ceiling = list(ceilings)
+    for i in range(len(shards) - 2, -1, -1):
+        remaining_ceiling[i] = max(ceilings[i], remaining_ceiling[i + 1])
+
+    best: Dict[str, Tuple[float, Dict]] = {}
+    kth_score = 0.0
+    for i, shard in enumerate(shards):
+        if kth_score >= remaining_ceiling[i]:
+            break
+        k = min(shard.index.ntotal, top_k * SHARD_CANDIDATE_FACTOR)
+        if k <= 0:
+            continue
+        distances, ids = shard.index.search(query_vector, k)
+        for dist, idx in zip(distances[0], ids[0]):
+            if idx < 0 or idx >= len(shard.items) or not shard.items[idx]:
+                continue
+            item = shard.items[idx]
+            score = (1.0 / (1.0 + max(float(dist), 0.0))) * recency_weight(item.get("published_ts", now), now)
+            cluster = item.get("cluster_id") or item.get("url") or f"{shard.key}/{idx}"
+            if cluster not in best or score > best[cluster][0]:
+                best[cluster] = (score, item)
+        kth_score = heapq.nlargest(top_k, (score for score, _ in best.values()))[-1] if len(best) >= top_k else 0.0
+    return sorted(best.values(), key=lambda e: -e[0])[:top_k]
@@ -8,6 +8,13 @@ from sentence_transformers import SentenceTransformer, CrossEncoder
 import torch
 from typing import List, Dict, Any, Optional
 
+from core.batching import encode_texts, predict_pairs
+from core.config import settings
+from core.lexical_index import BM25Index, LEXICAL_INDEX_FILENAME, reciprocal_rank_fusion
+from core.news_store import NewsShard, NewsStore, search_shards
+from core.request_context import check_cancelled
+from core.vector_index import LiveIndex, read_index, read_index_meta
+
 class RAGEngine:
     def __init__(self, 
                  embedder: SentenceTransformer, 
@@ -15,25 +22,32 @@ class RAGEngine:
                  book_index_path: str = "data/index",
                  memory_index_path: str = "data/memory_index",
                  graph_index_path: str = "data/graph_index",
-                 news_index_path: str = "data/news_index"):
+                 news_index_path: str = "data/news_index",
+                 memory_live: Optional[LiveIndex] = None):
         
         print("⚙️  ห้องเครื่องยนต์ RAG (V7 - Unified) กำลังเริ่มต้น...")
         
         # รับเครื่องมือที่สร้างเสร็จแล้วจาก main.py
         self.embedder = embedder
         self.reranker = reranker
+        # มิติของ Query Vector: Index ทุกตัวต้องรับมิตินี้ (PCA/OPQ ถูกใช้ภายใน Index เองตาม Metadata)
+        self.embedding_dim = embedder.get_sentence_embedding_dimension()
         
         # --- โหลด Index ทั้งหมด ---
         self.book_indexes, self.book_mappings, self.available_categories = {}, {}, []
         self._load_book_indexes(book_index_path)
         
-        self.memory_index, self.memory_mapping = None, None
-        self._load_memory_index(memory_index_path)
+        # ใช้ LiveIndex ร่วมกับ LongTermMemoryManager ถ้าส่งมา (ความทรงจำใหม่จาก Worker จะเห็นทันทีทั้งสองฝั่ง)
+        self.memory_live = memory_live or LiveIndex()
+        if memory_live is None:
+            self._load_memory_index(memory_index_path)
+        else:
+            print(f"  - 🧠 Memory Knowledge Base shared with LTM manager ({memory_live.ntotal} memories).")
 
         self.graph_index, self.graph_mapping = None, None
         self._load_graph_index(graph_index_path)
 
-        self.news_index, self.news_mapping = None, None
+        self.news_shards: List[NewsShard] = []
         self._load_news_index(news_index_path)
 
         print("✅ Unified RAG Engine is ready.")
@@ -52,14 +66,28 @@ class RAGEngine:
                     index_path = os.path.join(category_path, "faiss.index")
                     mapping_path = os.path.join(category_path, "mapping.jsonl")
                     if not os.path.exists(index_path) or not os.path.exists(mapping_path): continue
-                    index = faiss.read_index(index_path)
+                    index = read_index(index_path, self.embedding_dim)
                     mapping = {str(i): json.loads(line) for i, line in enumerate(open(mapping_path, "r", encoding="utf-8"))}
-                    self.book_indexes[category_name] = {"index": index, "mapping": mapping}
+                    self.book_indexes[category_name] = {"index": index, "mapping": mapping, "lexical": self._load_lexical_index(category_path, len(mapping))}
                     self.available_categories.append(category_name)
                 except Exception as e:
                     print(f"    - ❌ Error loading book index for '{category_name}': {e}")
         self.available_categories.sort()
-        print(f"    - ✅ ความรู้หนังสือ {len(self.available_categories)} หมวดหมู่ พร้อมใช้งาน")
+        specs = sorted({read_index_meta(os.path.join(base_path, c, "faiss.index"))["spec"] for c in self.available_categories})
+        print(f"    - ✅ ความรู้หนังสือ {len(self.available_categories)} หมวดหมู่ พร้อมใช้งาน (index: {', '.join(specs) or '-'})")
+
+    def _load_lexical_index(self, category_path: str, expected_docs: int) -> Optional[BM25Index]:
+        lexical_path = os.path.join(category_path, LEXICAL_INDEX_FILENAME)
+        if not os.path.exists(lexical_path): return None
+        try:
+            lexical = BM25Index.load(lexical_path)
+        except Exception as e:
+            print(f"    - ⚠️ Lexical index for '{os.path.basename(category_path)}' unavailable, using vector-only: {e}")
+            return None
+        if lexical.num_docs != expected_docs:
+            print(f"    - ⚠️ Lexical index for '{os.path.basename(category_path)}' is stale ({lexical.num_docs} != {expected_docs}). Using vector-only.")
+            return None
+        return lexical
 
     def _load_memory_index(self, path: str):
         print("  - 🧠 Loading Memory Knowledge Base (FAISS on CPU)...")
@@ -68,15 +96,21 @@ class RAGEngine:
             return
         try:
             faiss_path = os.path.join(path, "memory_faiss.index") 
-            mapping_path = os.path.join(path, "memory_mapping.json")
+            mapping_path = os.path.join(path, "memory_mapping.jsonl")
             if not os.path.exists(faiss_path) or not os.path.exists(mapping_path): return
-            self.memory_index = faiss.read_index(faiss_path)
-            with open(mapping_path, "r", encoding="utf-8") as f:
-                self.memory_mapping = list(json.load(f).values())
+            self.memory_live.replace(*LiveIndex.load(faiss_path, mapping_path, self.embedding_dim).snapshot())
             print(f"    - ✅ สมองส่วนความทรงจำ {len(self.memory_mapping)} ตื่น!!")
         except Exception as e:
             print(f"    - ❌ Critical error loading memory index: {e}")
 
+    @property
+    def memory_index(self) -> Optional[faiss.Index]:
+        return self.memory_live.snapshot()[0]
+
+    @property
+    def memory_mapping(self) -> List[Dict]:
+        return self.memory_live.snapshot()[1]
+
     def _load_graph_index(self, path: str):
         print("  - 🕸️  Loading Knowledge Graph Vector Base (FAISS on CPU)...")
         if not os.path.exists(path):
@@ -86,7 +120,7 @@ class RAGEngine:
             faiss_path = os.path.join(path, "graph_faiss.index") 
             mapping_path = os.path.join(path, "graph_mapping.jsonl")
             if not os.path.exists(faiss_path) or not os.path.exists(mapping_path): return
-            self.graph_index = faiss.read_index(faiss_path)
+            self.graph_index = read_index(faiss_path, self.embedding_dim)
             mapping = {str(i): json.loads(line) for i, line in enumerate(open(mapping_path, "r", encoding="utf-8"))}
             self.graph_mapping = mapping
             print(f"    - ✅ ฐานความรู้ Knowledge Graph {len(self.graph_mapping)} พร้อมใช้งาน!")
@@ -94,18 +128,18 @@ class RAGEngine:
             print(f"    - ❌ Critical error loading graph index: {e}")
 
     def _load_news_index(self, path: str):
-        print("  - 📰 Loading News Vector Base (FAISS on CPU)...")
+        print("  - 📰 Loading News Vector Shards (FAISS on CPU)...")
         if not os.path.exists(path):
             print(f"    - 🟡 News RAG index path not found: '{path}'.")
             return
         try:
-            faiss_path = os.path.join(path, "news_faiss.index") 
-            mapping_path = os.path.join(path, "news_mapping.json")
-            if not os.path.exists(faiss_path) or not os.path.exists(mapping_path): return
-            self.news_index = faiss.read_index(faiss_path)
-            with open(mapping_path, "r", encoding="utf-8") as f:
-                self.news_mapping = json.load(f)
-            print(f"    - ✅ ฐานข้อมูลข่าวกรอง {len(self.news_mapping)} บทความ พร้อมใช้งาน!")
+            self.news_shards = NewsStore(path).load_shards(self.embedding_dim)
+            if not self.news_shards:
+                print("    - 🟡 No news shards found. Run manage_news.py to build (or migrate) the news index.")
+                return
+            total = sum(len(shard.items) for shard in self.news_shards)
+            print(f"    - ✅ ฐานข้อมูลข่าวกรอง {total} บทความ ใน {len(self.news_shards)} Shard "
+                  f"({self.news_shards[-1].key} → {self.news_shards[0].key}) พร้อมใช้งาน!")
         except Exception as e:
             print(f"    - ❌ Critical error loading news index: {e}")
 
@@ -115,27 +149,36 @@ class RAGEngine:
         all_titles = set(item.get("book_title").strip() for cat_data in self.book_indexes.values() for item in cat_data["mapping"].values() if item.get("book_title"))
         return sorted(list(all_titles))
 
-    def search_books(self, query: str, top_k_retrieval: int = 10, top_k_rerank: int = 5, 
+    def search_books(self, query: str, top_k_retrieval: Optional[int] = None, top_k_rerank: int = 5, 
                    return_raw_chunks: bool = False, 
                    target_categories: Optional[List[str]] = None) -> Dict[str, Any]:
+        check_cancelled()
+        top_k_retrieval = top_k_retrieval or settings.RAG_TOP_K_RETRIEVAL
         search_scope = {cat: self.book_indexes[cat] for cat in target_categories if cat in self.book_indexes} if target_categories else self.book_indexes
         if not search_scope: search_scope = self.book_indexes
         
-        all_candidates = []
-        query_vector = self.embedder.encode(["query: " + query], convert_to_numpy=True)
+        # --- รอบแรก: ค้นหาทั้งแบบ Vector และ BM25 แล้วรวมอันดับด้วย Reciprocal Rank Fusion ---
+        ranked_lists = []
+        query_vector = encode_texts(self.embedder, ["query: " + query])
         
         for category, data in search_scope.items():
             distances, indices = data["index"].search(query_vector, top_k_retrieval)
-            for i in indices[0]:
-                if item := data["mapping"].get(str(i)):
-                    item['category'] = category 
-                    all_candidates.append(item)
+            ranked_lists.append([(category, int(i)) for i in indices[0] if i >= 0])
+            if data.get("lexical"):
+                ranked_lists.append([(category, doc_id) for doc_id, _ in data["lexical"].search(query, top_k_retrieval)])
+        
+        all_candidates = []
+        for (category, i), _ in reciprocal_rank_fusion(ranked_lists, k=settings.RAG_RRF_K):
+            if item := search_scope[category]["mapping"].get(str(i)):
+                item['category'] = category 
+                all_candidates.append(item)
         
         if not all_candidates: return {"context": "", "sources": [], "raw_chunks": []}
         
-        unique_candidates = list({item['embedding_text']: item for item in all_candidates}.values())
+        check_cancelled() # Rerank เป็นขั้นที่แพงที่สุด: ไม่ทำถ้า Request ถูกยกเลิกระหว่างค้นหา
+        unique_candidates = list({item['embedding_text']: item for item in all_candidates}.values())[:settings.RAG_MAX_RERANK_CANDIDATES]
         sentence_pairs = [[query, item.get('embedding_text', '')] for item in unique_candidates]
-        scores = self.reranker.predict(sentence_pairs)
+        scores = predict_pairs(self.reranker, sentence_pairs)
         
         reranked_results = sorted(zip(scores, unique_candidates), key=lambda x: x[0], reverse=True)
         top_results = reranked_results[:top_k_rerank]
@@ -153,20 +196,23 @@ class RAGEngine:
         return result
 
     def search_memory(self, query: str, top_k: int = 5) -> List[Dict]:
-        if not self.memory_index or not self.memory_mapping: return []
-        query_vector = self.embedder.encode(["query: " + query], convert_to_numpy=True)
-        distances, indices = self.memory_index.search(query_vector, top_k)
+        check_cancelled()
+        memory_index, memory_mapping = self.memory_live.snapshot()
+        if not memory_index or not memory_mapping: return []
+        query_vector = encode_texts(self.embedder, ["query: " + query])
+        distances, indices = memory_index.search(query_vector, top_k)
         results = []
         for dist, i in zip(distances[0], indices[0]):
-            if i < len(self.memory_mapping):
-                item = self.memory_mapping[i].copy()
+            if 0 <= i < len(memory_mapping):
+                item = memory_mapping[i].copy()
                 item['score'] = float(dist)
                 results.append(item)
         return results
 
     def search_graph(self, query: str, top_k: int = 3) -> List[Dict]:
+        check_cancelled()
         if not self.graph_index or not self.graph_mapping: return []
-        query_vector = self.embedder.encode(["query: " + query], convert_to_numpy=True)
+        query_vector = encode_texts(self.embedder, ["query: " + query])
         distances, indices = self.graph_index.search(query_vector, top_k)
         results, found_ids = [], set()
         for dist, i in zip(distances[0], indices[0]):
@@ -180,12 +226,21 @@ class RAGEngine:
         return results
 
     def search_news(self, query: str, top_k: int = 7) -> str:
-        if not self.news_index or not self.news_mapping: return "ไม่พบข้อมูลข่าวสารที่เกี่ยวข้อง"
-        query_vector = self.embedder.encode(["query: " + query], convert_to_numpy=True)
-        distances, indices = self.news_index.search(query_vector, top_k)
+        check_cancelled()
+        if not self.news_shards: return "ไม่พบข้อมูลข่าวสารที่เกี่ยวข้อง"
+        query_vector = encode_texts(self.embedder, ["query: " + query])
+        # ไล่จาก Shard ใหม่ไปเก่า คะแนนถูกลดตามอายุข่าว (NEWS_RECENCY_HALF_LIFE_DAYS)
         results = []
-        for i in indices[0]:
-            if item := self.news_mapping.get(str(i)):
-                context = f"จากแหล่งข่าว '{item.get('source_name')}':\nหัวข้อ: {item.get('title')}\nสรุป: {item.get('description')}\n---\n"
-                results.append(context)
-        return "\n".join(results) if results else "ไม่พบข้อมูลข่าวสารที่เกี่ยวข้อง"
\ No newline at end of file
+        for _, item in search_shards(self.news_shards, query_vector, top_k):
+            header = f"จากแหล่งข่าว '{item.get('source_name')}'"
+            if also := item.get('also_reported_by'):
+                # ข่าวเดียวกันจากแหล่งอื่นถูกรวมไว้ที่ตัวแทน (core/near_duplicates.py)
+                header += f" (และ {', '.join(also)})"
+            context = f"{header}:\nหัวข้อ: {item.get('title')}\nสรุป: {item.get('description')}\n---\n"
+            results.append(context)
+        return "\n".join(results) if results else "ไม่พบข้อมูลข่าวสารที่เกี่ยวข้อง"
+
+    def get_news_article(self, item: Dict) -> Optional[Dict]:
+        """โหลดบทความเต็ม (รวม full_content) ของผลค้นหาข่าวจาก articles.db ของ Shard เมื่อต้องการเท่านั้น"""
+        shard = next((s for s in self.news_shards if s.key == item.get("shard")), None)
+        return shard.load_article(item["id"]) if shard and "id" in item else None
\ No newline at end of file
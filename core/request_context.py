@@ -0,0 +1,141 @@
+# core/request_context.py
+# (V1.0 - Request Deadline & Cancellation Context)
+# บริบทของคำถามหนึ่งครั้ง สร้างที่ Endpoint แล้วส่งผ่าน ContextVar ไปถึงทุก Agent, ทุกการเรียก LLM และทุกการค้นหา RAG
+# (asyncio.to_thread คัดลอก ContextVar ไปให้ Thread ของ Agent อัตโนมัติ)
+# - ยกเลิกได้จากภายนอก: WebSocket หลุด, ผู้ใช้ส่งข้อความใหม่ (Session เดียวกัน) หรือเลย Deadline
+# - โค้ดฝั่ง Agent เป็น Sync จึงหยุดได้ที่ Checkpoint เท่านั้น: ก่อนเรียก LLM, ระหว่างรอ Backoff และก่อนค้นหา RAG
+# RequestCancelled สืบทอดจาก BaseException (แบบเดียวกับ asyncio.CancelledError)
+# เพื่อไม่ให้ "except Exception" ของ Agent กลืนไปแล้วตอบเป็นข้อผิดพลาดทั่วไป
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional
+
+from core.config import settings
+
+_current: ContextVar[Optional["RequestContext"]] = ContextVar("request_context", default=None)
+
+
+class RequestCancelled(BaseException):
+    """Request ถูกยกเลิก (reason: 'superseded', 'disconnected', 'deadline', ...)"""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RequestContext:
+    def __init__(self, session_id: str, timeout: Optional[float] = None):
+        self.session_id = session_id
+        self.request_id = uuid.uuid4().hex[:8]
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        # ตั้งโดย Dispatcher เมื่อ Endpoint มี update_callback: เรียกได้จากทุก Thread
+        self.progress_sink: Optional[Callable[[dict], None]] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        """ยกเลิก Request (เรียกซ้ำได้ เหตุผลแรกเป็นตัวที่ถูกบันทึก)"""
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """วินาทีที่เหลือก่อน Deadline (None = ไม่มีกำหนด)"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self):
+        """Checkpoint: โยน RequestCancelled ถ้าถูกยกเลิกหรือเลย Deadline แล้ว"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.cancel("deadline")
+        if self._cancelled.is_set():
+            raise RequestCancelled(self.reason)
+
+    def sleep(self, seconds: float):
+        """รอแบบตื่นทันทีเมื่อถูกยกเลิก (ใช้แทน time.sleep ในโค้ด Sync ของ Agent)"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, max(remaining, 0.0))
+        self._cancelled.wait(seconds)
+        self.check()
+
+
+@contextmanager
+def use_context(context: RequestContext) -> Iterator[RequestContext]:
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+def current_context() -> Optional[RequestContext]:
+    return _current.get()
+
+
+def check_cancelled():
+    """Checkpoint สำหรับโค้ดที่ไม่รู้จัก Request (RAG, Agent): ไม่มีผลถ้าไม่ได้อยู่ใน Request"""
+    context = _current.get()
+    if context is not None:
+        context.check()
+
+
+def report_progress(status: str, agent: str, detail: str, **extra):
+    """ส่งความคืบหน้าให้ Client ของ Request ปัจจุบัน (เช่น Output ระหว่างรันโค้ด) ไม่มีผลถ้าไม่มีผู้รับ"""
+    context = _current.get()
+    if context is not None and context.progress_sink is not None and not context.cancelled:
+        context.progress_sink({"type": "progress", "payload": dict(extra, status=status, agent=agent, detail=detail)})
+
+
+def interruptible_sleep(seconds: float):
+    context = _current.get()
+    if context is None:
+        time.sleep(seconds)
+    else:
+        context.sleep(seconds)
+
+
+class SessionRequests:
+    """
+    Request ที่กำลังทำงานของแต่ละ Session: Request ใหม่ของ Session เดียวกันยกเลิก Request เก่า ('superseded')
+    เพื่อไม่ให้งานวิเคราะห์ที่ไม่มีใครรอคำตอบแล้วยังกิน Thread และโควต้า LLM
+    """
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = settings.REQUEST_DEADLINE_SECONDS if timeout is None else timeout
+        self._lock = threading.Lock()
+        self._active: Dict[str, RequestContext] = {}
+        self.superseded_count = 0
+
+    def start(self, session_id: str) -> RequestContext:
+        context = RequestContext(session_id, self.timeout)
+        with self._lock:
+            previous = self._active.get(session_id)
+            self._active[session_id] = context
+        if previous is not None and not previous.cancelled:
+            previous.cancel("superseded")
+            self.superseded_count += 1
+            print(f"⏭️ [Request] Session '{session_id}': request {previous.request_id} superseded by {context.request_id}.")
+        return context
+
+    def finish(self, context: RequestContext):
+        with self._lock:
+            if self._active.get(context.session_id) is context:
+                del self._active[context.session_id]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            active = list(self._active.values())
+        now = time.monotonic()
+        return {
+            "active_requests": len(active),
+            "superseded_requests": self.superseded_count,
+            "oldest_active_seconds": round(max((now - c.started_at for c in active), default=0.0), 2),
+        }
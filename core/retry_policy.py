@@ -0,0 +1,311 @@
+# core/retry_policy.py
+# (V1.0 - Bounded, Backoff-aware LLM Calls with Deadline Budget & Fallback Models)
+# ทุก Agent เรียก LLM ผ่าน call_llm() แทนการ retry เอง (เดิมบาง Agent เรียกตัวเองซ้ำแบบไม่จำกัดเมื่อเจอ 429)
+# - จำนวนครั้งจำกัด (LLM_MAX_ATTEMPTS ต่อโมเดล) และรอแบบ Exponential backoff + Full jitter ระหว่างครั้ง
+# - Retry-After / retry_delay จาก API ถูกส่งต่อเป็น Cooldown ของคีย์นั้น (ครั้งถัดไปจึงได้คีย์อื่นทันที)
+# - ขอคีย์ด้วย acquire() (รอ RPM/TPM Bucket ภายในงบเวลา) และรายงาน Token ที่ใช้จริงกลับด้วย report_usage()
+#   429 ที่เกิดจาก Token ทำให้ Key Manager เรียนรู้ TPM แทน RPM
+# - Deadline ต่อ Request: มาจาก RequestContext (core/request_context.py) หรือ request_deadline() สำหรับสคริปต์
+#   ใช้เป็น Timeout ของ HTTP และหยุด retry เมื่องบเวลาหมด; Request ที่ถูกยกเลิกหยุดก่อนเรียก LLM ครั้งถัดไปและระหว่าง Backoff
+# - Fallback: โมเดลสำรองของ Provider เดียวกัน แล้วจึงข้าม Provider (Gemini <-> Groq) ถ้าลงทะเบียน Key Manager ไว้
+
+import asyncio
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.config import settings
+from core.key_scheduler import AllKeysUnavailableError
+from core.request_context import check_cancelled, current_context, interruptible_sleep
+
+# ประเภท Error ที่เป็นความผิดของคีย์ (ส่งให้ Key Manager ตั้ง Cooldown); server_error/timeout ลองใหม่โดยไม่โทษคีย์
+KEY_ERRORS = ("rate_limit", "quota", "invalid_key")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_request_deadline", default=None)
+_providers: Dict[str, Any] = {}
+
+
+class LLMCallError(Exception):
+    """เรียก LLM ไม่สำเร็จหลังลองครบทุกโมเดล/ทุกครั้งที่อนุญาต (last_error คือสาเหตุล่าสุด)"""
+    def __init__(self, message: str, last_error: Optional[BaseException] = None):
+        super().__init__(message)
+        self.last_error = last_error
+
+
+class DeadlineExceeded(LLMCallError):
+    """งบเวลาของ Request หมดก่อนเรียก LLM สำเร็จ"""
+    pass
+
+
+# --- Deadline ต่อ Request ---
+
+@contextmanager
+def request_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """ตั้งงบเวลาสำหรับทุกการเรียก LLM ภายใน Block นี้ (ซ้อนกันได้: ใช้ค่าที่หมดก่อน)"""
+    if not seconds:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """วินาทีที่เหลือของ Request ปัจจุบัน (None = ไม่มีกำหนด) ค่าที่น้อยกว่าระหว่าง request_deadline() กับ RequestContext"""
+    deadline = _deadline.get()
+    remaining = None if deadline is None else deadline - time.monotonic()
+    context = current_context()
+    context_remaining = context.remaining() if context is not None else None
+    if context_remaining is None:
+        return remaining
+    return context_remaining if remaining is None else min(remaining, context_remaining)
+
+
+# --- การจำแนก Error ---
+
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in\s*([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"try again in\s*(?:(\d+)m)?([\d.]+)s", re.IGNORECASE),
+)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+    text = str(exc)
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            groups = match.groups()
+            if len(groups) == 2:
+                return float(groups[0] or 0) * 60 + float(groups[1])
+            return float(groups[0])
+    return None
+
+
+_TOKEN_LIMIT_PATTERN = re.compile(r"tokens? per (?:minute|min)|\btpm\b|token_count")
+_STATED_LIMIT_PATTERN = re.compile(r"limit\s*[:=]?\s*(\d+)")
+
+
+def limited_resource(exc: BaseException) -> Tuple[str, Optional[float]]:
+    """
+    429 นี้ชนขีดจำกัดอะไร: ('tokens', ขีดจำกัดที่ API บอกมาถ้ามี) หรือ ('requests', None)
+    เช่น Groq: "Rate limit reached ... on tokens per minute (TPM): Limit 6000, Used 5800"
+    """
+    text = str(exc).lower()
+    if not _TOKEN_LIMIT_PATTERN.search(text):
+        return "requests", None
+    match = _STATED_LIMIT_PATTERN.search(text)
+    return "tokens", float(match.group(1)) if match else None
+
+
+def classify_error(exc: BaseException) -> Tuple[str, Optional[float]]:
+    """
+    คืน (ประเภท, retry_after) โดยดู status code ของ SDK ก่อน แล้วจึงดูข้อความ
+    ประเภท: rate_limit | quota | invalid_key | server_error | timeout | fatal
+    """
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    status = status if isinstance(status, int) else None
+    text = str(exc).lower()
+    name = exc.__class__.__name__.lower()
+
+    if status == 429 or "429" in text or "rate limit" in text or "ratelimit" in name or "resourceexhausted" in name:
+        kind = "quota" if re.search(r"per[ _]?day|daily", text) else "rate_limit"
+        return kind, _retry_after(exc)
+    # เฉพาะ 401 หรือข้อความที่บอกชัดว่าคีย์ผิดเท่านั้นที่โทษคีย์ (Cooldown ยาวมากและแชร์ข้าม Process)
+    # 403 อื่น ๆ (PermissionDenied: ภูมิภาคไม่รองรับ, ยังไม่เปิดใช้ API) ไม่ใช่ความผิดของคีย์ ลองคีย์อื่นก็ไม่ช่วย
+    if (status == 401 or "authentication" in name or "unauthenticated" in name
+            or "api key not valid" in text or "invalid api key" in text):
+        return "invalid_key", None
+    if status == 403 or "permissiondenied" in name:
+        return "fatal", None
+    if (status is not None and status >= 500) or re.search(r"\b50[0234]\b|unavailable|overloaded|internal error", text):
+        return "server_error", _retry_after(exc)
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or "timeout" in name or "timed out" in text or "deadline" in name:
+        return "timeout", None
+    return "fatal", None
+
+
+# --- เส้นทางโมเดล (หลัก -> สำรอง -> ข้าม Provider) ---
+
+@dataclass(frozen=True)
+class ModelRoute:
+    key_manager: Any
+    model_name: str
+
+    @property
+    def provider(self) -> str:
+        return getattr(self.key_manager, "provider", "default")
+
+
+def register_provider(key_manager: Any):
+    """ลงทะเบียน Key Manager ของ Provider (main.py) เพื่อใช้เป็นปลายทาง Fallback ข้าม Provider"""
+    _providers[key_manager.provider] = key_manager
+
+
+def _fallback_model(provider: str) -> str:
+    return {"google": settings.LLM_FALLBACK_GEMINI_MODEL, "groq": settings.LLM_FALLBACK_GROQ_MODEL}.get(provider, "")
+
+
+def _primary_model(provider: str) -> str:
+    return {"google": settings.PRIMARY_GEMINI_MODEL, "groq": settings.PRIMARY_GROQ_MODEL}.get(provider, "")
+
+
+def build_routes(key_manager: Any, model_name: str) -> List[ModelRoute]:
+    routes = [ModelRoute(key_manager, model_name)]
+    provider = routes[0].provider
+    fallback = _fallback_model(provider)
+    if fallback and fallback != model_name:
+        routes.append(ModelRoute(key_manager, fallback))
+    if settings.LLM_CROSS_PROVIDER_FALLBACK:
+        for other, manager in _providers.items():
+            if other != provider and manager.all_keys and _primary_model(other):
+                routes.append(ModelRoute(manager, _primary_model(other)))
+    return routes
+
+
+# --- นโยบาย Retry ---
+
+class RetryPolicy:
+    def __init__(self, max_attempts: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None):
+        self.max_attempts = max_attempts or settings.LLM_MAX_ATTEMPTS
+        self.base_delay = settings.LLM_BACKOFF_BASE_SECONDS if base_delay is None else base_delay
+        self.max_delay = settings.LLM_BACKOFF_MAX_SECONDS if max_delay is None else max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: สุ่มระหว่าง 0 ถึง min(max_delay, base * 2^attempt)"""
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _attempts(self, routes: List[ModelRoute]):
+        """ลำดับ (route, attempt) ที่จะลอง หยุด Route นั้นเมื่อทุกคีย์ติด Cooldown"""
+        for route in routes:
+            for attempt in range(self.max_attempts):
+                yield route, attempt
+
+    def _on_error(self, route: ModelRoute, api_key: str, exc: BaseException, attempt: int) -> Optional[float]:
+        """บันทึกความล้มเหลว คืนเวลาที่ต้องรอก่อนลองใหม่ (None = ไม่ควรลองใหม่)"""
+        kind, retry_after = classify_error(exc)
+        label = f"{route.provider}/{route.model_name}"
+        if kind == "fatal":
+            return None
+        if kind == "rate_limit":
+            limited_on, stated_limit = limited_resource(exc)
+            route.key_manager.report_failure(api_key, error_type=kind, retry_after=retry_after,
+                                             limited_on=limited_on, stated_limit=stated_limit)
+        elif kind in KEY_ERRORS:
+            route.key_manager.report_failure(api_key, error_type=kind, retry_after=retry_after)
+        if kind in KEY_ERRORS:
+            print(f"  - 🔁 [Retry] {label} key '...{api_key[-4:]}' hit {kind}; trying again (attempt {attempt + 1}/{self.max_attempts}).")
+            # ครั้งถัดไปได้คีย์อื่นอยู่แล้ว: รอเพียงสั้นๆ เพื่อไม่ให้เกิด Retry storm
+            return self.backoff(min(attempt, 1))
+        delay = max(self.backoff(attempt), retry_after or 0.0)
+        print(f"  - 🔁 [Retry] {label} {kind}: {exc}. Backing off {delay:.2f}s (attempt {attempt + 1}/{self.max_attempts}).")
+        return delay
+
+    @staticmethod
+    def _check_budget(delay: float = 0.0) -> Optional[float]:
+        """Timeout ที่เหลือสำหรับการเรียกครั้งถัดไป โยน DeadlineExceeded ถ้างบเวลาไม่พอ (RequestCancelled ถ้าถูกยกเลิก)"""
+        check_cancelled()
+        remaining = remaining_budget()
+        if remaining is None:
+            return None
+        if remaining - delay <= 0.05:
+            raise DeadlineExceeded(f"LLM request deadline exceeded ({remaining:.2f}s left, needed {delay:.2f}s).")
+        return remaining - delay
+
+    def call(self, routes: List[ModelRoute], invoke: Callable[[ModelRoute, str, Optional[float]], Any]) -> Any:
+        """
+        เรียก invoke(route, api_key, timeout) จนสำเร็จ ลองซ้ำ/เปลี่ยนโมเดลตามนโยบาย
+        รอคีย์ (acquire) และรอระหว่างครั้งด้วย interruptible_sleep จึงหยุดทันทีเมื่อ Request ถูกยกเลิก
+        """
+        last_error: Optional[BaseException] = None
+        exhausted_route = None
+        for route, attempt in self._attempts(routes):
+            if route is exhausted_route:
+                continue
+            timeout = self._check_budget()
+            try:
+                api_key = route.key_manager.acquire(timeout=timeout)
+            except AllKeysUnavailableError as e:
+                last_error, exhausted_route = e, route
+                continue
+            try:
+                return invoke(route, api_key, self._check_budget())
+            except Exception as e:
+                last_error = e
+                delay = self._on_error(route, api_key, e, attempt)
+                if delay is None:
+                    raise
+                self._check_budget(delay)
+                interruptible_sleep(delay)
+        raise LLMCallError(f"LLM call failed after trying {len(routes)} model route(s): {last_error}", last_error)
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+# --- ตัวเรียก LLM ของแต่ละ Provider ---
+
+def _messages_to_prompt(messages: List[Dict[str, str]]) -> str:
+    return "\n\n".join(m["content"] if m.get("role") != "assistant" else f"(คำตอบก่อนหน้า)\n{m['content']}" for m in messages)
+
+
+def _invoke(route: ModelRoute, api_key: str, timeout: Optional[float], prompt: Optional[str],
+            messages: Optional[List[Dict[str, str]]], safety_settings, options: Dict[str, Any]) -> str:
+    if route.provider == "google":
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(route.model_name)
+        generation_config = {k: options[k] for k in ("temperature", "max_output_tokens") if k in options} or None
+        if "max_tokens" in options:
+            generation_config = dict(generation_config or {}, max_output_tokens=options["max_tokens"])
+        response = model.generate_content(
+            prompt if prompt is not None else _messages_to_prompt(messages),
+            safety_settings=safety_settings, generation_config=generation_config,
+            request_options={"timeout": timeout} if timeout else None,
+        )
+        if response.prompt_feedback and response.prompt_feedback.block_reason:
+            raise ValueError(f"Gemini API blocked the prompt. Reason: {response.prompt_feedback.block_reason}")
+        usage = getattr(response, "usage_metadata", None)
+        route.key_manager.report_usage(api_key, getattr(usage, "total_token_count", 0) or 0)
+        return response.text
+
+    from groq import Groq
+    client = Groq(api_key=api_key, max_retries=0)
+    chat_completion = client.chat.completions.create(
+        messages=messages if messages is not None else [{"role": "user", "content": prompt}],
+        model=route.model_name, timeout=timeout,
+        **{k: v for k, v in options.items() if k in ("temperature", "max_tokens", "top_p", "stop")},
+    )
+    route.key_manager.report_usage(api_key, getattr(chat_completion.usage, "total_tokens", 0) or 0)
+    return chat_completion.choices[0].message.content
+
+
+def call_llm(key_manager: Any, model_name: str, prompt: Optional[str] = None,
+             messages: Optional[List[Dict[str, str]]] = None, safety_settings=None,
+             policy: Optional[RetryPolicy] = None, fallback: bool = True, **options) -> str:
+    """
+    เรียก LLM ตาม Provider ของ key_manager ด้วย prompt (ข้อความเดียว) หรือ messages (รูปแบบ Chat)
+    ลองซ้ำ/Fallback ตาม RetryPolicy และคืนข้อความคำตอบ; โยน LLMCallError เมื่อไม่สำเร็จ
+    Error ที่ไม่ควรลองใหม่ (เช่น 400, ถูกบล็อก) ถูกโยนต่อทันที
+    """
+    routes = build_routes(key_manager, model_name) if fallback else [ModelRoute(key_manager, model_name)]
+    return (policy or DEFAULT_POLICY).call(
+        routes, lambda route, api_key, timeout: _invoke(route, api_key, timeout, prompt, messages, safety_settings, options))
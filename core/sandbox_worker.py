@@ -0,0 +1,144 @@
+# core/sandbox_worker.py
+# (V1.0 - Pre-warmed Sandbox Zygote)
+# โปรเซสลูกของ SandboxPool (core/code_executor.py) ถูกรันด้วย "python -I core/sandbox_worker.py <modules>"
+# (-I: sys.path ไม่มีโฟลเดอร์ core/ และ Environment ถูกกรองจนเหลือแค่ค่าพื้นฐาน ไม่มี API Key)
+# - Import ไลบรารีที่ใช้บ่อย (pandas, numpy, ...) ไว้ครั้งเดียวตอนเริ่ม
+# - รับงานทีละบรรทัด (JSON) ทาง stdin แล้ว fork โปรเซสใหม่ต่องาน: โปรเซสงานได้โมดูลที่โหลดไว้แล้วทันที
+#   แต่ไม่เห็นตัวแปร/สถานะของงานก่อนหน้า และถูกจำกัด CPU/หน่วยความจำด้วย rlimit ของตัวเอง
+# - ตอบกลับเป็น JSON ทีละบรรทัดทาง stdout: {"started": pid} ทันทีที่ fork (ให้ผู้เรียกฆ่างานได้) แล้วจึงผลลัพธ์
+#   stdout/stderr ของโค้ดผู้ใช้ถูกเขียนลงไฟล์ที่ผู้เรียกกำหนด (นอกโฟลเดอร์ทำงาน) เพื่อให้อ่านแบบ Streaming ระหว่างรันได้
+# ใช้เฉพาะ Standard library และห้าม Import โมดูลของโปรเจกต์ (โปรเซสนี้ไม่ควรเห็น API Key หรือ Config ใดๆ)
+
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+SCRIPT_FILENAME = "script.py"
+
+
+def _virtual_memory_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _run_child(job: dict, memory_base: int):
+    """ทำงานในโปรเซสที่ fork มา: ตั้งข้อจำกัด, ย้ายไปโฟลเดอร์ของงาน แล้วรันสคริปต์ (ไม่ return)"""
+    import resource # มีเฉพาะ POSIX: Import ตอนใช้ เพื่อให้ code_executor.py Import ค่าคงที่จากไฟล์นี้ได้บน Windows
+    status = 0
+    try:
+        os.setsid() # แยก Process group: ฆ่าได้ทั้งกลุ่มรวมถึงโปรเซสที่โค้ดผู้ใช้สร้าง
+        os.chdir(job["cwd"])
+        cpu_seconds = job.get("cpu_seconds")
+        if cpu_seconds:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        memory_mb = job.get("memory_mb")
+        if memory_mb:
+            # RLIMIT_AS นับรวมหน่วยความจำที่ Zygote โหลดไว้แล้ว จึงให้เพิ่มได้อีก memory_mb จากจุดนั้น
+            limit = memory_base + memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        max_file_bytes = job.get("max_file_bytes")
+        if max_file_bytes:
+            # จำกัดขนาดไฟล์ที่เขียนได้ (รวมไฟล์ Output): เกินแล้ว write() ได้ OSError (Python ไม่สนใจ SIGXFSZ)
+            resource.setrlimit(resource.RLIMIT_FSIZE, (max_file_bytes, max_file_bytes))
+
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        out_fd = os.open(job["stdout_path"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        err_fd = os.open(job["stderr_path"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(null_fd, 0); os.dup2(out_fd, 1); os.dup2(err_fd, 2)
+        sys.stdin = open(0, "r", closefd=False)
+        # buffering=1 (Line buffering): Output ถึงไฟล์ทันทีที่ขึ้นบรรทัดใหม่ ผู้เรียกจึงเห็นความคืบหน้าระหว่างรัน
+        sys.stdout = open(1, "w", encoding="utf-8", closefd=False, buffering=1)
+        sys.stderr = open(2, "w", encoding="utf-8", closefd=False, buffering=1)
+
+        with open(SCRIPT_FILENAME, encoding="utf-8") as f:
+            source = f.read()
+        sys.argv = [SCRIPT_FILENAME]
+        sys.path.insert(0, job["cwd"])
+        exec(compile(source, SCRIPT_FILENAME, "exec"), {"__name__": "__main__", "__file__": SCRIPT_FILENAME})
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, (int, type(None))):
+            print(e.code, file=sys.stderr)
+    except BaseException as e:
+        # ตัดเฟรมของ Worker ออก ให้ Traceback เริ่มที่ script.py เหมือนรันไฟล์เอง
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = 1
+    finally:
+        try:
+            sys.stdout.flush(); sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+
+def run_job(job: dict, memory_base: int, out) -> dict:
+    started = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        _run_child(job, memory_base)
+    out.write(json.dumps({"started": pid}) + "\n")
+    out.flush()
+
+    deadline = started + job.get("timeout", 30)
+    timed_out, wait_status = False, None
+    while True:
+        done_pid, wait_status = os.waitpid(pid, os.WNOHANG)
+        if done_pid:
+            break
+        if time.monotonic() >= deadline:
+            timed_out = True
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, wait_status = os.waitpid(pid, 0)
+            break
+        time.sleep(0.005)
+    # เก็บกวาดโปรเซสที่โค้ดผู้ใช้แตกออกไปแล้วยังค้างอยู่ใน Process group เดียวกัน
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+    killed_by = os.WTERMSIG(wait_status) if os.WIFSIGNALED(wait_status) else None
+    return {
+        "id": job.get("id"),
+        "returncode": os.WEXITSTATUS(wait_status) if os.WIFEXITED(wait_status) else -killed_by,
+        "signal": signal.Signals(killed_by).name if killed_by else None,
+        "timed_out": timed_out,
+        "duration": time.monotonic() - started,
+    }
+
+
+def main():
+    preloaded = []
+    for name in filter(None, (sys.argv[1] if len(sys.argv) > 1 else "").split(",")):
+        try:
+            importlib.import_module(name.strip())
+            preloaded.append(name.strip())
+        except Exception:
+            pass
+    memory_base = _virtual_memory_bytes()
+
+    out = sys.stdout
+    out.write(json.dumps({"ready": True, "pid": os.getpid(), "preloaded": preloaded}) + "\n")
+    out.flush()
+    # stdin ปิด (เซิร์ฟเวอร์ปิด/ตาย) = จบการทำงาน
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            result = run_job(job, memory_base, out)
+        except Exception as e:
+            result = {"id": job.get("id"), "returncode": 1, "signal": None, "timed_out": False, "duration": 0.0,
+                      "error": f"{type(e).__name__}: {e}"}
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
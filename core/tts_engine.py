@@ -1,56 +1,254 @@
 # core/tts_engine.py
-# (V_Final - Switched to the simple and reliable gTTS)
+# (V2.1 - Segmented, Parallel TTS Pipeline with Pluggable Backends + Content-Addressed Cache)
+# - ตัดคำตอบเป็นท่อนตามขอบเขตประโยค (ภาษาไทยใช้ช่องว่างแทนเครื่องหมายจบประโยค) ท่อนแรกสั้นกว่าเพื่อให้ได้ยินเสียงเร็ว
+# - สังเคราะห์ทุกท่อนพร้อมกันใน Thread pool (TTS_MAX_WORKERS) แล้วส่งออกตามลำดับ: ท่อนแรกพร้อมเล่นได้ก่อนท่อนที่เหลือเสร็จ
+# - Backend เปลี่ยนได้: gTTS (ค่าเริ่มต้น) หรือโปรแกรม TTS ออฟไลน์ในเครื่อง (piper, espeak-ng, ...) ผ่าน TTS_COMMAND
+#   หรือลงทะเบียน Backend ใหม่ด้วย register_backend()
+# - ทุกท่อนและไฟล์รวมถูกเก็บใน AudioCache (core/audio_cache.py) ตาม Hash ของเสียงพูด+ข้อความ:
+#   คำตอบ/วลีที่เคยสังเคราะห์แล้วไม่ต้องสังเคราะห์ซ้ำ
 
+import io
 import os
 import re
-from typing import Optional
-from gtts import gTTS
+import shlex
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.audio_cache import AudioCache, cache_filename
+from core.config import settings
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUDIO_CACHE_DIR = os.path.join(PROJECT_ROOT, "web", "static", "audio")
+
+# จบประโยคด้วยเครื่องหมายวรรคตอนตามด้วยช่องว่าง หรือขึ้นบรรทัดใหม่
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+
+def split_sentences(text: str, max_chars: int, first_max_chars: Optional[int] = None) -> List[str]:
+    """
+    แบ่งข้อความเป็นท่อนยาวไม่เกิน max_chars (ท่อนแรกไม่เกิน first_max_chars)
+    ตัดที่ขอบประโยคก่อน ถ้าประโยคยาวเกินจึงตัดที่ช่องว่าง (ในภาษาไทยคือขอบวลี/ประโยค) และตัดกลางคำเป็นทางเลือกสุดท้าย
+    """
+    segments: List[str] = []
+    current = ""
+
+    def limit() -> int:
+        return first_max_chars if first_max_chars and not segments else max_chars
+
+    def flush():
+        nonlocal current
+        if current:
+            segments.append(current)
+            current = ""
+
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        for phrase in sentence.split():
+            while len(phrase) > limit():
+                flush()
+                cut = limit()
+                segments.append(phrase[:cut])
+                phrase = phrase[cut:]
+            if current and len(current) + 1 + len(phrase) > limit():
+                flush()
+            current = f"{current} {phrase}" if current else phrase
+        # จบประโยค: ปิดท่อนถ้ายาวพอแล้ว (ไม่ให้ประโยคสั้นๆ กลายเป็นท่อนละประโยค)
+        if len(current) >= limit() // 2:
+            flush()
+    flush()
+    return segments
+
+
+class TTSBackend:
+    """Backend สังเคราะห์เสียงหนึ่งท่อน: คืนไฟล์เสียงทั้งไฟล์เป็น bytes (เรียกจากหลาย Thread พร้อมกัน)"""
+    name = "base"
+    audio_format = "mp3"
+
+    @property
+    def voice(self) -> str:
+        """ตัวระบุเสียงพูด (เป็นส่วนหนึ่งของ Key ใน Cache: เปลี่ยนภาษา/โมเดลแล้วไม่ได้ไฟล์เสียงเดิม)"""
+        return f"{self.name}:{self.audio_format}"
+
+    def synthesize_segment(self, text: str) -> bytes:
+        raise NotImplementedError
+
+    def join(self, parts: List[bytes]) -> bytes:
+        """รวมหลายท่อนเป็นไฟล์เดียว (MP3 ต่อ Frame กันได้ตรงๆ)"""
+        return b"".join(parts)
+
+
+class GTTSBackend(TTSBackend):
+    name = "gtts"
+    audio_format = "mp3"
+
+    def __init__(self, lang: str = "th"):
+        from gtts import gTTS
+        self._gtts = gTTS
+        self.lang = lang
+
+    @property
+    def voice(self) -> str:
+        return f"gtts:{self.lang}"
+
+    def synthesize_segment(self, text: str) -> bytes:
+        buffer = io.BytesIO()
+        self._gtts(text=text, lang=self.lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class CommandBackend(TTSBackend):
+    """
+    โปรแกรม TTS ในเครื่อง (ไม่ต้องใช้อินเทอร์เน็ต): ส่งข้อความทาง stdin และอ่านไฟล์เสียงจาก stdout
+    เช่น TTS_COMMAND="piper --model th_TH.onnx --output_file -" หรือ "espeak-ng -v th --stdin --stdout"
+    """
+    name = "command"
+
+    def __init__(self, command: str, audio_format: str = "wav"):
+        if not command:
+            raise ValueError("TTS_COMMAND is required for the 'command' TTS backend.")
+        self.command = shlex.split(command)
+        self.audio_format = audio_format
+
+    @property
+    def voice(self) -> str:
+        return f"command:{shlex.join(self.command)}:{self.audio_format}"
+
+    def synthesize_segment(self, text: str) -> bytes:
+        result = subprocess.run(self.command, input=text.encode("utf-8"), capture_output=True,
+                                timeout=settings.TTS_SEGMENT_TIMEOUT_SECONDS, check=True)
+        return result.stdout
+
+    def join(self, parts: List[bytes]) -> bytes:
+        if self.audio_format != "wav":
+            return super().join(parts)
+        # WAV มี Header ต่อไฟล์: อ่าน Frame ของแต่ละท่อนแล้วเขียนใหม่ภายใต้ Header เดียว
+        output = io.BytesIO()
+        with wave.open(output, "wb") as writer:
+            for index, part in enumerate(parts):
+                with wave.open(io.BytesIO(part), "rb") as reader:
+                    if index == 0:
+                        writer.setparams(reader.getparams())
+                    writer.writeframes(reader.readframes(reader.getnframes()))
+        return output.getvalue()
+
+
+TTS_BACKENDS: Dict[str, Callable[[], TTSBackend]] = {
+    "gtts": lambda: GTTSBackend(settings.TTS_LANGUAGE),
+    "command": lambda: CommandBackend(settings.TTS_COMMAND, settings.TTS_COMMAND_FORMAT),
+}
+
+
+def register_backend(name: str, factory: Callable[[], TTSBackend]):
+    """เพิ่ม Backend ใหม่ที่เลือกได้ด้วย TTS_BACKEND=<name>"""
+    TTS_BACKENDS[name] = factory
+
 
 class TextToSpeechEngine:
     """
-    ผู้เชี่ยวชาญด้านการสังเคราะห์เสียงโดยใช้ gTTS (Google Text-to-Speech)
-    - เรียบง่าย, เสถียร, และไม่ต้องใช้ Dependency ที่ซับซ้อน
+    ผู้เชี่ยวชาญด้านการสังเคราะห์เสียง: แบ่งท่อน, สังเคราะห์พร้อมกัน และส่งท่อนที่พร้อมแล้วออกไปตามลำดับ
     """
-    def __init__(self):
-        print("🗣️  Initializing Text-to-Speech Engine (gTTS)...")
-        # gTTS ไม่ต้องมีการโหลดโมเดลใดๆ พร้อมใช้งานเสมอ
+    def __init__(self, backend: Optional[TTSBackend] = None, cache: Optional[AudioCache] = None):
+        name = backend.name if backend else settings.TTS_BACKEND
+        print(f"🗣️  Initializing Text-to-Speech Engine ({name})...")
+        self.backend = backend or TTS_BACKENDS[settings.TTS_BACKEND]()
+        self.cache = cache or AudioCache(AUDIO_CACHE_DIR)
+        self.executor = ThreadPoolExecutor(max_workers=settings.TTS_MAX_WORKERS, thread_name_prefix="tts")
         self.is_ready = True
-        print("✅ Text-to-Speech Engine (gTTS) is ready.")
+        print(f"✅ Text-to-Speech Engine ({self.backend.name}, {settings.TTS_MAX_WORKERS} workers) is ready.")
+
+    @property
+    def audio_format(self) -> str:
+        return self.backend.audio_format
 
     def _cleanup_text(self, text: str) -> str:
         """
-        ทำความสะอาดข้อความก่อนส่งให้ TTS (ยังคงมีประโยชน์)
+        ทำความสะอาดข้อความก่อนส่งให้ TTS (คงการขึ้นบรรทัดใหม่ไว้เป็นขอบเขตประโยค)
         """
         text = re.sub(r'[\*#`]', '', text)
         text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
-        # ลบ URL ออกไปก่อนส่งให้ gTTS
+        # ลบ URL ออกไปก่อนส่งให้ TTS
         text = re.sub(r'https?://\S+', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+        text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+        return re.sub(r'\n\s*', '\n', text).strip()
 
-    def synthesize(self, text: str, output_path: str = "temp_voice.mp3") -> Optional[str]:
+    def _cache_name(self, cleaned_text: str) -> str:
+        return cache_filename(self.backend.voice, cleaned_text, self.audio_format)
+
+    def split(self, text: str) -> List[str]:
+        return split_sentences(self._cleanup_text(text), settings.TTS_SEGMENT_MAX_CHARS, settings.TTS_FIRST_SEGMENT_MAX_CHARS)
+
+    def _synthesize_cached(self, segment: str) -> Tuple[str, bytes]:
+        """สังเคราะห์หนึ่งท่อน (ใช้ไฟล์ใน Cache ถ้าเคยสังเคราะห์ข้อความนี้แล้ว) คืน (path, เสียง)"""
+        name = self._cache_name(segment)
+        audio = self.cache.read(name)
+        if audio is None:
+            audio = self.backend.synthesize_segment(segment)
+            self.cache.put(name, audio)
+        return self.cache.path(name), audio
+
+    def iter_segments(self, text: str) -> Iterator[Tuple[int, int, str, bytes]]:
         """
-        สังเคราะห์เสียงพูดเป็นไฟล์ .mp3 โดยใช้ gTTS
+        ส่งทุกท่อนเข้า Thread pool พร้อมกันแล้ว yield (ลำดับ, จำนวนท่อน, path ใน Cache, เสียง) ตามลำดับ
+        ท่อนใดล้มเหลว: ยกเลิกท่อนที่ยังไม่เริ่มแล้วโยน Error ต่อ (ท่อนก่อนหน้าถูกส่งออกไปแล้ว)
         """
         if not self.is_ready or not text:
-            return None
+            return
+        segments = self.split(text)
+        if not segments:
+            return
+        print(f"🗣️  [{self.backend.name} Engine] Synthesizing {len(segments)} segment(s): '{segments[0][:50]}...'")
+        futures = [self.executor.submit(self._synthesize_cached, segment) for segment in segments]
+        try:
+            for index, future in enumerate(futures):
+                path, audio = future.result(timeout=settings.TTS_SEGMENT_TIMEOUT_SECONDS)
+                yield index, len(segments), path, audio
+        finally:
+            for future in futures:
+                future.cancel()
 
-        cleaned_text = self._cleanup_text(text)
-        if not cleaned_text:
+    def synthesize_stream(self, text: str, on_segment: Optional[Callable[[int, str, int], None]] = None) -> Optional[str]:
+        """
+        เรียก on_segment(ลำดับ, path, จำนวนท่อน) ทันทีที่แต่ละท่อนพร้อม แล้วเก็บไฟล์รวมของทั้งคำตอบลง Cache
+        คืน path ของไฟล์รวม (None ถ้าไม่มีเสียง/ล้มเหลว)
+        ถ้าเคยสังเคราะห์คำตอบนี้แล้ว: ส่งไฟล์รวมจาก Cache เป็นท่อนเดียวทันที ไม่สังเคราะห์ใหม่
+        """
+        cleaned = self._cleanup_text(text or "")
+        if not self.is_ready or not cleaned:
             return None
+        full_name = self._cache_name(cleaned)
+        cached_path = self.cache.lookup(full_name)
+        if cached_path:
+            print(f"🗣️  [{self.backend.name} Engine] Cache hit: '{cleaned[:50]}...'")
+            if on_segment:
+                on_segment(0, cached_path, 1)
+            return cached_path
 
-        print(f"🗣️  [gTTS Engine] Synthesizing: '{cleaned_text[:50]}...'")
-
+        parts = []
         try:
-            # 1. สร้าง Object gTTS โดยระบุข้อความและภาษา (th = ภาษาไทย)
-            tts = gTTS(text=cleaned_text, lang='th')
-            
-            # 2. บันทึกไฟล์เสียงเป็น .mp3
-            tts.save(output_path)
-            
-            print(f"  - ✅ Audio file created successfully at: {output_path}")
-            return output_path
-
+            for index, total, segment_path, audio in self.iter_segments(cleaned):
+                parts.append(audio)
+                if on_segment:
+                    on_segment(index, segment_path, total)
         except Exception as e:
-            print(f"  - ❌ gTTS Synthesis failed: {e}")
-            return None
\ No newline at end of file
+            print(f"  - ❌ TTS Synthesis failed after {len(parts)} segment(s): {e}")
+            return None
+        if not parts:
+            return None
+        output_path = self.cache.put(full_name, self.backend.join(parts))
+        print(f"  - ✅ Audio file created successfully at: {output_path} ({len(parts)} segments)")
+        return output_path
+
+    def synthesize(self, text: str, output_path: str = "temp_voice.mp3") -> Optional[str]:
+        """
+        สังเคราะห์เสียงพูดทั้งคำตอบเป็นไฟล์เดียวที่ output_path (คัดลอกจาก Cache)
+        """
+        cached_path = self.synthesize_stream(text)
+        if not cached_path:
+            return None
+        shutil.copyfile(cached_path, output_path)
+        return output_path
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+# core/vector_index.py
+# (V1.0 - Compact Vector Index Factory with Saved Metadata)
+# จุดเดียวที่ทุก Builder ใช้สร้าง/บันทึก FAISS Index และที่ RAGEngine ใช้โหลด
+# ชนิดของ Index กำหนดด้วย FAISS factory string (settings.VECTOR_INDEX_SPEC) เช่น
+#   "Flat"          : float32 เต็ม (4 KB/เวกเตอร์ สำหรับ e5-large)
+#   "SQfp16"        : float16 (2 KB/เวกเตอร์) ไม่ต้อง Train
+#   "SQ8"           : int8 ต่อมิติ (1 KB/เวกเตอร์) ต้อง Train
+#   "PCA256,SQfp16" : ฉายลง 256 มิติด้วย PCA แล้วเก็บ float16 (512 B/เวกเตอร์) ต้อง Train
+#   "OPQ64_256,SQ8" : หมุนด้วย OPQ + ลดมิติ แล้วเก็บ int8 ต้อง Train
+# การแปลงฝั่ง Query (PCA/OPQ) เป็นส่วนหนึ่งของ IndexPreTransform จึงถูกใช้อัตโนมัติเมื่อ search
+# และมีไฟล์ <index>.meta.json บอก spec/มิติ ให้ RAGEngine ตรวจสอบความเข้ากันได้กับ Embedder
+# LiveIndex: Index + Mapping ในหน่วยความจำที่เพิ่มข้อมูลได้ระหว่างเซิร์ฟเวอร์ทำงาน (Double Buffer ไม่ต้อง Reload)
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from core.config import settings
+
+META_SUFFIX = ".meta.json"
+
+
+def meta_path(index_path: str) -> str:
+    return index_path + META_SUFFIX
+
+
+def create_index(dim: int, spec: Optional[str] = None) -> faiss.Index:
+    return faiss.index_factory(dim, spec or settings.VECTOR_INDEX_SPEC, faiss.METRIC_L2)
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, spec: str) -> Tuple[faiss.Index, str]:
+    """
+    Train ด้วยตัวอย่างที่มี (สุ่มไม่เกิน VECTOR_INDEX_TRAIN_SIZE) คืนค่า (index, spec ที่ใช้จริง)
+    ถ้าตัวอย่างน้อยเกินกว่าที่ spec ต้องการ (เช่น PCA ที่ต้องการตัวอย่างมากกว่ามิติปลายทาง) จะถอยกลับไปใช้ Flat
+    """
+    if index.is_trained:
+        return index, spec
+    if len(vectors) > settings.VECTOR_INDEX_TRAIN_SIZE:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(len(vectors), settings.VECTOR_INDEX_TRAIN_SIZE, replace=False)]
+    try:
+        index.train(np.ascontiguousarray(vectors, dtype="float32"))
+        return index, spec
+    except RuntimeError as e:
+        print(f"  - ⚠️ Could not train '{spec}' on {len(vectors)} vectors, falling back to Flat: {e}")
+        return faiss.IndexFlatL2(vectors.shape[1]), "Flat"
+
+
+def build_index(vectors: np.ndarray, spec: Optional[str] = None) -> Tuple[faiss.Index, str]:
+    """สร้าง Index ใหม่จากเวกเตอร์ชุดแรก (Train ถ้าจำเป็น แล้ว add) คืนค่า (index, spec ที่ใช้จริง)"""
+    spec = spec or settings.VECTOR_INDEX_SPEC
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index, spec = train_index(create_index(vectors.shape[1], spec), vectors, spec)
+    index.add(vectors)
+    return index, spec
+
+
+def describe(index: faiss.Index, spec: Optional[str] = None) -> Dict:
+    """Metadata ที่บันทึกคู่กับ Index: มิติขาเข้า (ต้องตรงกับ Embedder), ขนาดต่อเวกเตอร์ และ spec"""
+    index = faiss.downcast_index(index)
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+    return {
+        "spec": spec or ("Flat" if isinstance(inner, faiss.IndexFlat) and inner is index else type(index).__name__),
+        "input_dim": int(index.d),
+        "stored_dim": int(inner.d),
+        "bytes_per_vector": int(getattr(inner, "code_size", inner.d * 4)),
+        "metric": "L2",
+        "ntotal": int(index.ntotal),
+    }
+
+
+def write_index(index: faiss.Index, path: str, spec: Optional[str] = None,
+                meta_file: Optional[str] = None, **extra_meta):
+    """เขียน Index และ Metadata (ค่าเริ่มต้น <path>.meta.json; ระบุ meta_file เองได้เมื่อเขียนเป็นไฟล์ชั่วคราว)"""
+    faiss.write_index(index, path)
+    meta = describe(index, spec)
+    meta.update(extra_meta)
+    with open(meta_file or meta_path(path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def read_index_meta(index_path: str) -> Dict:
+    path = meta_path(index_path)
+    if not os.path.exists(path):
+        return {"spec": "Flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_index(index_path: str, expected_dim: Optional[int] = None) -> faiss.Index:
+    """โหลด Index พร้อมตรวจว่ามิติขาเข้าตรงกับ Embedder ที่ใช้ค้นหา"""
+    index = faiss.read_index(index_path)
+    if expected_dim is not None and index.d != expected_dim:
+        raise ValueError(f"'{index_path}' expects {index.d}-dim queries but the embedder produces {expected_dim}-dim vectors.")
+    return index
+
+
+def read_jsonl(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class LiveIndex:
+    """
+    Double Buffer ของ (index, items): ผู้ค้นหาอ่าน snapshot() ที่ไม่ถูกแก้ไขอีก
+    ผู้เขียนสร้าง Index ชุดถัดไปจาก back_buffer() (สำเนา) แล้ว publish() สลับ Reference ครั้งเดียว
+    การค้นหาจึงไม่ต้องล็อกและไม่เคยเห็น Index ที่เพิ่มไปครึ่งทาง
+    """
+    def __init__(self, index: Optional[faiss.Index] = None, items: Optional[List[Dict]] = None):
+        self._snapshot: Tuple[Optional[faiss.Index], List[Dict]] = (index, list(items or []))
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, index_path: str, mapping_path: str, expected_dim: Optional[int] = None) -> "LiveIndex":
+        if not (os.path.exists(index_path) and os.path.exists(mapping_path)):
+            return cls()
+        return cls(read_index(index_path, expected_dim), read_jsonl(mapping_path))
+
+    def snapshot(self) -> Tuple[Optional[faiss.Index], List[Dict]]:
+        return self._snapshot
+
+    @property
+    def ntotal(self) -> int:
+        index = self._snapshot[0]
+        return index.ntotal if index is not None else 0
+
+    def back_buffer(self) -> Optional[faiss.Index]:
+        """สำเนาของ Index ปัจจุบันสำหรับเพิ่มเวกเตอร์ (None ถ้ายังไม่มี Index)"""
+        index = self._snapshot[0]
+        return faiss.clone_index(index) if index is not None else None
+
+    def publish(self, index: faiss.Index, new_items: List[Dict]):
+        """ตั้ง Index ใหม่ (ที่มีเวกเตอร์ของ new_items ต่อท้ายแล้ว) เป็นชุดที่ใช้ค้นหา"""
+        with self._write_lock:
+            items = self._snapshot[1] + list(new_items)
+            if index.ntotal != len(items):
+                raise ValueError(f"LiveIndex publish mismatch: index has {index.ntotal} vectors but {len(items)} items.")
+            self._snapshot = (index, items)
+
+    def replace(self, index: Optional[faiss.Index], items: List[Dict]):
+        with self._write_lock:
+            self._snapshot = (index, list(items))
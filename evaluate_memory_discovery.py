@@ -0,0 +1,133 @@
+# evaluate_memory_discovery.py
+# (V1.0 - Pending-Session Discovery at Scale)
+# เทียบเวลาการหา Session ที่มีข้อความค้างประมวลผล ระหว่าง Query เดิม (DISTINCT + MAX(id) ต่อ Session บน conversation_history)
+# กับ session_stats + Partial Index (fetch_pending_chunks) บนฐานข้อมูลสังเคราะห์ขนาดหลายล้านแถว
+# - ข้อความส่วนใหญ่ถูกประมวลผลแล้ว (สถานการณ์จริงของระบบที่รันมานาน) มีเพียง --pending-sessions Session ที่ค้าง
+# - ฐานข้อมูลถูกสร้างในไดเรกทอรีชั่วคราว ไม่แตะ data/memory.db
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+from core.memory_consolidation import ensure_session_stats, fetch_pending_chunks
+
+LEGACY_DISCOVERY_SQL = """
+    SELECT T1.session_id, COALESCE(T2.last_processed_id, 0) as last_processed_id
+    FROM (SELECT DISTINCT session_id FROM conversation_history) T1
+    LEFT JOIN memory_processing_state T2 ON T1.session_id = T2.session_id
+    WHERE (SELECT MAX(id) FROM conversation_history WHERE session_id = T1.session_id) > COALESCE(T2.last_processed_id, 0)
+    LIMIT ?
+"""
+LEGACY_FETCH_SQL = "SELECT id, role, content, timestamp FROM conversation_history WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?"
+
+
+def build_database(path: str, rows: int, sessions: int, pending_sessions: int, seed: int):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE conversation_history (
+            id INTEGER PRIMARY KEY, timestamp DATETIME NOT NULL, session_id TEXT NOT NULL,
+            role TEXT NOT NULL, content TEXT NOT NULL, agent_used TEXT)""")
+        conn.execute("CREATE INDEX idx_ch_session_id ON conversation_history(session_id)")
+        conn.execute("CREATE INDEX idx_ch_session_id_id ON conversation_history(session_id, id)")
+        conn.execute("CREATE TABLE memory_processing_state (session_id TEXT PRIMARY KEY, last_processed_id INTEGER NOT NULL)")
+
+        batch = []
+        for i in range(1, rows + 1):
+            batch.append((i, start + datetime.timedelta(seconds=i), f"user_{rng.randrange(sessions)}",
+                          "user" if i % 2 else "model", "ข้อความทดสอบ " * 8, None))
+            if len(batch) == 100_000:
+                conn.executemany("INSERT INTO conversation_history VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            conn.executemany("INSERT INTO conversation_history VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+        # ทุก Session ถูกประมวลผลแล้ว ยกเว้น pending_sessions Session ที่ค้างไว้ 50 ข้อความสุดท้าย
+        stats = conn.execute("SELECT session_id, MAX(id) FROM conversation_history GROUP BY session_id").fetchall()
+        pending = set(rng.sample([session_id for session_id, _ in stats], min(pending_sessions, len(stats))))
+        state = []
+        for session_id, max_id in stats:
+            if session_id in pending:
+                last = conn.execute("SELECT id FROM conversation_history WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET 50",
+                                    (session_id,)).fetchone()
+                state.append((session_id, last[0] if last else 0))
+            else:
+                state.append((session_id, max_id))
+        conn.executemany("INSERT INTO memory_processing_state VALUES (?, ?)", state)
+        conn.commit()
+
+
+def time_legacy(path: str, num_sessions: int, chunk_size: int) -> tuple:
+    with closing(sqlite3.connect(path)) as conn:
+        started = time.perf_counter()
+        sessions = conn.execute(LEGACY_DISCOVERY_SQL, (num_sessions,)).fetchall()
+        messages = sum(len(conn.execute(LEGACY_FETCH_SQL, (s, last, chunk_size)).fetchall()) for s, last in sessions)
+        return time.perf_counter() - started, len(sessions), messages
+
+
+def time_session_stats(path: str, num_sessions: int, chunk_size: int) -> tuple:
+    with closing(sqlite3.connect(path)) as conn:
+        started = time.perf_counter()
+        chunks = fetch_pending_chunks(conn, num_sessions, chunk_size)
+        return time.perf_counter() - started, len(chunks), sum(len(c["messages"]) for c in chunks)
+
+
+def time_inserts(path: str, count: int) -> float:
+    """เวลาเพิ่มข้อความทีละแถว (แบบ MemoryManager.add_memory) ซึ่งตอนนี้ต้องผ่าน Trigger ด้วย"""
+    with closing(sqlite3.connect(path)) as conn:
+        started = time.perf_counter()
+        for i in range(count):
+            conn.execute("INSERT INTO conversation_history (timestamp, session_id, role, content, agent_used) VALUES (?, ?, ?, ?, ?)",
+                         (datetime.datetime.now(), f"bench_{i % 10}", "user", "ข้อความใหม่", None))
+            conn.commit()
+        return (time.perf_counter() - started) / count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare legacy pending-session discovery against session_stats on a synthetic history.")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--sessions", type=int, default=5_000)
+    parser.add_argument("--pending-sessions", type=int, default=25)
+    parser.add_argument("--num-sessions", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("--- 🔍 Memory Pending-Session Discovery Benchmark  🔍 ---")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "memory.db")
+        started = time.perf_counter()
+        build_database(db_path, args.rows, args.sessions, args.pending_sessions, args.seed)
+        print(f"  - 🏗️  Built {args.rows:,} messages across {args.sessions:,} sessions in {time.perf_counter() - started:.1f}s")
+
+        legacy_seconds, legacy_sessions, legacy_messages = time_legacy(db_path, args.num_sessions, args.chunk_size)
+        print(f"  - 🐢 Legacy DISTINCT/MAX scan : {legacy_seconds * 1000:>10.1f} ms  ({legacy_sessions} sessions, {legacy_messages} messages)")
+
+        with closing(sqlite3.connect(db_path)) as conn:
+            started = time.perf_counter()
+            ensure_session_stats(conn)
+            print(f"  - 🧮 One-time session_stats backfill: {time.perf_counter() - started:.1f}s")
+
+        new_seconds, new_sessions, new_messages = time_session_stats(db_path, args.num_sessions, args.chunk_size)
+        print(f"  - ⚡ session_stats + partial index: {new_seconds * 1000:>10.1f} ms  ({new_sessions} sessions, {new_messages} messages)")
+        print(f"  - 📈 Speed-up: {legacy_seconds / max(new_seconds, 1e-9):.0f}x")
+
+        # รอบที่ไม่มีอะไรค้าง (กรณีที่พบบ่อยที่สุดของ Worker): Query เดิมต้อง Scan จนจบตาราง
+        with closing(sqlite3.connect(db_path)) as conn:
+            conn.execute("UPDATE memory_processing_state SET last_processed_id = (SELECT MAX(id) FROM conversation_history h WHERE h.session_id = memory_processing_state.session_id)")
+            conn.execute("UPDATE session_stats SET last_processed_id = last_message_id")
+            conn.commit()
+        legacy_idle, _, _ = time_legacy(db_path, args.num_sessions, args.chunk_size)
+        new_idle, _, _ = time_session_stats(db_path, args.num_sessions, args.chunk_size)
+        print(f"  - 💤 Idle poll (nothing pending): legacy {legacy_idle * 1000:.1f} ms vs. session_stats {new_idle * 1000:.2f} ms "
+              f"({legacy_idle / max(new_idle, 1e-9):.0f}x)")
+        print(f"  - ✍️  Insert cost with trigger: {time_inserts(db_path, 200) * 1000:.2f} ms/message")
@@ -0,0 +1,72 @@
+# evaluate_sandbox.py
+# (V1.0 - Cold Subprocess vs. Warm Sandbox Pool)
+# เทียบ Latency ของ CodeExecutor ระหว่างการเปิด Interpreter ใหม่ทุกงาน กับ SandboxPool ที่ Import ไลบรารีไว้แล้ว
+# สคริปต์ทดสอบ Import ไลบรารีชุดเดียวกับ SANDBOX_PRELOAD_MODULES (ตัวที่ไม่ได้ติดตั้งถูกข้าม) แบบที่โค้ดจาก LLM มักทำ
+
+import argparse
+import importlib.util
+import statistics
+import threading
+import time
+
+from core.code_executor import CodeExecutor
+from core.config import settings
+
+
+def build_script() -> str:
+    modules = [m.strip() for m in settings.SANDBOX_PRELOAD_MODULES.split(",") if m.strip() and importlib.util.find_spec(m.strip())]
+    imports = "\n".join(f"import {m}" for m in modules)
+    return f"{imports}\nprint(sum(range(1000)))\n", modules
+
+
+def measure(executor: CodeExecutor, script: str, runs: int) -> list:
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output, has_error = executor.run_code_in_sandbox(script)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if has_error:
+            raise RuntimeError(output)
+    return latencies
+
+
+def measure_concurrent(executor: CodeExecutor, script: str, clients: int) -> float:
+    threads = [threading.Thread(target=executor.run_code_in_sandbox, args=(script,)) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return (time.perf_counter() - started) * 1000
+
+
+def report(label: str, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"  - {label}: p50 {statistics.median(latencies):7.1f} ms | p95 {p95:7.1f} ms | mean {statistics.mean(latencies):7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare cold subprocess execution against the warm sandbox pool.")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent requests for the burst test.")
+    args = parser.parse_args()
+
+    script, modules = build_script()
+    print("\n" + "="*60)
+    print("--- 🧪 Code Sandbox Latency Benchmark  🧪 ---")
+    print("="*60)
+    print(f"  - Script imports: {', '.join(modules) or '(none)'}")
+
+    cold = CodeExecutor(use_pool=False)
+    warm = CodeExecutor(use_pool=True)
+    if not warm.pool:
+        print("  - ⚠️ Warm pool is not supported on this platform (requires POSIX fork).")
+    else:
+        measure(warm, script, 1) # รอให้ Worker พร้อม (ไม่นับเวลาเริ่มต้นของ Pool)
+
+    report("🐢 Cold subprocess", measure(cold, script, args.runs))
+    if warm.pool:
+        report("⚡ Warm pool       ", measure(warm, script, args.runs))
+        print(f"  - 👥 Burst of {args.clients}: cold {measure_concurrent(cold, script, args.clients):.0f} ms "
+              f"vs. warm {measure_concurrent(warm, script, args.clients):.0f} ms")
+        print(f"  - 📊 Pool metrics: {warm.metrics()}")
+        warm.close()
@@ -0,0 +1,149 @@
+# export_inference_models.py
+# (V1.0 - ONNX Export, Int8 Quantization & Parity Check)
+# Export Embedder และ Reranker เป็น ONNX (FP32 + Dynamic Int8) แล้วตรวจความเที่ยงเทียบกับ FP32 PyTorch
+# ผลการตรวจถูกบันทึกเป็น parity.json ข้างไฟล์ที่ Export ซึ่ง core/inference_backend.py ใช้ตัดสินว่าจะเปิดใช้ได้หรือไม่
+#
+# Parity Check (recall@k บนชุดคำถามที่กันไว้):
+# - Embedder: Top-k เอกสารจากคลังตัวอย่าง เมื่อ Embed ทั้งคำถามและคลังด้วย Backend ใหม่ เทียบกับ FP32
+# - Reranker: Top-k หลังจัดอันดับผู้สมัครชุดเดียวกันด้วย Backend ใหม่ เทียบกับ FP32
+
+import argparse
+import glob
+import json
+import os
+import random
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sentence_transformers import CrossEncoder, SentenceTransformer, export_dynamic_quantized_onnx_model
+
+from core.batching import encode_texts, predict_pairs
+from core.config import settings
+from core.inference_backend import (
+    DEFAULT_EMBEDDING_MODEL, DEFAULT_RERANKER_MODEL, PARITY_FILENAME,
+    export_dir, load_embedder, load_reranker, read_parity_report
+)
+
+BOOK_INDEX_FOLDER = "data/index"
+
+
+def load_held_out_set(queries_path: str, corpus_size: int, num_queries: int, seed: int) -> Tuple[List[str], List[str]]:
+    """
+    คลังเอกสาร = Chunk ที่สุ่มจาก Book Index
+    คำถาม = จากไฟล์ (หนึ่งบรรทัดต่อหนึ่งคำถาม) ถ้ามี ไม่เช่นนั้นสร้างจากหัวข้อของ Chunk ที่ไม่อยู่ในคลัง
+    """
+    items = []
+    for path in sorted(glob.glob(os.path.join(BOOK_INDEX_FOLDER, "*", "mapping.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            items.extend(json.loads(line) for line in f)
+    if not items:
+        raise SystemExit(f"❌ No book chunks found under '{BOOK_INDEX_FOLDER}'. Build the index first (manage_data.py).")
+
+    rng = random.Random(seed)
+    rng.shuffle(items)
+    corpus = [item["embedding_text"] for item in items[:corpus_size]]
+
+    if queries_path:
+        with open(queries_path, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        held_out = items[corpus_size:] or items
+        queries = []
+        for item in held_out:
+            parts = [item.get("book_title"), item.get("chapter_title"), item.get("subsection_title")]
+            query = " ".join(p for p in parts if p)
+            if query:
+                queries.append(query)
+    return corpus, queries[:num_queries]
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    hits = [len(set(ref[:k]) & set(cand[:k])) / k for ref, cand in zip(reference, candidate)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def embedder_rankings(model, corpus: List[str], queries: List[str], k: int) -> np.ndarray:
+    doc_vectors = encode_texts(model, ["query: " + text for text in corpus], normalize_embeddings=True)
+    query_vectors = encode_texts(model, ["query: " + q for q in queries], normalize_embeddings=True)
+    return np.argsort(-(query_vectors @ doc_vectors.T), axis=1)[:, :k]
+
+
+def reranker_rankings(model, candidates: Dict[str, List[str]], k: int) -> np.ndarray:
+    rankings = []
+    for query, docs in candidates.items():
+        scores = predict_pairs(model, [(query, doc) for doc in docs])
+        rankings.append(np.argsort(-scores)[:k])
+    return np.array(rankings)
+
+
+def export_model(model_name: str, kind: str):
+    target = export_dir(model_name)
+    print(f"\n--- 📦 Exporting {kind} '{model_name}' to '{target}' ---")
+    model_cls = SentenceTransformer if kind == "embedder" else CrossEncoder
+    model = model_cls(model_name, device="cpu", backend="onnx")
+    model.save_pretrained(target)
+    export_dynamic_quantized_onnx_model(model, settings.ONNX_QUANTIZATION_CONFIG, target)
+    print(f"  - ✅ ONNX FP32 + int8 ({settings.ONNX_QUANTIZATION_CONFIG}) saved.")
+
+
+def check_parity(model_name: str, kind: str, backends: List[str], corpus: List[str], queries: List[str],
+                 k: int, min_recall: float):
+    print(f"\n--- 🔬 Parity check for {kind} '{model_name}' (recall@{k}, threshold {min_recall}) ---")
+    if kind == "embedder":
+        reference_model = load_embedder(model_name, backend="torch", device="cpu")
+        reference = embedder_rankings(reference_model, corpus, queries, k)
+    else:
+        # ผู้สมัครของ Reranker = Top-20 จาก FP32 Embedder เพื่อให้ทุก Backend จัดอันดับชุดเดียวกัน
+        retriever = load_embedder(DEFAULT_EMBEDDING_MODEL, backend="torch", device="cpu")
+        pools = embedder_rankings(retriever, corpus, queries, 20)
+        candidates = {q: [corpus[i] for i in pool] for q, pool in zip(queries, pools)}
+        reference = reranker_rankings(load_reranker(model_name, backend="torch", device="cpu"), candidates, k)
+
+    report = read_parity_report(model_name)
+    for backend in backends:
+        if kind == "embedder":
+            model = load_embedder(model_name, backend=backend, device="cpu", require_parity=False)
+            candidate = embedder_rankings(model, corpus, queries, k)
+        else:
+            model = load_reranker(model_name, backend=backend, device="cpu", require_parity=False)
+            candidate = reranker_rankings(model, candidates, k)
+        recall = recall_at_k(reference, candidate, k)
+        passed = recall >= min_recall
+        report[backend] = {"k": k, "recall": recall, "threshold": min_recall, "passed": passed,
+                           "num_queries": len(queries), "corpus_size": len(corpus)}
+        print(f"  - {'✅' if passed else '❌'} {backend}: recall@{k} = {recall:.4f}")
+
+    os.makedirs(export_dir(model_name), exist_ok=True)
+    with open(os.path.join(export_dir(model_name), PARITY_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedder/reranker to ONNX and verify parity against FP32.")
+    parser.add_argument("--skip-export", action="store_true", help="Only re-run the parity check.")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx", "onnx-int8"])
+    parser.add_argument("--queries", help="Held-out queries, one per line (default: derived from chunk titles).")
+    parser.add_argument("--corpus-size", type=int, default=2000)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("--- 🛠️  Exporting CPU Inference Backends  🛠️ ---")
+    print("="*60)
+
+    models = [(DEFAULT_EMBEDDING_MODEL, "embedder"), (DEFAULT_RERANKER_MODEL, "reranker")]
+    if not args.skip_export:
+        for model_name, kind in models:
+            export_model(model_name, kind)
+
+    corpus, queries = load_held_out_set(args.queries, args.corpus_size, args.num_queries, args.seed)
+    print(f"\n📚 Held-out set: {len(queries)} queries over {len(corpus)} chunks.")
+    for model_name, kind in models:
+        check_parity(model_name, kind, args.backends, corpus, queries, args.k, args.min_recall)
+
+    print("\n" + "="*60)
+    print(f"✅ Done. Set INFERENCE_BACKEND to one of {args.backends} that passed.")
+    print("="*60)
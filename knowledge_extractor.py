@@ -0,0 +1,113 @@
+# knowledge_extractor.py
+# (V1.0 - Multi-Provider, Resumable Knowledge Graph Extraction)
+# สกัด Knowledge Graph จากทุกไฟล์ใน data/books/ ด้วย Gemini และ Groq พร้อมกันในคิวงานเดียว (core/kg_job_queue.py)
+# - ความคืบหน้าเก็บใน ExtractionCheckpoint: หยุด (Ctrl+C/คีย์หมด/เครื่องดับ) แล้วรันใหม่ได้ทันทีโดยไม่แตะไฟล์หนังสือ
+# - งานพร้อมกันของแต่ละ Provider ปรับตามคีย์ที่ว่างและ Rate limit ที่เจอจริง
+# ตัวอย่าง:
+#   python knowledge_extractor.py                      # ใช้ทุก Provider ที่มีคีย์
+#   python knowledge_extractor.py --providers groq     # ใช้เฉพาะ Groq
+#   python knowledge_extractor.py --status             # ดูความคืบหน้าใน Checkpoint
+#   python knowledge_extractor.py --reset-failed       # ให้ Chunk ที่ล้มเหลวครบจำนวนครั้งถูกลองใหม่
+
+import argparse
+import os
+import time
+import traceback
+
+from neo4j import GraphDatabase
+
+from core.config import settings
+from core.kg_checkpoint import ExtractionCheckpoint
+from core.kg_job_queue import ExtractionJobQueue
+
+
+def build_extractors(providers, neo4j_driver, gemini_model: str, groq_model: str) -> list:
+    extractors = []
+    if "gemini" in providers and settings.GOOGLE_API_KEYS:
+        from core.api_key_manager import ApiKeyManager
+        from knowledge_extractor_gemini import KnowledgeGraphExtractorGemini
+        key_manager = ApiKeyManager(all_google_keys=settings.GOOGLE_API_KEYS, silent=True)
+        extractors.append(KnowledgeGraphExtractorGemini(key_manager=key_manager, model_name=gemini_model, neo4j_driver=neo4j_driver))
+        print(f"🔑 Gemini: {len(key_manager.all_keys)} key(s), model {gemini_model}")
+    if "groq" in providers and settings.GROQ_API_KEYS:
+        from core.groq_key_manager import GroqApiKeyManager
+        from knowledge_extractor_llama import KnowledgeGraphExtractorLlama
+        key_manager = GroqApiKeyManager(all_groq_keys=settings.GROQ_API_KEYS, silent=True)
+        extractors.append(KnowledgeGraphExtractorLlama(key_manager=key_manager, model_name=groq_model, neo4j_driver=neo4j_driver))
+        print(f"🔑 Groq: {len(key_manager.all_keys)} key(s), model {groq_model}")
+    return extractors
+
+
+def print_status(checkpoint: ExtractionCheckpoint, books_folder: str):
+    summary = checkpoint.summary()
+    files = sorted(f for f in os.listdir(books_folder) if f.endswith(".jsonl")) if os.path.isdir(books_folder) else []
+    for filename in files:
+        with open(os.path.join(books_folder, filename), encoding="utf-8") as f:
+            total = sum(1 for line in f if line.strip())
+        counts = summary.get(filename, {"done": 0, "failed": 0})
+        print(f"  {filename}: {counts['done']}/{total} done, {counts['failed']} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable knowledge graph extraction over all books with Gemini and Groq.")
+    parser.add_argument("--providers", default="gemini,groq", help="Comma-separated providers to use (gemini, groq)")
+    parser.add_argument("--books-folder", default="data/books")
+    parser.add_argument("--batch-size", type=int, default=30, help="Chunks per Neo4j write batch")
+    parser.add_argument("--max-workers", type=int, default=settings.KG_MAX_WORKERS_PER_PROVIDER,
+                        help="Upper bound of concurrent chunks per provider (actual value adapts to key availability)")
+    parser.add_argument("--gemini-model", default=settings.PRIMARY_GEMINI_MODEL)
+    parser.add_argument("--groq-model", default=settings.PRIMARY_GROQ_MODEL)
+    parser.add_argument("--status", action="store_true", help="Print checkpoint progress and exit")
+    parser.add_argument("--reset-failed", action="store_true", help="Retry chunks that exhausted their attempts")
+    args = parser.parse_args()
+
+    checkpoint = ExtractionCheckpoint()
+    if args.status:
+        print_status(checkpoint, args.books_folder)
+        return
+    if args.reset_failed:
+        print(f"🔄 Reset {checkpoint.reset_failed()} failed chunk(s).")
+
+    start_time = time.time()
+    print("--- 🏭 Starting Knowledge Graph Extraction Process (Multi-Provider Queue) ---")
+    neo4j_driver = None
+    try:
+        neo4j_driver = GraphDatabase.driver(settings.NEO4J_URI, auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD))
+        neo4j_driver.verify_connectivity()
+        print("✅ Successfully connected to Neo4j database.")
+
+        providers = {p.strip().lower() for p in args.providers.split(",") if p.strip()}
+        extractors = build_extractors(providers, neo4j_driver, args.gemini_model, args.groq_model)
+        if not extractors:
+            print(f"⚠️ No API keys configured for providers: {', '.join(sorted(providers))}")
+            return
+        if not os.path.exists(args.books_folder):
+            print(f"⚠️ Books folder not found: {args.books_folder}")
+            return
+        files_to_process = sorted(f for f in os.listdir(args.books_folder) if f.endswith(".jsonl"))
+        if not files_to_process:
+            print(f"🟡 No .jsonl files found in '{args.books_folder}'.")
+            return
+
+        print(f"📚 Found {len(files_to_process)} files to process.")
+        job_queue = ExtractionJobQueue(extractors, checkpoint=checkpoint, batch_size=args.batch_size, max_workers=args.max_workers)
+        stats = job_queue.run([os.path.join(args.books_folder, filename) for filename in files_to_process])
+        print(f"📊 Done: {stats['done']} (by provider: {stats['completed_by']}), failed: {stats['failed']}, "
+              f"skipped: {stats['skipped']}, requeued: {stats['requeued']}")
+        print(f"⚙️  Concurrency: {stats['concurrency']}")
+        for provider, reason in stats["retired"].items():
+            print(f"   -> {provider} stopped early: {reason}")
+        if stats["halted"]:
+            print("   -> Stopped before the queue was empty. Run again to resume from the checkpoint.")
+    except Exception as e:
+        print(f"❌ A critical error occurred in the main process: {e}")
+        traceback.print_exc()
+    finally:
+        if neo4j_driver:
+            neo4j_driver.close()
+            print("\n🔗 Neo4j connection closed.")
+        print(f"\n✅ Knowledge Graph extraction process finished. Total time: {time.time() - start_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
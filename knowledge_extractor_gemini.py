@@ -1,22 +1,24 @@
 # knowledge_extractor_gemini.py
-# (V13 - Safe & Production-Ready)
+# (V14 - Checkpointed, Adaptive Extraction Queue)
 # อัปเกรดสู่มาตรฐานความปลอดภัยและการจัดการไฟล์สูงสุด
+# ความคืบหน้าเก็บใน ExtractionCheckpoint (ไฟล์หนังสือไม่ถูกเขียนทับ/ย้าย) และสกัดผ่าน ExtractionJobQueue
+# รันพร้อม Groq ในคิวเดียวกันได้ด้วย knowledge_extractor.py
 
 import json
 import os
 import time
 import re
 import traceback
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Any, Optional
 from google.api_core.exceptions import ResourceExhausted, TooManyRequests, GoogleAPICallError
 import google.generativeai as genai
 from neo4j import GraphDatabase
-from tqdm import tqdm
 
 from core.config import settings
+from core.kg_checkpoint import ExtractionCheckpoint
+from core.kg_job_queue import ExtractionJobQueue
 from core.api_key_manager import ApiKeyManager, AllKeysOnCooldownError
+from core.retry_policy import classify_error
 
 class KnowledgeGraphExtractorGemini:
     """
@@ -141,9 +143,10 @@ json
                 else:
                     raise ValueError(f"Failed to extract valid JSON. Raw response: {response.text[:200]}...")
             except (ResourceExhausted, TooManyRequests) as e:
-                error_type = 'quota' if isinstance(e, ResourceExhausted) else 'rate_limit'
+                # ResourceExhausted ส่วนใหญ่คือ 429 รายนาที: เป็น quota (Cooldown 24 ชม. ที่แชร์ทุก Process) เฉพาะข้อความรายวัน
+                error_type, retry_after = classify_error(e)
                 print(f"🔻 Key ...{api_key[-4:]} failed ({error_type}). Trying next key... ({attempt + 1}/{max_retries})")
-                self.key_manager.report_failure(api_key, error_type=error_type)
+                self.key_manager.report_failure(api_key, error_type=error_type, retry_after=retry_after)
                 last_exception = e
             except (GoogleAPICallError, ValueError) as e:
                 print(f"💥 Key ...{api_key[-4:]} encountered an error: {e}. Trying next key... ({attempt + 1}/{max_retries})")
@@ -209,72 +212,21 @@ json
             """)
             tx.run(query, edge_data=edge_list)
 
-    def _process_batch_parallel(self, lines_batch: List[str], max_workers: int) -> (List[Dict], List[str]):
-        failed_lines, successful_graphs = [], []
-        max_retries = len(self.key_manager.all_keys)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_line = {executor.submit(self._process_single_chunk, line, max_retries): line for line in lines_batch}
-            progress_bar = tqdm(as_completed(future_to_line), total=len(lines_batch), desc="  - Processing Batch", leave=False, unit="chunk")
-            for future in progress_bar:
-                original_line = future_to_line[future]
-                try:
-                    graph_data = future.result()
-                    if graph_data:
-                        successful_graphs.append(graph_data)
-                except AllKeysOnCooldownError as e:
-                    print(f"\n❌ CRITICAL: {e}. Stopping all processing.")
-                    for f in future_to_line: f.cancel()
-                    raise e
-                except Exception as e:
-                    print(f"\nDEBUG: Line failed after all retries: {type(e).__name__} - {e}\n")
-                    failed_lines.append(original_line)
-                    progress_bar.set_postfix_str(f"fails={len(failed_lines)}", refresh=True)
-        return successful_graphs, failed_lines
-
-    def process_file_resiliently(self, file_path: str, batch_size: int, max_workers: int):
-        file_name = os.path.basename(file_path)
-        processed_folder = os.path.join(os.path.dirname(file_path), "_processed")
-        os.makedirs(processed_folder, exist_ok=True)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                all_lines = f.readlines()
-            if not all_lines:
-                print(f"  - ✅ File '{file_name}' is empty. Moving to processed.")
-                shutil.move(file_path, os.path.join(processed_folder, file_name))
-                return
-            print(f"\n--- 🧠 Processing: {file_name} (Model: {self.model_name}, Total: {len(all_lines)} lines) ---")
-            lines_iterator = iter(all_lines)
-            all_failed_lines = []
-            with tqdm(total=len(all_lines), desc=f"Overall ({file_name})", unit="lines") as pbar:
-                while True:
-                    lines_batch = [line for _, line in zip(range(batch_size), lines_iterator)]
-                    if not lines_batch:
-                        break
-                    successful_graphs, failed_lines_in_batch = self._process_batch_parallel(lines_batch, max_workers)
-                    if successful_graphs:
-                        self._write_batch_to_neo4j(successful_graphs)
-                    if failed_lines_in_batch:
-                        all_failed_lines.extend(failed_lines_in_batch)
-                    pbar.update(len(lines_batch))
-            if all_failed_lines:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.writelines(all_failed_lines)
-                print(f"  - ⚠️ File state partially updated. {len(all_failed_lines)} failed lines remain in '{file_name}'.")
-            else:
-                shutil.move(file_path, os.path.join(processed_folder, file_name))
-                print(f"  - ✨ File state fully updated. Moved '{file_name}' to processed folder.")
-        except AllKeysOnCooldownError as e:
-            raise e
-        except Exception as e:
-            print(f"❌ An unexpected error occurred while processing {file_path}: {e}")
-            traceback.print_exc()
+    def process_file_resiliently(self, file_path: str, batch_size: int, max_workers: Optional[int] = None,
+                                 checkpoint: Optional[ExtractionCheckpoint] = None) -> Dict[str, Any]:
+        """
+        สกัดทุก Chunk ที่ยังไม่เสร็จของไฟล์ (ข้าม Chunk ที่ Checkpoint บันทึกไว้แล้ว) ไฟล์ต้นฉบับไม่ถูกแก้ไข
+        max_workers คือเพดานงานพร้อมกัน จำนวนจริงปรับตามคีย์ที่ว่างและ Rate limit
+        """
+        job_queue = ExtractionJobQueue([self], checkpoint=checkpoint, batch_size=batch_size, max_workers=max_workers)
+        return job_queue.run([file_path])
 
 def main():
     start_time = time.time()
-    print("--- 🏭 Starting Knowledge Graph Extraction Process (V13 - Gemini Production) ---")
+    print("--- 🏭 Starting Knowledge Graph Extraction Process (V14 - Gemini Production) ---")
 
     BATCH_SIZE = 50
-    MAX_WORKERS = 2
+    MAX_WORKERS = settings.KG_MAX_WORKERS_PER_PROVIDER
     BOOKS_FOLDER = "data/books"
     MODEL_TO_USE = "gemini-1.5-flash-latest"
     
@@ -304,13 +256,12 @@ def main():
             print(f"🟡 No .jsonl files found in '{BOOKS_FOLDER}'.")
         else:
             print(f"📚 Found {len(files_to_process)} files to process.")
-            for filename in files_to_process:
-                book_file_path = os.path.join(BOOKS_FOLDER, filename)
-                extractor_instance.process_file_resiliently(
-                    file_path=book_file_path, 
-                    batch_size=BATCH_SIZE, 
-                    max_workers=MAX_WORKERS
-                )
+            job_queue = ExtractionJobQueue([extractor_instance], batch_size=BATCH_SIZE, max_workers=MAX_WORKERS)
+            stats = job_queue.run([os.path.join(BOOKS_FOLDER, filename) for filename in files_to_process])
+            print(f"📊 Done: {stats['done']}, failed: {stats['failed']}, skipped: {stats['skipped']}, "
+                  f"concurrency: {stats['concurrency']}")
+            if stats["halted"]:
+                print("   -> Stopped before the queue was empty. Run again to resume from the checkpoint.")
 
     except AllKeysOnCooldownError as e:
         print(f"\n🔥🔥🔥 API KEYS EXHAUSTED - CRITICAL FAILURE 🔥🔥🔥")
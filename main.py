@@ -3,18 +3,17 @@
 # --- Project Nexus AI Assistant Server ---
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import os
 import traceback
+import json
 from contextlib import asynccontextmanager
-from sentence_transformers import SentenceTransformer, CrossEncoder
 import torch
 import time
 import asyncio
-from datetime import datetime, timedelta
 
 # --- ส่วนของ Core ---
 from core.config import settings
@@ -22,10 +21,17 @@ from core.dispatcher import Dispatcher, FinalResponse
 from core.rag_engine import RAGEngine
 from core.memory_manager import MemoryManager
 from core.long_term_memory_manager import LongTermMemoryManager
+from core.memory_consolidation import MemoryConsolidator, MemoryConsolidationWorker
 from core.api_key_manager import ApiKeyManager
 from core.graph_manager import GraphManager
 from core.groq_key_manager import GroqApiKeyManager
+from core.request_context import RequestCancelled, RequestContext, SessionRequests
+from core.retry_policy import register_provider
+from core.audio_cache import CACHE_FILENAME
+from core.audio_tasks import AudioTaskRegistry
 from core.tts_engine import TextToSpeechEngine
+from core.inference_backend import load_embedder, load_reranker
+from core.inference_scheduler import BatchingEmbedder, BatchingReranker
 # --- ส่วนของ Agents ---
 from agents.planning_mode.planner_agent import PlannerAgent
 from agents.formatter_agent import FormatterAgent
@@ -49,75 +55,84 @@ web_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web")
 AGENTS = {}
 GRAPH_MANAGER: GraphManager = None
 DISPATCHER: Dispatcher = None
-audio_tasks = {}
+INFERENCE_SCHEDULERS = {}
+MEMORY_WORKER: MemoryConsolidationWorker = None
+KEY_MANAGERS = {}
+ACTIVE_REQUESTS = SessionRequests()
+AUDIO_TASKS = AudioTaskRegistry()
 
-async def create_audio_file_background(text: str, output_path: str, task_id: str):
-    """ฟังก์ชันนี้จะถูกรันใน Background เพื่อสร้างไฟล์เสียง"""
+async def create_audio_file_background(text: str, task_id: str):
+    """
+    ฟังก์ชันนี้จะถูกรันใน Background เพื่อสร้างไฟล์เสียง
+    การสังเคราะห์ (Network/CPU แบบ Blocking) ทำใน Thread ไม่บล็อก Event loop
+    แต่ละท่อนถูกส่งเข้า AUDIO_TASKS ทันทีที่พร้อม แล้ว Push ต่อให้ Client (audio_segment / audio_ready)
+    ไฟล์เสียงมาจาก AudioCache (ชื่อไฟล์ = Hash ของข้อความ) ข้อความที่เคยสังเคราะห์แล้วจึงพร้อมทันที
+    """
+    loop = asyncio.get_running_loop()
     try:
         print(f"🎙️  Starting background audio synthesis for task: {task_id}")
         tts_agent = AGENTS.get("TTS")
         if tts_agent:
-            voice_file_path = tts_agent.synthesize(text, output_path)
+            def on_segment(index: int, segment_path: str, total: int):
+                # เรียกจาก Thread ของ TTS: ส่งกลับไปทำบน Event loop
+                loop.call_soon_threadsafe(AUDIO_TASKS.add_segment, task_id, f"/audio/{os.path.basename(segment_path)}", total)
+
+            voice_file_path = await asyncio.to_thread(tts_agent.synthesize_stream, text, on_segment)
             if voice_file_path:
-                audio_tasks[task_id] = {"status": "done", "url": f"/static/audio/{os.path.basename(output_path)}"}
+                AUDIO_TASKS.finish(task_id, f"/audio/{os.path.basename(voice_file_path)}")
                 print(f"  - ✅ Audio task {task_id} completed.")
                 return
-        audio_tasks[task_id] = {"status": "failed", "error": "TTS agent not found or synthesis failed"}
+        AUDIO_TASKS.fail(task_id, "TTS agent not found or synthesis failed")
     except Exception as e:
         print(f"  - ❌ Background audio synthesis failed for task {task_id}: {e}")
-        audio_tasks[task_id] = {"status": "failed", "error": str(e)}
-
-async def cleanup_old_audio_files():
-    """Service ที่ทำงานเบื้องหลังเพื่อลบไฟล์เสียงเก่า"""
-    audio_dir = os.path.join(web_dir, "static", "audio")
-    cleanup_interval_seconds = 300  # 5 นาที
-    max_file_age_minutes = 5        # อายุไฟล์สูงสุด 5 นาที
-    
-    while True:
-        await asyncio.sleep(cleanup_interval_seconds)
-        
-        print("🧹 Running audio cleanup service...")
-        try:
-            if not os.path.exists(audio_dir):
-                continue
+        AUDIO_TASKS.fail(task_id, str(e))
 
-            for filename in os.listdir(audio_dir):
-                if filename.endswith(".mp3"):
-                    file_path = os.path.join(audio_dir, filename)
-                    try:
-                        file_mod_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                        if datetime.now() - file_mod_time > timedelta(minutes=max_file_age_minutes):
-                            print(f"  - Deleting old audio file: {filename}")
-                            os.remove(file_path)
-                    except FileNotFoundError:
-                        continue
-        except Exception as e:
-            print(f"  - Error during audio cleanup: {e}")
+def start_audio_task(text: str, user_id: str) -> str:
+    """ลงทะเบียนงานสร้างเสียงของคำตอบแล้วเริ่มใน Background คืน task_id (รับผลทาง WebSocket, /audio_events หรือ /audio_status)"""
+    task_id = AUDIO_TASKS.create(user_id)
+    asyncio.create_task(create_audio_file_background(text, task_id))
+    return task_id
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global DISPATCHER, GRAPH_MANAGER, AGENTS
+    global DISPATCHER, GRAPH_MANAGER, AGENTS, INFERENCE_SCHEDULERS, MEMORY_WORKER, KEY_MANAGERS
     print("--- 🚀 Initializing Project Nexus Server (V3.1 - Hybrid AI Team) ---")
     try:
         google_key_manager = ApiKeyManager(all_google_keys=settings.GOOGLE_API_KEYS, silent=True)
         groq_key_manager = GroqApiKeyManager(all_groq_keys=settings.GROQ_API_KEYS, silent=True)
+        KEY_MANAGERS = {"google": google_key_manager, "groq": groq_key_manager}
+        # ให้ call_llm สลับไปใช้อีกผู้ให้บริการได้เมื่อโมเดลหลักใช้ไม่ได้
+        for key_manager in KEY_MANAGERS.values():
+            register_provider(key_manager)
         
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"--- 🧠 Initializing Central Armory on {device.upper()} (Stable FP32 Mode) ---")
+        print(f"--- 🧠 Initializing Central Armory on {device.upper()} (Backend: {settings.INFERENCE_BACKEND}) ---")
         
-        embedder_instance = SentenceTransformer("intfloat/multilingual-e5-large", device=device)
-        reranker_instance = CrossEncoder("BAAI/bge-reranker-base", device=device)
+        embedder_instance = load_embedder("intfloat/multilingual-e5-large", device=device)
+        reranker_instance = load_reranker("BAAI/bge-reranker-base", device=device)
+        if settings.INFERENCE_SCHEDULER_ENABLED:
+            embedder_instance = BatchingEmbedder(embedder_instance)
+            reranker_instance = BatchingReranker(reranker_instance)
+            INFERENCE_SCHEDULERS = {"embedder": embedder_instance.scheduler, "reranker": reranker_instance.scheduler}
+            print(f"  - ⏱️  Inference micro-batching enabled (window {settings.INFERENCE_BATCH_WINDOW_MS} ms).")
         print("  - ✅ Embedding and Reranking models loaded successfully.")
+        ltm_manager_instance = LongTermMemoryManager(
+            embedding_model="intfloat/multilingual-e5-large",
+            index_dir="data/memory_index",
+            embedder=embedder_instance
+        )
         rag_engine_instance = RAGEngine(
             embedder=embedder_instance,
-            reranker=reranker_instance
+            reranker=reranker_instance,
+            memory_live=ltm_manager_instance.live
         )
         memory_manager_instance = MemoryManager()
         tts_engine_instance = TextToSpeechEngine()
-        ltm_manager_instance = LongTermMemoryManager(
-            embedding_model="intfloat/multilingual-e5-large",
-            index_dir="data/memory_index"
-        )
+        if settings.MEMORY_CONSOLIDATION_ENABLED:
+            MEMORY_WORKER = MemoryConsolidationWorker(
+                MemoryConsolidator(embedder_instance, live=ltm_manager_instance.live)
+            )
+            MEMORY_WORKER.start()
         AGENTS = {
             "MEMORY": memory_manager_instance,
             "SYSTEM": SystemAgent(),
@@ -190,7 +205,6 @@ async def lifespan(app: FastAPI):
                 persona_prompt=FENG_PERSONA_PROMPT
             )
         }
-        asyncio.create_task(cleanup_old_audio_files())
         DISPATCHER = Dispatcher(agents=AGENTS, key_manager=google_key_manager) 
         print("✅ All systems operational. Hybrid AI team is ready.")
     except Exception as e:
@@ -200,6 +214,14 @@ async def lifespan(app: FastAPI):
     yield
     
     print("--- 🌙 Server shutting down ---")
+    if MEMORY_WORKER:
+        MEMORY_WORKER.stop()
+    for scheduler in INFERENCE_SCHEDULERS.values():
+        scheduler.stop()
+    if (coder := AGENTS.get("CODER")) and hasattr(coder, "code_executor"):
+        coder.code_executor.close()
+    if AGENTS.get("TTS"):
+        AGENTS["TTS"].close()
     if GRAPH_MANAGER:
         GRAPH_MANAGER.close()
 
@@ -219,91 +241,187 @@ class QueryRequest(BaseModel):
 async def serve_frontend():
     return FileResponse(os.path.join(web_dir, 'index.html'))
 
+async def process_websocket_query(websocket: WebSocket, query: str, user_id: str, context: RequestContext):
+    """ประมวลผลข้อความหนึ่งข้อความของ WebSocket (รันเป็น Task แยก เพื่อให้ข้อความใหม่/การตัดการเชื่อมต่อยกเลิกได้)"""
+    async def send_update(data: dict):
+        await websocket.send_json(data)
+
+    try:
+        await send_update({"type": "progress", "payload": {"status": "RECEIVED", "detail": "ได้รับคำสั่งแล้ว กำลังประมวลผล..."}})
+        
+        response_model = await DISPATCHER.handle_query(query, user_id, update_callback=send_update, context=context)
+        
+        if response_model.answer and not response_model.error:
+            response_model.voice_task_id = start_audio_task(response_model.answer, user_id)
+        final_data = response_model.dict()
+        await send_update({"type": "final_response", "payload": final_data})
+        if response_model.voice_task_id:
+            # สมัครหลังส่งคำตอบ: Client รู้ task_id ก่อนได้ Event เสียงเสมอ (Event ที่เกิดไปแล้วถูกส่งย้อนหลังให้)
+            AUDIO_TASKS.subscribe(response_model.voice_task_id, send_update)
+
+    except asyncio.CancelledError:
+        print(f"🛑 Request {context.request_id} for user {user_id} stopped ({context.reason or 'cancelled'}).")
+    except RequestCancelled as e:
+        # ถูกแทนที่โดยข้อความจากการเชื่อมต่ออื่นของ Session เดียวกัน: แจ้งการเชื่อมต่อนี้ให้เลิกรอ
+        print(f"🛑 Request {context.request_id} for user {user_id} stopped ({e.reason}).")
+        try:
+            await send_update({"type": "error", "payload": {"detail": "คำถามนี้ถูกยกเลิก เนื่องจากมีคำถามใหม่เข้ามาแทน"}})
+        except Exception:
+            pass
+    except Exception as e:
+        print(f"❌ Error during WebSocket processing for user {user_id}: {e}")
+        traceback.print_exc()
+        try:
+            await send_update({"type": "error", "payload": {"detail": "เกิดข้อผิดพลาดร้ายแรงระหว่างการประมวลผล"}})
+        except Exception:
+            pass
+    finally:
+        ACTIVE_REQUESTS.finish(context)
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
     await websocket.accept()
     print(f"🔗 WebSocket connection established for user: {user_id}")
+    current_task, current_context = None, None
     try:
         while True:
             query = await websocket.receive_text()
-            
-            async def send_update(data: dict):
-                await websocket.send_json(data)
 
             if not DISPATCHER:
-                await send_update({"type": "error", "payload": {"detail": "Server is initializing."}})
+                await websocket.send_json({"type": "error", "payload": {"detail": "Server is initializing."}})
                 continue
-            
-            try:
-                await send_update({"type": "progress", "payload": {"status": "RECEIVED", "detail": "ได้รับคำสั่งแล้ว กำลังประมวลผล..."}})
-                
-                response_model = await DISPATCHER.handle_query(query, user_id, update_callback=send_update)
-                
-                if response_model.answer and not response_model.error:
-                    timestamp = int(time.time())
-                    filename = f"response_{user_id}_{timestamp}.mp3"
-                    task_id = filename
-                    
-                    audio_dir = os.path.join(web_dir, "static", "audio")
-                    os.makedirs(audio_dir, exist_ok=True)
-                    output_path = os.path.join(audio_dir, filename)
-                    
-                    audio_tasks[task_id] = {"status": "processing"}
-                    asyncio.create_task(create_audio_file_background(response_model.answer, output_path, task_id))
-                    
-                    response_model.voice_task_id = task_id
-                final_data = response_model.dict()
-                await send_update({"type": "final_response", "payload": final_data})
-
-            except Exception as e:
-                print(f"❌ Error during WebSocket processing for user {user_id}: {e}")
-                traceback.print_exc()
-                await send_update({"type": "error", "payload": {"detail": "เกิดข้อผิดพลาดร้ายแรงระหว่างการประมวลผล"}})
+
+            # ข้อความใหม่แทนที่ข้อความที่ยังประมวลผลไม่เสร็จของ Session เดียวกัน (รวมถึงจากแท็บ/การเชื่อมต่ออื่น)
+            current_context = ACTIVE_REQUESTS.start(user_id)
+            if current_task and not current_task.done():
+                current_task.cancel()
+            current_task = asyncio.create_task(process_websocket_query(websocket, query, user_id, current_context))
 
     except WebSocketDisconnect:
         print(f"👋 WebSocket connection closed for user: {user_id}")
     except Exception as e:
         print(f"❌ Unhandled WebSocket error for user {user_id}: {e}")
         await websocket.close(code=1011)
+    finally:
+        # ไม่มีใครรอคำตอบแล้ว: หยุด Agent/LLM ที่ยังทำงานอยู่ของการเชื่อมต่อนี้
+        if current_task and not current_task.done():
+            current_context.cancel("disconnected")
+            current_task.cancel()
+
+async def cancel_on_disconnect(http_request: Request, context: RequestContext):
+    """ยกเลิก Request ของ /ask เมื่อ Client ตัดการเชื่อมต่อก่อนได้คำตอบ"""
+    while not context.cancelled:
+        if await http_request.is_disconnected():
+            context.cancel("disconnected")
+            return
+        await asyncio.sleep(0.5)
 
 @app.post("/ask", response_model=FinalResponse)
-async def ask_assistant(request: QueryRequest, background_tasks: BackgroundTasks):
+async def ask_assistant(request: QueryRequest, http_request: Request):
     if not DISPATCHER:
         raise HTTPException(status_code=503, detail="Server is still initializing or has failed.")
+    context = ACTIVE_REQUESTS.start(request.user_id)
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, context))
     try:
-        response = await DISPATCHER.handle_query(request.query, request.user_id)
+        response = await DISPATCHER.handle_query(request.query, request.user_id, context=context)
 
         if response.answer and not response.error:
-            timestamp = int(time.time())
-            filename = f"response_{request.user_id}_{timestamp}.mp3"
-            task_id = filename
-            
-            audio_dir = os.path.join(web_dir, "static", "audio")
-            os.makedirs(audio_dir, exist_ok=True)
-            output_path = os.path.join(audio_dir, filename)
-            
-            audio_tasks[task_id] = {"status": "processing"}
-            background_tasks.add_task(create_audio_file_background, response.answer, output_path, task_id)
-            
-            response.voice_task_id = task_id
+            response.voice_task_id = start_audio_task(response.answer, request.user_id)
 
         return response
         
+    except RequestCancelled as e:
+        print(f"🛑 /ask request {context.request_id} for user {request.user_id} stopped ({e.reason}).")
+        return FinalResponse(agent_used="CANCELLED", answer="คำถามนี้ถูกยกเลิก เนื่องจากมีคำถามใหม่เข้ามาแทน", error=True)
     except Exception as e:
         print(f"❌ Unhandled error in /ask endpoint: {e}")
         traceback.print_exc()
         return FinalResponse(agent_used="FATAL_ERROR", answer="ขออภัยครับ เกิดข้อผิดพลาดร้ายแรง", error=True)
+    finally:
+        watcher.cancel()
+        ACTIVE_REQUESTS.finish(context)
 
 @app.get("/audio_status/{task_id}")
-async def get_audio_status(task_id: str):
-    task = audio_tasks.get(task_id)
+async def get_audio_status(task_id: str, since: int = 0, wait: float = 0):
+    """
+    สถานะงานสร้างเสียง สำหรับ Client ที่ไม่มี WebSocket (/ask)
+    Long-poll: ส่ง wait=<วินาที> และ since=<จำนวนท่อนที่มีแล้ว> เพื่อรอจนมีท่อนใหม่หรืองานจบ แทนการ Poll ถี่ๆ
+    """
+    task = await AUDIO_TASKS.wait(task_id, since, min(max(wait, 0.0), settings.AUDIO_STATUS_MAX_WAIT_SECONDS))
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    if task["status"] in ["done", "failed"]:
-        return audio_tasks.pop(task_id)
-        
-    return task
+    return task.to_dict()
+
+@app.get("/audio_events/{task_id}")
+async def stream_audio_events(task_id: str):
+    """Server-Sent Events ของงานสร้างเสียง (Event เดียวกับที่ Push ทาง WebSocket) ปิด Stream เมื่องานจบ"""
+    if not AUDIO_TASKS.get(task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    queue: asyncio.Queue = asyncio.Queue()
+    AUDIO_TASKS.subscribe(task_id, queue.put)
+
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.AUDIO_STATUS_MAX_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['payload'], ensure_ascii=False)}\n\n"
+                if event["type"] in ("audio_ready", "audio_failed"):
+                    return
+        finally:
+            AUDIO_TASKS.unsubscribe(task_id, queue.put)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/audio/{filename}")
+async def get_audio_file(filename: str):
+    """
+    ไฟล์เสียงจาก AudioCache: ชื่อไฟล์คือ Hash ของเนื้อหา (ไม่มีวันเปลี่ยน) จึงให้ Browser Cache ได้ตลอด
+    """
+    tts_agent = AGENTS.get("TTS")
+    if not tts_agent or not CACHE_FILENAME.match(filename):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    path = tts_agent.cache.path(filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/metrics/inference", tags=["Metrics"])
+async def get_inference_metrics():
+    """Histogram ของขนาด Batch และเวลารอคิว (ms) ของ Inference Scheduler แต่ละตัว"""
+    return {name: scheduler.metrics() for name, scheduler in INFERENCE_SCHEDULERS.items()}
+
+@app.get("/metrics/keys", tags=["Metrics"])
+async def get_key_metrics():
+    """การใช้งาน API Key ต่อคีย์ (Request ใน 60 วินาที, ขีดจำกัดที่เรียนรู้จาก 429, Cooldown) ของแต่ละ Provider"""
+    return {name: manager.metrics() for name, manager in KEY_MANAGERS.items()}
+
+@app.get("/metrics/requests", tags=["Metrics"])
+async def get_request_metrics():
+    """จำนวน Request ที่กำลังทำงาน, Request ที่ถูกแทนที่ด้วยข้อความใหม่ และอายุของ Request ที่เก่าที่สุด"""
+    return ACTIVE_REQUESTS.metrics()
+
+@app.get("/metrics/sandbox", tags=["Metrics"])
+async def get_sandbox_metrics():
+    """สถานะ Worker ของ Code Sandbox: จำนวนงาน, Timeout, Worker ที่ Crash/ถูกสร้างใหม่ และ Worker ที่ว่าง"""
+    coder = AGENTS.get("CODER")
+    return coder.code_executor.metrics() if coder and hasattr(coder, "code_executor") else {}
+
+@app.get("/metrics/tts", tags=["Metrics"])
+async def get_tts_metrics():
+    """AudioCache ของ TTS (ไฟล์, ขนาด, Hit rate, LRU) และงานสร้างเสียง (สถานะ, ผู้รับ Event, งานที่หมดอายุ)"""
+    tts_agent = AGENTS.get("TTS")
+    return {"cache": tts_agent.cache.metrics() if tts_agent else {}, "tasks": AUDIO_TASKS.metrics()}
+
+@app.get("/metrics/memory", tags=["Metrics"])
+async def get_memory_metrics():
+    """สถานะของ MemoryConsolidationWorker: จำนวนรอบ, ความทรงจำที่ Index แล้ว และ Lag ของข้อความที่ยังไม่ถูกประมวลผล"""
+    if not MEMORY_WORKER:
+        return {"running": False, "enabled": settings.MEMORY_CONSOLIDATION_ENABLED}
+    return await asyncio.to_thread(MEMORY_WORKER.metrics)
 
 @app.get("/api/graph/explore", tags=["Knowledge Graph"])
 def get_graph_data_for_visualization(entity: str, limit: int = 25):
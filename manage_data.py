@@ -1,116 +1,363 @@
 # manage_data.py
-# (V4.2 - Hotfix & Efficient RAG Architect)
+# (V5.1 - Streaming, Checkpointed RAG Architect)
 
 import os
 import json
 import faiss
-from sentence_transformers import SentenceTransformer
-import torch
+import numpy as np
 import re
 import shutil
-from typing import List, Dict, Set
+import hashlib
+import argparse
+from typing import List, Dict, Set, Optional, Tuple, Iterator
 from collections import defaultdict
+from core.atomic_files import TMP_SUFFIX, apply_commit_journal, commit_files_atomically
+from core.config import settings
+from core.lexical_index import BM25Index, LEXICAL_INDEX_FILENAME
+from core.vector_index import META_SUFFIX, build_index, create_index, read_index_meta, write_index
+from core.embedding_cache import EmbeddingCache
+from core.embedding_pipeline import EmbeddingPipeline
+
+FAISS_FILENAME = "faiss.index"
+FAISS_META_FILENAME = FAISS_FILENAME + META_SUFFIX
+MAPPING_FILENAME = "mapping.jsonl"
+PENDING_MAPPING_FILENAME = MAPPING_FILENAME + ".pending" + TMP_SUFFIX
+
+
+def compute_chunk_hash(embedding_text: str) -> str:
+    return hashlib.sha256(embedding_text.encode("utf-8")).hexdigest()
+
+
+def resolve_book_id(item: Dict) -> str:
+    """book_id ใช้ค่าที่ระบุในข้อมูลถ้ามี ไม่เช่นนั้นใช้ชื่อไฟล์ต้นทาง (ไม่รวมนามสกุล)"""
+    if item.get("book_id"):
+        return str(item["book_id"])
+    return os.path.splitext(item.get("_source_filename", "unknown"))[0]
+
+
+class CategoryIndexStore:
+    """
+    Index ของหมวดหมู่เดียวที่ต่อเติมได้ (Append-only) และลบรายเล่มได้
+    - จำเฉพาะ (chunk_hash, book_id) ของแต่ละแถวไว้ในหน่วยความจำ ไม่โหลด Mapping ทั้งก้อน
+    - แถวใหม่ถูกเขียนต่อท้ายไฟล์ Pending ทันที (ไม่ค้างใน RAM) และมีผลจริงเมื่อ commit() เท่านั้น
+    """
+    def __init__(self, category_folder: str):
+        self.folder = category_folder
+        os.makedirs(self.folder, exist_ok=True)
+        self.index_path = os.path.join(self.folder, FAISS_FILENAME)
+        self.mapping_path = os.path.join(self.folder, MAPPING_FILENAME)
+        self.lexical_path = os.path.join(self.folder, LEXICAL_INDEX_FILENAME)
+        self.pending_path = os.path.join(self.folder, PENDING_MAPPING_FILENAME)
+
+        if apply_commit_journal(self.folder):
+            print(f"  - ♻️  Recovered an interrupted commit in '{self.folder}'.")
+        for name in os.listdir(self.folder):
+            if name.endswith(TMP_SUFFIX):
+                os.remove(os.path.join(self.folder, name))
+
+        self.index: Optional[faiss.Index] = faiss.read_index(self.index_path) if os.path.exists(self.index_path) else None
+        self.spec = read_index_meta(self.index_path)["spec"] if self.index is not None else settings.VECTOR_INDEX_SPEC
+        # Index ชนิดที่ต้อง Train: พักเวกเตอร์ชุดแรกไว้จนพอสำหรับ Train (ไม่เกิน VECTOR_INDEX_TRAIN_SIZE)
+        self._untrained: List[np.ndarray] = []
+        # แต่ละแถว: (chunk_hash, book_id, ตำแหน่งเดิมในไฟล์ mapping ต่อด้วยไฟล์ pending)
+        self.rows: List[Tuple[str, str, int]] = []
+        self.existing_line_count = 0
+        if os.path.exists(self.mapping_path):
+            with open(self.mapping_path, "r", encoding="utf-8") as f:
+                for pos, line in enumerate(f):
+                    item = json.loads(line)
+                    chunk_hash = item.get("chunk_hash") or compute_chunk_hash(item.get("embedding_text", ""))
+                    self.rows.append((chunk_hash, resolve_book_id(item), pos))
+            self.existing_line_count = len(self.rows)
+
+        if self.index is not None and self.index.ntotal != len(self.rows):
+            raise RuntimeError(f"Index/mapping mismatch in '{self.folder}' ({self.index.ntotal} vectors, {len(self.rows)} rows).")
+
+        self.known_hashes: Set[str] = {h for h, _, _ in self.rows}
+        self.pending_count = 0
+        self._pending_file = None
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def has_chunk(self, chunk_hash: str) -> bool:
+        return chunk_hash in self.known_hashes
+
+    def append(self, items: List[Dict], embeddings: np.ndarray):
+        if not items:
+            return
+        if self.index is None and not self._untrained:
+            candidate = create_index(embeddings.shape[1], self.spec)
+            if candidate.is_trained:
+                self.index = candidate
+        if self.index is not None:
+            self.index.add(embeddings)
+        else:
+            self._untrained.append(embeddings)
+            if sum(len(v) for v in self._untrained) >= settings.VECTOR_INDEX_TRAIN_SIZE:
+                self._train_from_buffer()
+        if self._pending_file is None:
+            self._pending_file = open(self.pending_path, "a", encoding="utf-8")
+        for item in items:
+            self._pending_file.write(json.dumps(item, ensure_ascii=False) + "\n")
+            self.rows.append((item["chunk_hash"], item["book_id"], self.existing_line_count + self.pending_count))
+            self.known_hashes.add(item["chunk_hash"])
+            self.pending_count += 1
+        self.dirty = True
+
+    def _train_from_buffer(self):
+        if self._untrained:
+            self.index, self.spec = build_index(np.vstack(self._untrained), self.spec)
+            self._untrained = []
+
+    def remove_rows(self, predicate) -> int:
+        """ลบแถวที่ predicate(chunk_hash, book_id) เป็นจริง ออกจากทั้ง FAISS และ Mapping"""
+        self._train_from_buffer()
+        doomed = [i for i, (h, b, _) in enumerate(self.rows) if predicate(h, b)]
+        if not doomed:
+            return 0
+        # IndexFlat.remove_ids คงลำดับของแถวที่เหลือไว้ จึงยังตรงกับลำดับใน Mapping
+        self.index.remove_ids(np.asarray(doomed, dtype="int64"))
+        doomed_set = set(doomed)
+        self.rows = [row for i, row in enumerate(self.rows) if i not in doomed_set]
+        self.known_hashes = {h for h, _, _ in self.rows}
+        self.dirty = True
+        return len(doomed)
+
+    def delete_book(self, book_id: str) -> int:
+        return self.remove_rows(lambda _, b: b == book_id)
+
+    def _iter_live_lines(self):
+        live_positions = {pos for _, _, pos in self.rows}
+        pos = 0
+        for path in (self.mapping_path, self.pending_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if pos in live_positions:
+                        yield line
+                    pos += 1
+
+    def commit(self, build_lexical: bool = True):
+        """
+        เขียนการเปลี่ยนแปลงทั้งหมดลงดิสก์แบบ Atomic
+        build_lexical=False ใช้กับ Checkpoint ระหว่างการ Build: ข้ามการสร้าง BM25 (ซึ่งต้องอ่านทุกแถว)
+        และลบ Lexical Index เดิมที่ไม่ตรงกับ Mapping แล้วทิ้ง ระบบค้นหาจะใช้ Vector อย่างเดียวจนกว่าจะ Commit รอบสุดท้าย
+        """
+        if self._pending_file is not None:
+            self._pending_file.close()
+            self._pending_file = None
+        if self.index is None and self._untrained:
+            if not build_lexical:
+                # Checkpoint: ยังไม่มีตัวอย่างพอสำหรับ Train จึงยังไม่ Commit (เวกเตอร์อยู่ใน EmbeddingCache แล้ว)
+                return
+            self._train_from_buffer()
+        lexical_missing = self.index is not None and not os.path.exists(self.lexical_path)
+        if not self.dirty and not (build_lexical and lexical_missing):
+            return
+        if self.index is None or self.index.ntotal == 0:
+            for path in (self.index_path, self.index_path + META_SUFFIX, self.mapping_path, self.lexical_path, self.pending_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            write_index(self.index, self.index_path + TMP_SUFFIX, self.spec,
+                        meta_file=self.index_path + META_SUFFIX + TMP_SUFFIX)
+            with open(self.mapping_path + TMP_SUFFIX, "w", encoding="utf-8") as f:
+                for line in self._iter_live_lines():
+                    f.write(line)
+
+            replacements = {
+                FAISS_FILENAME: FAISS_FILENAME + TMP_SUFFIX,
+                FAISS_META_FILENAME: FAISS_META_FILENAME + TMP_SUFFIX,
+                MAPPING_FILENAME: MAPPING_FILENAME + TMP_SUFFIX,
+                LEXICAL_INDEX_FILENAME: None,
+            }
+            if build_lexical:
+                with open(self.mapping_path + TMP_SUFFIX, "r", encoding="utf-8") as f:
+                    texts = (json.loads(line).get("embedding_text", "") for line in f)
+                    BM25Index.build(texts).save(self.lexical_path + TMP_SUFFIX)
+                replacements[LEXICAL_INDEX_FILENAME] = LEXICAL_INDEX_FILENAME + TMP_SUFFIX
+
+            commit_files_atomically(self.folder, replacements)
+            if os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+
+        self.rows = [(h, b, i) for i, (h, b, _) in enumerate(self.rows)]
+        self.existing_line_count = len(self.rows)
+        self.pending_count = 0
+        self.dirty = False
+
 
 class RAGBuilder:
     def __init__(self, model_name="intfloat/multilingual-e5-large"):
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"⚙️  RAG Builder is initializing on device: {device.upper()}")
-        self.model = SentenceTransformer(model_name, device=device)
+        print("⚙️  RAG Builder is initializing...")
+        self.model = EmbeddingPipeline(model_name)
+        self.embedding_cache = EmbeddingCache(model_name, variant=self.model.cache_variant)
         print(f"✅ Embedding model '{model_name}' loaded successfully.")
 
-    def _sanitize_name(self, name: str) -> str:
+    @staticmethod
+    def _sanitize_name(name: str) -> str:
         name = re.sub(r'\s+', ' ', name)
         name = name.strip()
         name = re.sub(r'[/\\:*?"<>|]+', '-', name)
         return name
 
-    def load_and_group_data_by_category(self, data_folder: str) -> Dict[str, List[Dict]]:
-        categorized_data = defaultdict(list)
-        print(f"\n--- 📚 Loading and grouping book data from '{data_folder}' ---")
-        
-        files_to_process = sorted([f for f in os.listdir(data_folder) if f.endswith(".jsonl")])
-        
+    def list_book_files(self, data_folder: str) -> List[str]:
+        return sorted([f for f in os.listdir(data_folder) if f.endswith(".jsonl")])
+
+    def iter_file_chunks(self, data_folder: str, filename: str) -> Iterator[Tuple[str, Dict]]:
+        """อ่านไฟล์ .jsonl ทีละบรรทัด แล้วคืนค่า (category, item ที่เตรียมแล้ว) ทีละ Chunk"""
+        path = os.path.join(data_folder, filename)
+        with open(path, "r", encoding="utf-8") as f:
+            for line_num, line in enumerate(f, 1):
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"  - ⚠️ Skipping malformed JSON on line {line_num} in '{filename}'")
+                    continue
+                if not item.get("content"):
+                    continue
+                category_raw = item.get("category", "Uncategorized")
+                category_clean = re.sub(r'\s+', ' ', category_raw).strip()
+
+                item['_source_filename'] = filename
+                item['_source_line_num'] = line_num
+                yield category_clean, self._prepare_item(item)
+
+    def _prepare_item(self, item: Dict) -> Dict:
+        book = item.get("book_title", "N/A")
+        chapter = item.get("chapter_title", "")
+        subsection = item.get("subsection_title", "")
+        content = item.get("content", "")
+
+        context_parts = [f"จากหนังสือ '{book}'"]
+        if chapter: context_parts.append(f"บทที่ '{chapter}'")
+        if subsection: context_parts.append(f"หัวข้อ '{subsection}'")
+        context_str = ", ".join(context_parts)
+
+        item['embedding_text'] = f"{context_str}: {content}"
+        item['chunk_hash'] = compute_chunk_hash(item['embedding_text'])
+        item['book_id'] = resolve_book_id(item)
+        return item
+
+    def build_from_folder(self, data_folder: str, base_index_folder: str,
+                          batch_size: Optional[int] = None, checkpoint_every: Optional[int] = None) -> List[str]:
+        """
+        สร้าง/ต่อเติม Index ของทุกหมวดหมู่แบบ Streaming:
+        - อ่านทีละไฟล์ทีละบรรทัด สะสม Chunk ใหม่ต่อหมวดหมู่ไม่เกิน batch_size แล้ว Embed + Append ทันที
+        - Chunk ที่ hash ตรงกับของเดิมจะไม่ถูก Embed ซ้ำ
+        - Commit แบบ Checkpoint เฉพาะหมวดที่เพิ่ง Append เมื่อแถวค้าง Commit ถึง checkpoint_every Batch
+          และไม่น้อยกว่าจำนวนแถวที่ Commit แล้วของหมวดนั้น (ช่วงห่างโตตาม Index: เขียนซ้ำรวมเป็น O(n) ไม่ใช่ O(n²))
+          ถ้า Crash ให้รันใหม่ได้เลย
+          Chunk ที่ Commit แล้วจะถูกข้าม และที่ Embed แล้วแต่ยังไม่ Commit จะได้จาก EmbeddingCache
+        - หนังสือที่ถูกนำเข้าใหม่ จะถูกลบ Chunk เก่าที่ไม่มีอยู่ในฉบับใหม่แล้วออกตอนจบ (เก็บไว้แค่ hash)
+        คืนค่ารายชื่อไฟล์ที่ประมวลผลครบแล้ว
+        """
+        batch_size = batch_size or settings.RAG_BUILD_BATCH_SIZE
+        checkpoint_every = checkpoint_every or settings.RAG_BUILD_CHECKPOINT_BATCHES
+
+        print(f"\n--- 📚 Streaming book data from '{data_folder}' (batch size {batch_size}) ---")
+        files_to_process = self.list_book_files(data_folder)
         if not files_to_process:
             print("  - 🟡 No new books to process.")
-            return {}
+            return []
 
-        for filename in files_to_process:
-            path = os.path.join(data_folder, filename)
-            with open(path, "r", encoding="utf-8") as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        item = json.loads(line)
-                        category_raw = item.get("category", "Uncategorized")
-                        
-                        category_clean = re.sub(r'\s+', ' ', category_raw).strip()
-                        
-                        item['_source_filename'] = filename
-                        item['_source_line_num'] = line_num
-                        if item.get("content"):
-                            categorized_data[category_clean].append(item)
-                    except json.JSONDecodeError: 
-                        print(f"  - ⚠️ Skipping malformed JSON on line {line_num} in '{filename}'")
-                        continue
-        
-        print(f"📦 Found {len(categorized_data)} categories to process from {len(files_to_process)} files.")
-        return categorized_data
-
-    def build_and_save_category_index(self, category: str, items: List[Dict], base_index_folder: str):
-        print(f"\n--- 🏭 Building index for category: '{category}' ---")
-        safe_category_name = self._sanitize_name(category)
-        category_folder = os.path.join(base_index_folder, safe_category_name)
-        os.makedirs(category_folder, exist_ok=True)
-        
-        texts_to_embed = []
-        mapping_data = []
-        processed_filenames: Set[str] = set()
-        
-        for item in items:
-            book = item.get("book_title", "N/A")
-            chapter = item.get("chapter_title", "")
-            subsection = item.get("subsection_title", "")
-            content = item.get("content", "")
-
-            context_parts = [f"จากหนังสือ '{book}'"]
-            if chapter: context_parts.append(f"บทที่ '{chapter}'")
-            if subsection: context_parts.append(f"หัวข้อ '{subsection}'")
-            context_str = ", ".join(context_parts)
-            
-            embedding_text = f"{context_str}: {content}"
-            texts_to_embed.append("query: " + embedding_text)
-            
-            item['embedding_text'] = embedding_text
-            mapping_data.append(item)
-            processed_filenames.add(item['_source_filename'])
-
-        if not texts_to_embed:
-            print(f"  - 🟡 No text to index for category '{category}'. Skipping.")
-            return set()
-
-        print(f"  - 🧠 Generating {len(texts_to_embed)} embeddings (using {str(self.model.device).upper()})...")
-        embeddings = self.model.encode(
-            texts_to_embed, 
-            convert_to_numpy=True, 
-            show_progress_bar=True
-        ).astype("float32")
-        
-        index = faiss.IndexFlatL2(embeddings.shape[1])
-        index.add(embeddings)
-        
-        faiss.write_index(index, os.path.join(category_folder, "faiss.index"))
-        
-        mapping_filepath = os.path.join(category_folder, "mapping.jsonl")
-        with open(mapping_filepath, "w", encoding="utf-8") as f:
-            for item in mapping_data:
-                f.write(json.dumps(item, ensure_ascii=False) + "\n")
-                
-        print(f"  - ✅ Index for '{category}' saved successfully.")
-        return processed_filenames
+        stores: Dict[str, CategoryIndexStore] = {}
+        buffers: Dict[str, List[Dict]] = defaultdict(list)
+        buffered_hashes: Dict[str, Set[str]] = defaultdict(set)
+        incoming_hashes_by_book: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        stats = {"batches": 0, "embedded": 0, "skipped": 0}
+
+        def open_store(category: str) -> CategoryIndexStore:
+            if category not in stores:
+                stores[category] = CategoryIndexStore(os.path.join(base_index_folder, self._sanitize_name(category)))
+                print(f"  - 📂 Category '{category}': {len(stores[category])} existing chunks.")
+            return stores[category]
+
+        def flush(category: str):
+            items = buffers.pop(category, [])
+            buffered_hashes.pop(category, None)
+            if not items:
+                return
+            embeddings = self.embedding_cache.encode(
+                self.model,
+                [item['embedding_text'] for item in items],
+                prefix="query: "
+            )
+            store = stores[category]
+            store.append(items, embeddings)
+            stats["batches"] += 1
+            stats["embedded"] += len(items)
+            # commit() เขียน Index + Mapping ของหมวดใหม่ทั้งก้อน จึงรอให้งานค้างโตตามขนาดที่ Commit แล้ว
+            if store.pending_count >= max(checkpoint_every * batch_size, store.existing_line_count):
+                store.commit(build_lexical=False)
+                if store.pending_count == 0:
+                    print(f"  - 💾 Checkpoint '{category}': {len(store)} chunks committed.")
+
+        for file_num, filename in enumerate(files_to_process, 1):
+            print(f"  - 📖 [{file_num}/{len(files_to_process)}] {filename}")
+            for category, item in self.iter_file_chunks(data_folder, filename):
+                store = open_store(category)
+                incoming_hashes_by_book[category][item['book_id']].add(item['chunk_hash'])
+                if store.has_chunk(item['chunk_hash']) or item['chunk_hash'] in buffered_hashes[category]:
+                    stats["skipped"] += 1
+                    continue
+                buffers[category].append(item)
+                buffered_hashes[category].add(item['chunk_hash'])
+                if len(buffers[category]) >= batch_size:
+                    flush(category)
+
+        for category in list(buffers):
+            flush(category)
+
+        print(f"\n--- 🏭 Finalizing {len(stores)} categories ({stats['embedded']} new chunks, {stats['skipped']} unchanged) ---")
+        for category, store in stores.items():
+            incoming = incoming_hashes_by_book[category]
+            removed = store.remove_rows(lambda h, b: b in incoming and h not in incoming[b])
+            if removed:
+                print(f"  - 🧹 Removed {removed} stale chunks from re-imported books in '{category}'.")
+            store.commit()
+            print(f"  - ✅ Index for '{category}' saved successfully ({len(store)} chunks).")
+
+        return files_to_process
+
+    @staticmethod
+    def delete_book(book_id: str, base_index_folder: str, category: Optional[str] = None) -> int:
+        """ลบหนังสือตาม book_id ออกจากทุกหมวดหมู่ (หรือเฉพาะหมวดที่ระบุ) โดยไม่ต้อง Embed ใหม่"""
+        if not os.path.exists(base_index_folder):
+            return 0
+        categories = [RAGBuilder._sanitize_name(category)] if category else sorted(os.listdir(base_index_folder))
+        total_removed = 0
+        for name in categories:
+            folder = os.path.join(base_index_folder, name)
+            if not os.path.isdir(folder):
+                continue
+            store = CategoryIndexStore(folder)
+            removed = store.delete_book(book_id)
+            if removed:
+                store.commit()
+                print(f"  - 🗑️  Removed {removed} chunks of '{book_id}' from '{name}'.")
+            total_removed += removed
+        return total_removed
 
 if __name__ == "__main__":
     DATA_FOLDER = "data/books"
     INDEX_FOLDER = "data/index"
     PROCESSED_FOLDER = os.path.join(DATA_FOLDER, "_processed")
+
+    parser = argparse.ArgumentParser(description="Build or update the book RAG indexes incrementally.")
+    parser.add_argument("--delete-book", metavar="BOOK_ID", help="Remove a book (by book_id / source file name) from the indexes.")
+    parser.add_argument("--category", help="Restrict --delete-book to a single category.")
+    args = parser.parse_args()
+
+    if args.delete_book:
+        print(f"\n--- 🗑️  Deleting book '{args.delete_book}' from RAG indexes ---")
+        removed = RAGBuilder.delete_book(args.delete_book, INDEX_FOLDER, args.category)
+        print(f"✅ Removed {removed} chunks in total.")
+        raise SystemExit(0)
+
     os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
     print("\n" + "="*60)
@@ -118,24 +365,19 @@ if __name__ == "__main__":
     print("="*60)
 
     builder = RAGBuilder()
-    categorized_books = builder.load_and_group_data_by_category(data_folder=DATA_FOLDER)
-    
-    all_processed_files_in_run: Set[str] = set()
-
-    for category, items in categorized_books.items():
-        processed_files_for_category = builder.build_and_save_category_index(
-            category, items, base_index_folder=INDEX_FOLDER
-        )
-        all_processed_files_in_run.update(processed_files_for_category)
+    all_processed_files_in_run = builder.build_from_folder(DATA_FOLDER, INDEX_FOLDER)
 
     if all_processed_files_in_run:
         print(f"\n--- 🚀 Moving {len(all_processed_files_in_run)} processed files ---")
-        for filename in sorted(list(all_processed_files_in_run)):
+        for filename in all_processed_files_in_run:
             source_path = os.path.join(DATA_FOLDER, filename)
             dest_path = os.path.join(PROCESSED_FOLDER, filename)
             if os.path.exists(source_path):
                 shutil.move(source_path, dest_path)
                 print(f"  - Moved '{filename}' to _processed folder.")
+
+    builder.embedding_cache.report()
+    builder.model.close()
         
     print("\n" + "="*60)
     print("✅ RAG build process finished successfully!")
@@ -3,23 +3,24 @@
 
 import os
 import json
-import faiss
-from sentence_transformers import SentenceTransformer
-import torch
 from typing import List, Dict
 from core.graph_manager import GraphManager
+from core.embedding_cache import EmbeddingCache
+from core.embedding_pipeline import EmbeddingPipeline
+from core.vector_index import build_index, write_index
 
 class KGIndexBuilder:
     def __init__(self, model_name="intfloat/multilingual-e5-large"):
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"⚙️  KG Index Builder is initializing on device: {device.upper()}")
-        self.model = SentenceTransformer(model_name, device=device)
+        print("⚙️  KG Index Builder is initializing...")
+        self.model = EmbeddingPipeline(model_name)
+        self.embedding_cache = EmbeddingCache(model_name, variant=self.model.cache_variant)
         print(f"✅ Embedding model '{model_name}' loaded successfully.")
         
         self.graph_manager = GraphManager()
 
     def close(self):
         self.graph_manager.close()
+        self.model.close()
 
     def fetch_all_concepts(self) -> List[Dict]:
         """
@@ -61,23 +62,23 @@ class KGIndexBuilder:
             label_str = labels[0] if labels else "ข้อมูล"
             
             embedding_text = f"{label_str}เรื่อง '{name}': {description}"
-            texts_to_embed.append("query: " + embedding_text)
+            texts_to_embed.append(embedding_text)
             
             map_item = item.copy()
             map_item['embedding_text'] = embedding_text
             mapping_data.append(map_item)
 
         print(f"  - 🧠 Generating {len(texts_to_embed)} embeddings (using {str(self.model.device).upper()})...")
-        embeddings = self.model.encode(
+        embeddings = self.embedding_cache.encode(
+            self.model,
             texts_to_embed, 
-            convert_to_numpy=True, 
+            prefix="query: ",
             show_progress_bar=True
-        ).astype("float32")
+        )
         
-        index = faiss.IndexFlatL2(embeddings.shape[1])
-        index.add(embeddings)
+        index, spec = build_index(embeddings)
         
-        faiss.write_index(index, os.path.join(index_folder, "graph_faiss.index"))
+        write_index(index, os.path.join(index_folder, "graph_faiss.index"), spec)
         
         mapping_filepath = os.path.join(index_folder, "graph_mapping.jsonl")
         with open(mapping_filepath, "w", encoding="utf-8") as f:
@@ -97,6 +98,7 @@ if __name__ == "__main__":
     if builder.graph_manager.driver:
         concepts_from_db = builder.fetch_all_concepts()
         builder.build_and_save_index(concepts_from_db, index_folder=INDEX_FOLDER)
+        builder.embedding_cache.report()
         builder.close()
     else:
         print("Could not proceed without a valid Neo4j connection.")
@@ -1,28 +1,22 @@
 # manage_news.py
-# (V3 - RAG Index Builder for News - Complete Code)
-# หน้าที่: ดึงข่าว, ขูดเนื้อหาเต็ม, และสร้าง FAISS Index + Mapping file
+# (V5 - RAG Index Builder for News - Async Ingestion, Time-Sharded)
+# หน้าที่: ดึงข่าวแบบ asyncio (core/news_ingestion.py), ขูดเนื้อหาเต็ม, และต่อท้าย FAISS Index + Mapping ของ Shard ช่วงเวลาปัจจุบัน (core/news_store.py)
 
-import feedparser
-import requests
-import faiss
-import json
-import os
-import time
-import torch
-import datetime
+import asyncio
+import numpy as np
 from tqdm import tqdm
-from newspaper import Article, Config, ArticleException
-from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Set
-from concurrent.futures import ThreadPoolExecutor, as_completed 
 from core.config import settings
-from urllib.parse import urlparse
+from core.embedding_cache import EmbeddingCache
+from core.embedding_pipeline import EmbeddingPipeline
+from core.near_duplicates import NearDuplicateIndex
+from core.news_ingestion import CrawlFrontier, NewsIngestor, sanitize_text
+from core.news_store import NewsStore
 import traceback
 
 # --- 1. การตั้งค่า ---
 NEWS_INDEX_DIR = "data/news_index"
-NEWS_FAISS_PATH = os.path.join(NEWS_INDEX_DIR, "news_faiss.index")
-NEWS_MAPPING_PATH = os.path.join(NEWS_INDEX_DIR, "news_mapping.json")
+NEWS_EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
 
 NEWS_API_URL = "https://newsapi.org/v2/top-headlines"
 RSS_FEEDS = {
@@ -57,213 +51,57 @@ RSS_FEEDS = {
     "Brand Buffet": "https://www.brandbuffet.in.th/feed/"
 }
 
-def fetch_from_newsapi() -> List[Dict]:
-    print("📰 Fetching news from NewsAPI.org...")
-    if not settings.NEWS_KEY:
-        print("  - ⚠️ NewsAPI key not found in .env file.")
-        return []
-    
-    params = {'country': 'us', 'pageSize': 20, 'apiKey': settings.NEWS_KEY}
-    try:
-        response = requests.get(NEWS_API_URL, params=params, timeout=15)
-        response.raise_for_status()
-        articles = response.json().get('articles', [])
-        print(f"  - Fetched {len(articles)} articles from NewsAPI.")
-        return [{
-            "published_at": a.get("publishedAt"),
-            "source_name": a.get("source", {}).get("name"),
-            "title": a.get("title"),
-            "description": a.get("description"),
-            "url": a.get("url")
-        } for a in articles]
-    except Exception as e:
-        print(f"  - ❌ NewsAPI Error: {e}")
-        return []
-
-def fetch_from_rss(url: str, source: str) -> List[Dict]:
-    """ดึงข่าวจากแหล่ง RSS Feed"""
-    print(f"📰 Fetching news from RSS: {source}...")
-    try:
-        feed = feedparser.parse(url)
-        print(f"  - Fetched {len(feed.entries)} entries from {source}.")
-        return [{
-            "published_at": entry.get("published", datetime.datetime.now().isoformat()),
-            "source_name": source,
-            "title": entry.get("title"),
-            "description": entry.get("summary"),
-            "url": entry.get("link")
-        } for entry in feed.entries]
-    except Exception as e:
-        print(f"  - ❌ RSS Error ({source}): {e}")
-        return []
-
-def scrape_article_content(url: str) -> str:
-    try:
-        config = Config()
-        config.browser_user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        config.request_timeout = 15
-
-        article = Article(url, config=config)
-        article.download()
-        article.parse()
-
-        return sanitize_text(article.text)     
-    except ArticleException:
-        # ดักจับ Error เฉพาะของ newspaper3k (เช่น 404 Not Found)
-        return ""
-    except Exception:
-        # ดักจับ Error ทั่วไปอื่นๆ
-        return ""
-    
-def sanitize_text(text: str) -> str:
-    if not text:
-        return ""
-    # ลบตัวอักษรแปลก ๆ เช่น U+2028 (LS) และ U+2029 (PS)
-    return text.replace("\u2028", " ").replace("\u2029", " ")
-
-def load_existing_urls(mapping_path: str) -> Set[str]:
-    """โหลด URL ของข่าวที่มีอยู่แล้วใน Index"""
-    if not os.path.exists(mapping_path):
-        return set()
-    
-    existing_urls = set()
-    with open(mapping_path, "r", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-            for item in data.values():
-                if url := item.get("url"):
-                    existing_urls.add(url)
-        except json.JSONDecodeError:
-            print("  - ⚠️ Could not parse existing mapping file. Starting fresh.")
-    
+def load_existing_urls(store: NewsStore) -> Set[str]:
+    """โหลด URL ของข่าวที่มีอยู่แล้วในทุก Shard"""
+    existing_urls = store.existing_urls()
     print(f"🔍 Found {len(existing_urls)} existing articles in the index.")
     return existing_urls
 
-def collect_and_scrape_articles(existing_urls: Set[str]) -> List[Dict]:
-    print("--- 📰 Starting News Collection (True Incremental Mode) ---")
-    
-    initial_articles = []
-    with ThreadPoolExecutor(max_workers=15) as executor:
-        futures = [executor.submit(fetch_from_newsapi)]
-        for name, url in RSS_FEEDS.items():
-            futures.append(executor.submit(fetch_from_rss, url, name))
-        
-        for future in as_completed(futures):
-            try:
-                initial_articles.extend(future.result())
-            except Exception as e:
-                print(f"  - ❌ A fetch task failed: {e}")
-
-    new_articles_to_process = [
-        article for article in initial_articles 
-        if article.get("url") and article.get("url") not in existing_urls
-    ]
-    
-    print(f"\n🔬 Found {len(new_articles_to_process)} new articles to scrape.")
-    if not new_articles_to_process:
-        return []
-
-    articles_by_domain = {}
-    for article in new_articles_to_process:
-        if url := article.get("url"):
-            try:
-                domain = urlparse(url).netloc.replace('www.', '')
-                if domain not in articles_by_domain:
-                    articles_by_domain[domain] = []
-                articles_by_domain[domain].append(article)
-            except Exception:
-                continue
-
-    full_articles = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_domain = {
-            executor.submit(scrape_article_content, articles[0].get("url")): domain
-            for domain, articles in articles_by_domain.items() if articles
-        }
-        
-        progress_bar = tqdm(total=len(new_articles_to_process), desc="Scraping New Articles")
+def collect_and_scrape_articles(existing_urls: Set[str], frontier: CrawlFrontier) -> List[Dict]:
+    print("--- 📰 Starting News Collection (Async, Resumable Frontier) ---")
+    ingestor = NewsIngestor(frontier, RSS_FEEDS, newsapi_url=NEWS_API_URL, newsapi_key=settings.NEWS_KEY)
+    return asyncio.run(ingestor.run(existing_urls))
 
-        while future_to_domain:
-            for future in as_completed(future_to_domain):
-                domain = future_to_domain.pop(future)
-                try:
-                    content = future.result()
-                    article_data = articles_by_domain[domain].pop(0)
-                    if content:
-                        article_data['full_content'] = content
-                        full_articles.append(article_data)
-                except Exception as e:
-                    print(f"  - ❌ Scrape failed for a URL from {domain}: {e}")
-                
-                progress_bar.update(1)
-
-                if articles_by_domain[domain]:
-                    next_article = articles_by_domain[domain][0]
-                    new_future = executor.submit(scrape_article_content, next_article.get("url"))
-                    future_to_domain[new_future] = domain
-                
-                time.sleep(0.2)
-        
-        progress_bar.close()
-
-    print(f"\n💾 Collected {len(full_articles)} articles with full content.")
-    return full_articles
-
-def build_news_index(articles: List[Dict], batch_size: int = 64):
+def build_news_index(articles: List[Dict], store: NewsStore, batch_size: int = 64):
     if not articles:
         print("🟡 No new articles to build index.")
         return
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = SentenceTransformer("intfloat/multilingual-e5-large", device=device)
-    if device == "cuda":
-        model.half()
-    
-    if os.path.exists(NEWS_FAISS_PATH):
-        print("  - Appending to existing index...")
-        index = faiss.read_index(NEWS_FAISS_PATH)
-        with open(NEWS_MAPPING_PATH, "r", encoding="utf-8") as f:
-            mapping = json.load(f)
-    else:
-        print("  - Creating new index...")
-        index = None
-        mapping = {}
+    model = EmbeddingPipeline(NEWS_EMBEDDING_MODEL, half=True)
+    embedding_cache = EmbeddingCache(NEWS_EMBEDDING_MODEL, variant=model.cache_variant)
 
     print(f"🧠 Generating embeddings for {len(articles)} new articles in batches of {batch_size}...")
     
-    for i in tqdm(range(0, len(articles), batch_size), desc="  - Encoding Batches"):
-        batch_articles = articles[i:i+batch_size]
+    # ส่งงานครั้งละหลาย Batch เพื่อให้ Worker ทุกตัวของ Pipeline มีงานทำพร้อมกัน
+    step = batch_size * model.workers
+    embeddings = []
+    for i in tqdm(range(0, len(articles), step), desc="  - Encoding Batches"):
+        batch_articles = articles[i:i+step]
         
         texts_to_embed = [
                             f"หัวข้อ: {sanitize_text(a.get('title', ''))}\nเนื้อหา: {sanitize_text(a.get('full_content', ''))}"
                             for a in batch_articles
                         ]
         
-        new_embeddings = model.encode(
-            ["passage: " + text for text in texts_to_embed], 
-            show_progress_bar=False,
-            convert_to_numpy=True
-        )
-        
-        if index is None:
-            index = faiss.IndexFlatL2(new_embeddings.shape[1])
-        
-        index.add(new_embeddings)
+        embeddings.append(embedding_cache.encode(
+            model,
+            texts_to_embed, 
+            prefix="passage: ",
+            show_progress_bar=False
+        ))
 
-        start_id = len(mapping)
         for j, article in enumerate(batch_articles):
             article['title'] = sanitize_text(article.get('title', ''))
             article['description'] = sanitize_text(article.get('description', ''))
             article['full_content'] = sanitize_text(article.get('full_content', ''))
             article['embedding_text'] = texts_to_embed[j]
-            mapping[str(start_id + j)] = article
 
-    os.makedirs(NEWS_INDEX_DIR, exist_ok=True)
-    faiss.write_index(index, NEWS_FAISS_PATH)
-    with open(NEWS_MAPPING_PATH, "w", encoding="utf-8") as f:
-        json.dump(mapping, f, ensure_ascii=False, indent=4)
+    # Ingest รอบนี้เขียนเฉพาะ Shard ล่าสุด Shard เก่าไม่ถูกแตะต้อง
+    shard = store.append(articles, np.vstack(embeddings))
     
-    print(f"✅ News RAG Index updated successfully! Total articles: {index.ntotal}")
+    embedding_cache.report()
+    model.close()
+    print(f"✅ News RAG Index updated successfully! Added {len(articles)} articles to shard '{shard}'.")
 
 if __name__ == "__main__":
     try:
@@ -271,9 +109,21 @@ if __name__ == "__main__":
         print("--- 📰 Starting News Intelligence Gathering & Indexing (V5) 📰 ---")
         print("="*60)
         
-        existing_urls = load_existing_urls(NEWS_MAPPING_PATH)
-        new_articles = collect_and_scrape_articles(existing_urls)
-        build_news_index(new_articles)
+        store = NewsStore(NEWS_INDEX_DIR)
+        store.migrate_legacy()
+        store.drop_expired()
+        frontier = CrawlFrontier()
+        existing_urls = load_existing_urls(store)
+        new_articles = collect_and_scrape_articles(existing_urls, frontier)
+        # ตัดข่าวซ้ำเชิงเนื้อหา (ข่าวเดียวกันจากหลายฟีด) ก่อน Embed
+        duplicate_index = NearDuplicateIndex()
+        unique_articles, duplicate_articles = duplicate_index.filter_articles(new_articles)
+        build_news_index(unique_articles, store)
+        # เขียน Shard สำเร็จแล้วจึงปิดสถานะใน Frontier (ถ้า Crash ก่อนหน้านี้ รอบถัดไปจะ Index บทความชุดเดิมต่อ)
+        frontier.mark_indexed(a["url"] for a in unique_articles)
+        frontier.mark_duplicates(a["url"] for a in duplicate_articles)
+        frontier.prune(settings.NEWS_RETENTION_DAYS)
+        duplicate_index.prune(settings.NEWS_RETENTION_DAYS)
 
     except KeyboardInterrupt:
         print("\n\n🛑 Process interrupted by user (Ctrl+C).")
@@ -0,0 +1,55 @@
+# tests/test_key_cooldowns.py
+# Cooldown ที่ knowledge_extractor_gemini.py บันทึกลง Registry ที่แชร์ข้าม Process (core/key_cooldowns.py)
+# 429 รายนาทีต้องได้ Cooldown สั้น ไม่ใช่ quota 24 ชม. ที่ล็อกคีย์ของเซิร์ฟเวอร์ทั้งวัน
+
+import json
+import time
+
+import google.generativeai as genai
+import pytest
+from google.api_core.exceptions import ResourceExhausted
+
+import core.key_cooldowns as key_cooldowns
+from core.api_key_manager import ApiKeyManager
+from core.config import settings
+from core.key_cooldowns import CooldownRegistry
+from knowledge_extractor_gemini import KnowledgeGraphExtractorGemini
+
+CHUNK = json.dumps({"title": "Fixture", "content": "Fixture content"})
+
+
+@pytest.fixture
+def registry_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "key_cooldowns.db")
+    monkeypatch.setattr(settings, "KEY_COOLDOWN_SHARED", True)
+    monkeypatch.setattr(settings, "KEY_COOLDOWN_DB", path)
+    monkeypatch.setattr(key_cooldowns, "_shared_registry", None)
+    return path
+
+
+def extract_with_error(monkeypatch, error: Exception):
+    class FailingModel:
+        def __init__(self, model_name):
+            pass
+
+        def generate_content(self, *args, **kwargs):
+            raise error
+
+    monkeypatch.setattr(genai, "GenerativeModel", FailingModel)
+    extractor = KnowledgeGraphExtractorGemini(ApiKeyManager(["fixture-google-key"], silent=True), "gemini-fixture", None)
+    with pytest.raises(ResourceExhausted):
+        extractor._process_single_chunk(CHUNK, max_retries=1)
+
+
+def test_per_minute_resource_exhausted_is_a_short_shared_cooldown(registry_path, monkeypatch):
+    extract_with_error(monkeypatch, ResourceExhausted("Resource has been exhausted (e.g. check quota)."))
+    [(provider, _, until, reason)] = CooldownRegistry(registry_path).entries()
+    assert (provider, reason) == ("google", "rate_limit")
+    assert until - time.time() == pytest.approx(65, abs=5)
+
+
+def test_daily_resource_exhausted_is_a_quota_cooldown(registry_path, monkeypatch):
+    extract_with_error(monkeypatch, ResourceExhausted("Quota exceeded for metric: generate_requests_per_day_per_project"))
+    [(_, _, until, reason)] = CooldownRegistry(registry_path).entries()
+    assert reason == "quota"
+    assert until - time.time() > 23 * 60 * 60
@@ -0,0 +1,179 @@
+# tests/test_news_ingestion.py
+# รัน NewsIngestor กับ Fixture Server (aiohttp) บน localhost: ไม่มีการยิง Request ออกนอกเครื่อง
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from core.news_ingestion import CrawlFrontier, DomainThrottle, NewsIngestor
+
+ETAG = '"feed-v1"'
+ARTICLE_HTML = ("<html><head><title>{title}</title></head><body><article><h1>{title}</h1>"
+                + "".join(f"<p>Paragraph {i} of a fixture news article with enough words to be extracted.</p>" for i in range(6))
+                + "</article></body></html>")
+
+
+class FixtureSite:
+    """ฟีด RSS หนึ่งฟีดพร้อมบทความ บันทึกทุก Request ที่ได้รับไว้ตรวจสอบ"""
+    def __init__(self, article_count: int = 2):
+        self.article_count = article_count
+        self.feed_statuses = []  # สถานะที่ฟีดตอบก่อนตอบปกติ เช่น [503, (429, "0.3")]
+        self.feed_hits = []      # (เวลา, If-None-Match)
+        self.article_hits = []   # (เวลา, path)
+        self.app = web.Application()
+        self.app.router.add_get("/feed.xml", self.feed)
+        self.app.router.add_get("/articles/{n}", self.article)
+
+    async def feed(self, request: web.Request) -> web.Response:
+        self.feed_hits.append((time.monotonic(), request.headers.get("If-None-Match")))
+        if self.feed_statuses:
+            status = self.feed_statuses.pop(0)
+            status, retry_after = status if isinstance(status, tuple) else (status, None)
+            return web.Response(status=status, headers={"Retry-After": retry_after} if retry_after else {})
+        if request.headers.get("If-None-Match") == ETAG:
+            return web.Response(status=304)
+        base = str(request.url.origin())
+        items = "".join(f"<item><title>Story {n}</title><link>{base}/articles/{n}</link>"
+                        f"<description>Summary {n}</description></item>" for n in range(self.article_count))
+        body = f'<?xml version="1.0"?><rss version="2.0"><channel><title>Fixture</title>{items}</channel></rss>'
+        return web.Response(text=body, content_type="application/rss+xml", headers={"ETag": ETAG})
+
+    async def article(self, request: web.Request) -> web.Response:
+        self.article_hits.append((time.monotonic(), request.path))
+        return web.Response(text=ARTICLE_HTML.format(title=f"Story {request.match_info['n']}"), content_type="text/html")
+
+
+def make_ingestor(frontier: CrawlFrontier, feeds: dict, retries: int = 2,
+                  concurrency: int = 2, min_interval_ms: float = 0) -> NewsIngestor:
+    return NewsIngestor(frontier, feeds, throttle=DomainThrottle(concurrency, min_interval_ms),
+                        retries=retries, timeout=10)
+
+
+def serve(*sites: FixtureSite):
+    """เปิด Fixture Server ของแต่ละ Site แล้วเรียก scenario(*feed_urls) ภายใน Event loop เดียว"""
+    def runner(scenario):
+        async def main():
+            servers = [TestServer(site.app) for site in sites]
+            for server in servers:
+                await server.start_server()
+            try:
+                return await scenario(*[str(server.make_url("/feed.xml")) for server in servers])
+            finally:
+                for server in servers:
+                    await server.close()
+        return asyncio.run(main())
+    return runner
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    return CrawlFrontier(str(tmp_path / "frontier.db"))
+
+
+def test_conditional_get_skips_unchanged_feed(frontier):
+    site = FixtureSite(article_count=2)
+
+    async def scenario(feed_url):
+        first = await make_ingestor(frontier, {"Fixture": feed_url}).run(set())
+        frontier.mark_indexed(a["url"] for a in first)
+        second = await make_ingestor(frontier, {"Fixture": feed_url}).run(set())
+        return first, second, feed_url
+
+    first, second, feed_url = serve(site)(scenario)
+    assert sorted(a["title"] for a in first) == ["Story 0", "Story 1"]
+    assert all(a["full_content"] for a in first)
+    assert frontier.feed_validators(feed_url)[0] == ETAG
+    # รอบที่สองส่ง If-None-Match แล้วได้ 304: ไม่มีบทความใหม่และไม่ดาวน์โหลดบทความซ้ำ
+    assert [etag for _, etag in site.feed_hits] == [None, ETAG]
+    assert second == []
+    assert len(site.article_hits) == 2
+
+
+def test_retries_server_errors_then_succeeds(frontier):
+    site = FixtureSite(article_count=1)
+    site.feed_statuses = [503, 500]
+
+    async def scenario(feed_url):
+        return await make_ingestor(frontier, {"Fixture": feed_url}, retries=2).run(set())
+
+    articles = serve(site)(scenario)
+    assert len(site.feed_hits) == 3
+    assert [a["title"] for a in articles] == ["Story 0"]
+
+
+def test_gives_up_after_retries_without_saving_validators(frontier):
+    site = FixtureSite(article_count=1)
+    site.feed_statuses = [503, 503, 503]
+
+    async def scenario(feed_url):
+        return await make_ingestor(frontier, {"Fixture": feed_url}, retries=1).run(set()), feed_url
+
+    articles, feed_url = serve(site)(scenario)
+    assert len(site.feed_hits) == 2
+    assert articles == []
+    assert frontier.feed_validators(feed_url) == (None, None)
+
+
+def test_respects_retry_after_on_429(frontier):
+    site = FixtureSite(article_count=1)
+    site.feed_statuses = [(429, "0.4")]
+
+    async def scenario(feed_url):
+        return await make_ingestor(frontier, {"Fixture": feed_url}, retries=1).run(set())
+
+    articles = serve(site)(scenario)
+    assert len(site.feed_hits) == 2
+    assert site.feed_hits[1][0] - site.feed_hits[0][0] >= 0.4
+    assert len(articles) == 1
+
+
+def test_throttles_requests_per_host_only(frontier):
+    busy, other = FixtureSite(article_count=4), FixtureSite(article_count=0)
+
+    async def scenario(busy_feed, other_feed):
+        ingestor = make_ingestor(frontier, {"Busy": busy_feed, "Other": other_feed},
+                                 concurrency=1, min_interval_ms=250)
+        return await ingestor.run(set())
+
+    articles = serve(busy, other)(scenario)
+    assert len(articles) == 4
+    # Host เดียวกัน (ฟีด + 4 บทความ) เริ่ม Request ห่างกันอย่างน้อย min_interval
+    starts = sorted([t for t, _ in busy.feed_hits] + [t for t, _ in busy.article_hits])
+    assert all(later - earlier >= 0.2 for earlier, later in zip(starts, starts[1:]))
+    # อีก Host หนึ่งไม่ต้องรอคิวของ Host ที่ยุ่ง
+    assert abs(other.feed_hits[0][0] - busy.feed_hits[0][0]) < 0.2
+
+
+def test_frontier_resumes_interrupted_run(frontier, monkeypatch):
+    site = FixtureSite(article_count=3)
+
+    class Interrupted(Exception):
+        pass
+
+    add_discovered = frontier.add_discovered
+
+    def crash_after_discovery(*args, **kwargs):
+        add_discovered(*args, **kwargs)
+        raise Interrupted()
+
+    async def scenario(feed_url):
+        monkeypatch.setattr(frontier, "add_discovered", crash_after_discovery)
+        with pytest.raises(Interrupted):
+            await make_ingestor(frontier, {"Fixture": feed_url}).run(set())
+        state_after_crash = (frontier.feed_validators(feed_url), len(frontier.pending()))
+        monkeypatch.setattr(frontier, "add_discovered", add_discovered)
+        resumed = await make_ingestor(frontier, {"Fixture": feed_url}).run(set())
+        return state_after_crash, resumed, feed_url
+
+    (validators, pending), resumed, feed_url = serve(site)(scenario)
+    # Crash หลังบันทึกบทความลง Frontier แต่ก่อนบันทึก ETag: รอบถัดไปต้องดึงฟีดเต็มได้และไม่มีบทความหาย
+    assert validators == (None, None)
+    assert pending == 3
+    assert [etag for _, etag in site.feed_hits] == [None, None]
+    assert sorted(a["title"] for a in resumed) == ["Story 0", "Story 1", "Story 2"]
+    assert len(site.article_hits) == 3
+    assert frontier.pending() == []
+    assert frontier.feed_validators(feed_url)[0] == ETAG
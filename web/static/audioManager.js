@@ -1,11 +1,14 @@
 // web/static/audioManager.js
-// (V1.1 - Removed Fallback to Browser's Speech Synthesis)
+// (V1.3 - Push-based Audio: segments arrive as WebSocket events, long-poll fallback instead of interval polling)
 
 export function createAudioManager() {
     const state = {
         isSoundEnabled: true,
         audio: new Audio(),
-        pollingIntervalId: null,
+        currentTaskId: null, // งานเสียงของคำตอบล่าสุด: Event ของงานอื่นถูกข้าม
+        queue: [],          // URL ของท่อนเสียงที่รอเล่น (ตามลำดับ)
+        enqueuedCount: 0,   // จำนวนท่อนของงานปัจจุบันที่ใส่คิวไปแล้ว
+        isPlaying: false,
     };
 
     const toggleSoundBtn = document.getElementById('toggle-sound-btn');
@@ -18,67 +21,103 @@ export function createAudioManager() {
                 stopAllAudio();
             }
         });
+        // เล่นท่อนถัดไปต่อทันทีเมื่อท่อนปัจจุบันจบ
+        state.audio.addEventListener('ended', playNext);
+        state.audio.addEventListener('error', playNext);
     }
 
     function stopAllAudio() {
-        if (state.pollingIntervalId) {
-            clearInterval(state.pollingIntervalId);
-            state.pollingIntervalId = null;
-        }
+        state.currentTaskId = null;
+        state.queue = [];
+        state.enqueuedCount = 0;
+        state.isPlaying = false;
         state.audio.pause();
         state.audio.currentTime = 0;
     }
 
-    function playAudio(voiceUrl) {
-        if (!state.isSoundEnabled || !voiceUrl) return;
-        
-        stopAllAudio();
-
-        state.audio.src = voiceUrl;
+    function playNext() {
+        const nextUrl = state.queue.shift();
+        if (!state.isSoundEnabled || !nextUrl) {
+            state.isPlaying = false;
+            return;
+        }
+        state.isPlaying = true;
+        state.audio.src = nextUrl;
         state.audio.playbackRate = 1.15;
-        state.audio.play().catch(e => console.error("Audio playback error:", e));
+        state.audio.play().catch(e => {
+            console.error("Audio playback error:", e);
+            state.isPlaying = false;
+        });
+    }
+
+    // รับเฉพาะท่อนถัดไปตามลำดับ (ท่อนที่ใส่คิวไปแล้ว เช่นจากการส่ง Event ย้อนหลัง ถูกข้าม)
+    function enqueueSegment(index, url) {
+        if (index !== state.enqueuedCount || !url) return;
+        state.enqueuedCount++;
+        state.queue.push(url);
+        if (!state.isPlaying) playNext();
+    }
+
+    function enqueueSegments(urls) {
+        urls.forEach((url, index) => enqueueSegment(index, url));
+    }
+
+    function expectTask(taskId) {
+        stopAllAudio();
+        if (state.isSoundEnabled) state.currentTaskId = taskId;
     }
 
-    function pollForAudio(taskId, maxAttempts = 20, interval = 1500) {
-        if (state.pollingIntervalId) {
-            clearInterval(state.pollingIntervalId);
+    // Event จากเซิร์ฟเวอร์ (WebSocket): คืน true ถ้าเป็น Event ของเสียง
+    function handleServerEvent(message) {
+        if (!['audio_segment', 'audio_ready', 'audio_failed'].includes(message.type)) return false;
+        const payload = message.payload || {};
+        if (!state.currentTaskId || payload.task_id !== state.currentTaskId) return true;
+
+        if (message.type === 'audio_segment') {
+            enqueueSegment(payload.index, payload.url);
+        } else if (message.type === 'audio_ready') {
+            enqueueSegments(payload.segments?.length ? payload.segments : [payload.url]);
+            state.currentTaskId = null;
+        } else {
+            console.error(`Audio generation failed for task: ${payload.task_id}`);
+            state.currentTaskId = null;
         }
+        return true;
+    }
 
-        let attempts = 0;
-        state.pollingIntervalId = setInterval(async () => {
+    // สำหรับคำตอบที่ไม่ได้มาทาง WebSocket (/ask): Long-poll รอท่อนใหม่ทีละครั้ง ไม่ต้อง Poll ตามรอบเวลา
+    async function followTask(taskId, waitSeconds = 20) {
+        expectTask(taskId);
+        while (state.currentTaskId === taskId) {
             try {
-                attempts++;
-                const response = await fetch(`/audio_status/${taskId}`);
-                
-                if (response.status === 200) {
-                    const data = await response.json();
-                    if (data.status === 'done') {
-                        clearInterval(state.pollingIntervalId);
-                        state.pollingIntervalId = null;
-                        playAudio(data.url);
-                    } else if (data.status === 'failed') {
-                        clearInterval(state.pollingIntervalId);
-                        state.pollingIntervalId = null;
-                        console.error(`Audio generation failed for task: ${taskId}`);
-                    }
+                const response = await fetch(`/audio_status/${taskId}?since=${state.enqueuedCount}&wait=${waitSeconds}`);
+                if (response.status !== 200) {
+                    console.error(`Audio task not available: ${taskId}`);
+                    break;
                 }
-
-                if (attempts >= maxAttempts) {
-                    clearInterval(state.pollingIntervalId);
-                    state.pollingIntervalId = null;
-                    console.error(`Polling for audio timed out for task: ${taskId}`);
+                const data = await response.json();
+                if (state.currentTaskId !== taskId) break;
+                enqueueSegments(data.segments || []);
+                if (data.status === 'done') {
+                    if (!data.segments?.length) enqueueSegments([data.url]);
+                    break;
+                } else if (data.status === 'failed') {
+                    console.error(`Audio generation failed for task: ${taskId}`);
+                    break;
                 }
             } catch (error) {
-                clearInterval(state.pollingIntervalId);
-                state.pollingIntervalId = null;
-                console.error('Error polling for audio:', error);
+                console.error('Error waiting for audio:', error);
+                break;
             }
-        }, interval);
+        }
+        if (state.currentTaskId === taskId) state.currentTaskId = null;
     }
 
     setupEventListeners();
 
     return {
-        startPolling: pollForAudio,
+        expectTask,
+        handleServerEvent,
+        followTask,
     };
-}
\ No newline at end of file
+}
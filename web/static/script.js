@@ -1,5 +1,5 @@
 // web/static/script.js
-// (V7.5 - Final Audited & Corrected Version)
+// (V7.6 - Push-based Audio Events over WebSocket)
 
 import { createAudioManager } from './audioManager.js';
 import { createThoughtProcessManager } from './thoughtProcessManager.js';
@@ -146,13 +146,14 @@ document.addEventListener('DOMContentLoaded', () => {
             this.socket.onopen = () => { console.log("✅ WebSocket connection established."); this.setThinkingState(false); };
             this.socket.onmessage = (event) => {
                 const response = JSON.parse(event.data);
+                if (audioManager.handleServerEvent(response)) return;
                 if (response.type === 'progress') {
                     thoughtProcessManager.addStep(response.payload);
                 } else if (response.type === 'final_response') {
                     const data = response.payload;
                     const messageData = { text: data.answer || 'ขออภัยค่ะ มีการตอบกลับที่ผิดพลาด', image: data.image || null };
                     ChatLog.replaceThinkingIndicator(messageData);
-                    if (data.voice_task_id) audioManager.startPolling(data.voice_task_id);
+                    if (data.voice_task_id) audioManager.expectTask(data.voice_task_id);
                     this.setThinkingState(false);
                 } else if (response.type === 'error') {
                     ChatLog.replaceThinkingIndicator({ text: `ขออภัยค่ะ: ${response.payload.detail}` });
@@ -17,6 +17,7 @@ export function createThoughtProcessManager() {
         ['PROCESSING', { icon: '⚙️', text: 'ประมวลผล' }],
         ['DEEP_ANALYSIS', { icon: '🧠', text: 'วิเคราะห์เชิงลึก' }],
         ['FORMATTING', { icon: '✍️', text: 'เรียบเรียงคำตอบ' }],
+        ['EXECUTING', { icon: '🧪', text: 'กำลังรันโค้ด' }],
     ]);
 
     const agentMap = new Map([
@@ -71,8 +72,10 @@ export function createThoughtProcessManager() {
                 <span class="tp-step-icon">${statusInfo.icon}</span>
                 <span class="tp-step-title">${statusInfo.text}: ${stepData.agent || ''}</span>
             </div>
-            <div class="tp-step-detail">${stepData.detail}</div>
+            <div class="tp-step-detail"></div>
         `;
+        // detail อาจเป็น Output จากโค้ดที่ผู้ใช้/LLM เขียน: ใส่เป็นข้อความล้วน ไม่ตีความเป็น HTML
+        stepDiv.querySelector('.tp-step-detail').textContent = stepData.detail ?? '';
         elements.tpContent.appendChild(stepDiv);
         elements.tpContent.scrollTop = elements.tpContent.scrollHeight;
     }